@@ -0,0 +1,34 @@
+"""chat message token count
+
+Revision ID: 3d7b2c5e8f41
+Revises: 8c1f4e2a9b70
+Create Date: 2026-10-17 10:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3d7b2c5e8f41'
+down_revision: Union[str, Sequence[str], None] = '8c1f4e2a9b70'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_messages', sa.Column('token_count', sa.Integer(), server_default='0', nullable=False))
+    # Backfill with the default estimator (CharRatioEstimator: chars / 4, at least 1).
+    # Portable SQL (no GREATEST) so the SQLite dev database can run it too.
+    op.execute(
+        "UPDATE chat_messages SET token_count = "
+        "CASE WHEN length(content) / 4 > 1 THEN length(content) / 4 ELSE 1 END"
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_messages', 'token_count')
@@ -0,0 +1,146 @@
+"""partition chat_messages and llm_usage by month; session archive
+
+Revision ID: 7f3a5d1c9e26
+Revises: e2a7c9f4b815
+Create Date: 2026-10-17 14:00:00.000000
+
+"""
+from datetime import datetime
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3a5d1c9e26'
+down_revision: Union[str, Sequence[str], None] = 'e2a7c9f4b815'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Partitions created ahead of now; the app keeps extending this at startup.
+MONTHS_AHEAD = 3
+
+
+def _add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+
+def _message_columns():
+    return [
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column(
+            'session_id', sa.String(length=36),
+            sa.ForeignKey('chat_sessions.id', name='chat_messages_session_id_fkey'), nullable=False,
+        ),
+        sa.Column('role', sa.String(length=16), nullable=False),
+        sa.Column('content', sa.Text(), nullable=False),
+        sa.Column('token_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    ]
+
+
+def _usage_columns():
+    return [
+        sa.Column('id', sa.String(length=36), nullable=False),
+        sa.Column(
+            'session_id', sa.String(length=36),
+            sa.ForeignKey('chat_sessions.id', name='llm_usage_session_id_fkey'), nullable=False,
+        ),
+        sa.Column('message_id', sa.String(length=36), nullable=False),
+        sa.Column('provider', sa.String(length=32), nullable=False),
+        sa.Column('model', sa.String(length=64), nullable=False),
+        sa.Column('prompt_tokens', sa.Integer(), nullable=False),
+        sa.Column('completion_tokens', sa.Integer(), nullable=False),
+        sa.Column('total_tokens', sa.Integer(), nullable=False),
+        sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=False),
+    ]
+
+
+TABLES = {
+    # table: (columns, indexes)
+    'chat_messages': (_message_columns, {'ix_chat_messages_session_id_created_at': ['session_id', 'created_at', 'id']}),
+    'llm_usage': (_usage_columns, {'ix_llm_usage_session_id': ['session_id'], 'ix_llm_usage_message_id': ['message_id']}),
+}
+
+
+def _swap(table: str, partitioned: bool) -> None:
+    """Rebuild `table` (partitioned or plain), copying all rows across."""
+    columns, indexes = TABLES[table]
+    old = f'{table}_old'
+    op.rename_table(table, old)
+    # Index-backed names are schema-wide; move them out of the way. The old
+    # FK goes too, so the new table's FK keeps its plain name (no _fkey1).
+    op.execute(f'ALTER INDEX IF EXISTS {table}_pkey RENAME TO {old}_pkey')
+    op.execute(f'ALTER TABLE {old} DROP CONSTRAINT IF EXISTS {table}_session_id_fkey')
+    for name in indexes:
+        op.execute(f'ALTER INDEX IF EXISTS {name} RENAME TO {name}_old')
+
+    if partitioned:
+        op.create_table(
+            table,
+            *columns(),
+            sa.PrimaryKeyConstraint('id', 'created_at', name=f'{table}_pkey'),
+            postgresql_partition_by='RANGE (created_at)',
+        )
+        first = None
+        if not context.is_offline_mode():
+            first = op.get_bind().execute(sa.text(f'SELECT min(created_at) FROM {old}')).scalar()
+        first = first or datetime.utcnow()
+        month = first.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        last = _add_months(datetime.utcnow().replace(day=1, hour=0, minute=0, second=0, microsecond=0), MONTHS_AHEAD)
+        while month <= last:
+            op.execute(
+                f"CREATE TABLE {table}_y{month:%Y}m{month:%m} PARTITION OF {table} "
+                f"FOR VALUES FROM ('{month:%Y-%m-%d}') TO ('{_add_months(month, 1):%Y-%m-%d}')"
+            )
+            month = _add_months(month, 1)
+        # Catches rows for months without a partition (e.g. restored archives).
+        op.execute(f'CREATE TABLE {table}_default PARTITION OF {table} DEFAULT')
+    else:
+        op.create_table(table, *columns(), sa.PrimaryKeyConstraint('id', name=f'{table}_pkey'))
+
+    for name, cols in indexes.items():
+        op.create_index(name, table, cols, unique=False)
+
+    names = ', '.join(c.name for c in columns())
+    op.execute(f'INSERT INTO {table} ({names}) SELECT {names} FROM {old}')
+    op.drop_table(old)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('archived_at', sa.DateTime(), nullable=True))
+    op.create_table(
+        'chat_session_archives',
+        sa.Column('session_id', sa.String(length=36), nullable=False),
+        sa.Column('message_count', sa.Integer(), nullable=False),
+        sa.Column('last_message_at', sa.DateTime(), nullable=False),
+        sa.Column('payload', sa.LargeBinary(), nullable=False),
+        sa.Column('archived_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['session_id'], ['chat_sessions.id'], name='chat_session_archives_session_id_fkey'),
+        sa.PrimaryKeyConstraint('session_id'),
+    )
+
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # A partitioned chat_messages cannot be referenced by id alone.
+    op.execute('ALTER TABLE llm_usage DROP CONSTRAINT IF EXISTS llm_usage_message_id_fkey')
+    _swap('chat_messages', partitioned=True)
+    _swap('llm_usage', partitioned=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if not context.is_offline_mode() and op.get_bind().execute(sa.text('SELECT count(*) FROM chat_session_archives')).scalar():
+        raise RuntimeError('chat_session_archives is not empty; rehydrate archived sessions before downgrading')
+
+    if op.get_bind().dialect.name == 'postgresql':
+        _swap('llm_usage', partitioned=False)
+        _swap('chat_messages', partitioned=False)
+        op.create_foreign_key('llm_usage_message_id_fkey', 'llm_usage', 'chat_messages', ['message_id'], ['id'])
+
+    op.drop_table('chat_session_archives')
+    op.drop_column('chat_sessions', 'archived_at')
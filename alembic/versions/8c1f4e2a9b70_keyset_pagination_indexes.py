@@ -0,0 +1,36 @@
+"""keyset pagination indexes
+
+Revision ID: 8c1f4e2a9b70
+Revises: 31a45dc5c3ed
+Create Date: 2026-10-17 09:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c1f4e2a9b70'
+down_revision: Union[str, Sequence[str], None] = '31a45dc5c3ed'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # Composite indexes turn history / session-list pages into range scans.
+    # They lead with the old single-column keys, so those indexes are dropped.
+    op.create_index('ix_chat_messages_session_id_created_at', 'chat_messages', ['session_id', 'created_at', 'id'], unique=False)
+    op.drop_index(op.f('ix_chat_messages_session_id'), table_name='chat_messages')
+    op.create_index('ix_chat_sessions_user_id_created_at', 'chat_sessions', ['user_id', 'created_at', 'id'], unique=False)
+    op.drop_index(op.f('ix_chat_sessions_user_id'), table_name='chat_sessions')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.create_index(op.f('ix_chat_sessions_user_id'), 'chat_sessions', ['user_id'], unique=False)
+    op.drop_index('ix_chat_sessions_user_id_created_at', table_name='chat_sessions')
+    op.create_index(op.f('ix_chat_messages_session_id'), 'chat_messages', ['session_id'], unique=False)
+    op.drop_index('ix_chat_messages_session_id_created_at', table_name='chat_messages')
@@ -0,0 +1,51 @@
+"""chat message full-text search vector
+
+Revision ID: 9a4f6b2d8c13
+Revises: c5d8e1f2a347
+Create Date: 2026-10-17 16:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9a4f6b2d8c13'
+down_revision: Union[str, Sequence[str], None] = 'c5d8e1f2a347'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    # Added on the partitioned parent, so every monthly partition (and future
+    # ones created by ensure_partitions) gets the column and the index.
+    op.add_column(
+        'chat_messages',
+        sa.Column(
+            'search_vector',
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('simple'::regconfig, content)", persisted=True),
+            nullable=True,
+        ),
+    )
+    op.create_index(
+        'ix_chat_messages_search_vector',
+        'chat_messages',
+        ['search_vector'],
+        unique=False,
+        postgresql_using='gin',
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    op.drop_index('ix_chat_messages_search_vector', table_name='chat_messages')
+    op.drop_column('chat_messages', 'search_vector')
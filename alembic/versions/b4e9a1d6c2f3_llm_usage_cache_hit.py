@@ -0,0 +1,28 @@
+"""llm usage cache hit flag
+
+Revision ID: b4e9a1d6c2f3
+Revises: 3d7b2c5e8f41
+Create Date: 2026-10-17 11:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'b4e9a1d6c2f3'
+down_revision: Union[str, Sequence[str], None] = '3d7b2c5e8f41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('llm_usage', sa.Column('cache_hit', sa.Boolean(), server_default=sa.false(), nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('llm_usage', 'cache_hit')
@@ -0,0 +1,34 @@
+"""chat session rolling summary
+
+Revision ID: c5d8e1f2a347
+Revises: 7f3a5d1c9e26
+Create Date: 2026-10-17 15:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'c5d8e1f2a347'
+down_revision: Union[str, Sequence[str], None] = '7f3a5d1c9e26'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column('chat_sessions', sa.Column('summary', sa.Text(), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summary_message_id', sa.String(length=36), nullable=True))
+    op.add_column('chat_sessions', sa.Column('summary_tokens', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('chat_sessions', sa.Column('summary_updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column('chat_sessions', 'summary_updated_at')
+    op.drop_column('chat_sessions', 'summary_tokens')
+    op.drop_column('chat_sessions', 'summary_message_id')
+    op.drop_column('chat_sessions', 'summary')
@@ -0,0 +1,115 @@
+"""native uuid keys; covering usage index
+
+Revision ID: d8b3f7a1e264
+Revises: 9a4f6b2d8c13
+Create Date: 2026-10-17 17:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import context, op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8b3f7a1e264'
+down_revision: Union[str, Sequence[str], None] = '9a4f6b2d8c13'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# Key columns stored as varchar(36) uuid text. usage_rollups keeps text: its
+# session_id also holds the '*' all-sessions total.
+UUID_COLUMNS = {
+    'users': ['id'],
+    'chat_sessions': ['id', 'user_id', 'summary_message_id'],
+    'chat_messages': ['id', 'session_id'],
+    'llm_usage': ['id', 'session_id', 'message_id'],
+    'chat_session_archives': ['session_id'],
+}
+
+# (name, table, column, referred table); dropped while both sides change type and
+# recreated under these names. Existing FKs are found by column, not by name:
+# databases partitioned before 7f3a5d1c9e26 named its FKs may have *_fkey1.
+FOREIGN_KEYS = [
+    ('chat_sessions_user_id_fkey', 'chat_sessions', 'user_id', 'users'),
+    ('chat_messages_session_id_fkey', 'chat_messages', 'session_id', 'chat_sessions'),
+    ('llm_usage_session_id_fkey', 'llm_usage', 'session_id', 'chat_sessions'),
+    ('chat_session_archives_session_id_fkey', 'chat_session_archives', 'session_id', 'chat_sessions'),
+]
+
+UUID_PATTERN = '^[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12}$'
+
+USAGE_INCLUDE = ['message_id', 'provider', 'model', 'prompt_tokens', 'completion_tokens', 'total_tokens', 'cache_hit']
+
+
+def _check_values() -> None:
+    """Refuse to start if any key is not uuid text (the cast would fail mid-way)."""
+    bind = op.get_bind()
+    for table, columns in UUID_COLUMNS.items():
+        for column in columns:
+            bad = bind.execute(sa.text(
+                f'SELECT {column} FROM {table} WHERE {column} IS NOT NULL AND {column} !~ :pattern LIMIT 1'
+            ), {'pattern': UUID_PATTERN}).scalar()
+            if bad is not None:
+                raise RuntimeError(f'{table}.{column} holds a non-uuid value ({bad!r}); fix or remove it before upgrading')
+
+
+def _drop_foreign_key(table: str, column: str, referred: str) -> None:
+    # A DO block, so it also works in offline (--sql) mode.
+    op.execute(f'''
+        DO $$
+        DECLARE fk record;
+        BEGIN
+            FOR fk IN
+                SELECT c.conname FROM pg_constraint c
+                JOIN pg_attribute a ON a.attrelid = c.conrelid AND a.attnum = ANY (c.conkey)
+                WHERE c.contype = 'f' AND c.conrelid = '{table}'::regclass
+                  AND c.confrelid = '{referred}'::regclass AND a.attname = '{column}'
+            LOOP
+                EXECUTE 'ALTER TABLE {table} DROP CONSTRAINT ' || quote_ident(fk.conname);
+            END LOOP;
+        END $$
+    ''')
+
+
+def _retype(type_: str, using: str) -> None:
+    for _, table, column, referred in FOREIGN_KEYS:
+        _drop_foreign_key(table, column, referred)
+    # One ALTER per table, so each table (and each partition) is rewritten once.
+    for table, columns in UUID_COLUMNS.items():
+        op.execute(f'ALTER TABLE {table} ' + ', '.join(
+            f'ALTER COLUMN {c} TYPE {type_} USING {c}{using}' for c in columns
+        ))
+    for name, table, column, referred in FOREIGN_KEYS:
+        op.create_foreign_key(name, table, referred, [column], ['id'])
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        if not context.is_offline_mode():
+            _check_values()
+        # Backfill in place: the cast rewrites every row (16-byte keys instead of 37).
+        _retype('uuid', '::uuid')
+
+    op.drop_index('ix_llm_usage_session_id', table_name='llm_usage', if_exists=True)
+    op.create_index(
+        'ix_llm_usage_session_id_created_at',
+        'llm_usage',
+        ['session_id', 'created_at'],
+        unique=False,
+        postgresql_include=USAGE_INCLUDE,
+    )
+    if op.get_bind().dialect.name == 'postgresql' and not context.is_offline_mode():
+        # Fresh statistics (and visibility map) so the planner picks index-only scans.
+        for table in UUID_COLUMNS:
+            op.execute(f'ANALYZE {table}')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_llm_usage_session_id_created_at', table_name='llm_usage')
+    op.create_index('ix_llm_usage_session_id', 'llm_usage', ['session_id'], unique=False)
+
+    if op.get_bind().dialect.name == 'postgresql':
+        _retype('varchar(36)', '::text')
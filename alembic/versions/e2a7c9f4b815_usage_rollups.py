@@ -0,0 +1,59 @@
+"""usage rollups
+
+Revision ID: e2a7c9f4b815
+Revises: b4e9a1d6c2f3
+Create Date: 2026-10-17 12:00:00.000000
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e2a7c9f4b815'
+down_revision: Union[str, Sequence[str], None] = 'b4e9a1d6c2f3'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'usage_rollups',
+        sa.Column('granularity', sa.String(length=8), nullable=False),
+        sa.Column('user_id', sa.String(length=36), nullable=False),
+        sa.Column('session_id', sa.String(length=36), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('model', sa.String(length=64), nullable=False),
+        sa.Column('requests', sa.BigInteger(), nullable=False),
+        sa.Column('prompt_tokens', sa.BigInteger(), nullable=False),
+        sa.Column('completion_tokens', sa.BigInteger(), nullable=False),
+        sa.Column('total_tokens', sa.BigInteger(), nullable=False),
+        sa.Column('cache_hits', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('granularity', 'user_id', 'session_id', 'bucket_start', 'model'),
+    )
+
+    # Backfill from existing llm_usage: per session and per user ('*'), hourly and daily.
+    # The '*' rows get their own INSERT: a constant cannot appear in GROUP BY.
+    for granularity in ('hour', 'day'):
+        for session_expr, group_by in (('u.session_id', 'u.session_id, '), ("'*'", '')):
+            op.execute(
+                f"""
+                INSERT INTO usage_rollups
+                    (granularity, user_id, session_id, bucket_start, model,
+                     requests, prompt_tokens, completion_tokens, total_tokens, cache_hits)
+                SELECT '{granularity}', s.user_id, {session_expr}, date_trunc('{granularity}', u.created_at), u.model,
+                       count(*), sum(u.prompt_tokens), sum(u.completion_tokens), sum(u.total_tokens),
+                       sum(CASE WHEN u.cache_hit THEN 1 ELSE 0 END)
+                FROM llm_usage u
+                JOIN chat_sessions s ON s.id = u.session_id
+                WHERE s.user_id IS NOT NULL
+                GROUP BY s.user_id, {group_by}date_trunc('{granularity}', u.created_at), u.model
+                """
+            )
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('usage_rollups')
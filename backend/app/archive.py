@@ -0,0 +1,155 @@
+"""
+Cold-session archival.
+
+Sessions with no message newer than the idle threshold have their messages
+moved into chat_session_archives as one compressed blob, and the rows are
+deleted from (the monthly partitions of) chat_messages. Usage rows stay
+where they are. The next read or write of the session restores the messages
+first (`rehydrate_session`); restored rows whose monthly partition was
+dropped land in the DEFAULT partition.
+
+CLI (from backend/), e.g. nightly:
+    python -m app.archive --idle-days 90 [--batch 200] [--limit 10000] [--drop-empty-partitions]
+"""
+import argparse
+import json
+import logging
+import os
+import zlib
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import delete, func, select, update
+from sqlalchemy.orm import Session
+
+from .metrics import registry
+from .models import ChatMessage, ChatSession, SessionArchive
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_IDLE_DAYS = int(os.getenv("ARCHIVE_IDLE_DAYS", "90"))
+
+rehydrations = registry.counter("archive_rehydrations_total", "Archived sessions restored on access.")
+
+def pack(messages: list[ChatMessage]) -> bytes:
+    rows = [
+        {
+            "id": m.id,
+            "role": m.role,
+            "content": m.content,
+            "token_count": m.token_count,
+            "created_at": m.created_at.isoformat(),
+        }
+        for m in messages
+    ]
+    return zlib.compress(json.dumps(rows, ensure_ascii=False, separators=(",", ":")).encode(), 9)
+
+def unpack(session_id: str, payload: bytes) -> list[ChatMessage]:
+    return [
+        ChatMessage(
+            id=row["id"],
+            session_id=session_id,
+            role=row["role"],
+            content=row["content"],
+            token_count=row["token_count"],
+            created_at=datetime.fromisoformat(row["created_at"]),
+        )
+        for row in json.loads(zlib.decompress(payload))
+    ]
+
+def idle_sessions(db: Session, cutoff: datetime, limit: int) -> list[str]:
+    # Unarchived sessions whose newest message is older than `cutoff`.
+    stmt = (
+        select(ChatMessage.session_id)
+        .join(ChatSession, ChatSession.id == ChatMessage.session_id)
+        .where(ChatSession.archived_at.is_(None))
+        .group_by(ChatMessage.session_id)
+        .having(func.max(ChatMessage.created_at) < cutoff)
+        .limit(limit)
+    )
+    return list(db.execute(stmt).scalars().all())
+
+def archive_session(db: Session, session_id: str) -> int:
+    # Move one session's messages into the archive (caller commits).
+    messages = db.execute(
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at, ChatMessage.id)
+    ).scalars().all()
+    if not messages:
+        return 0
+    db.add(SessionArchive(
+        session_id=session_id,
+        message_count=len(messages),
+        last_message_at=messages[-1].created_at,
+        payload=pack(messages),
+        archived_at=datetime.utcnow(),
+    ))
+    # Delete exactly what was packed; a message written meanwhile stays hot and is merged on restore.
+    db.execute(delete(ChatMessage).where(
+        ChatMessage.session_id == session_id,
+        ChatMessage.id.in_([m.id for m in messages]),
+    ))
+    db.execute(update(ChatSession).where(ChatSession.id == session_id).values(archived_at=datetime.utcnow()))
+    return len(messages)
+
+def run_archive(session_factory, idle_days: int = ARCHIVE_IDLE_DAYS, batch: int = 200, limit: Optional[int] = None) -> tuple[int, int]:
+    # Archive idle sessions in batches, one transaction per batch. Returns (sessions, messages).
+    cutoff = datetime.utcnow() - timedelta(days=idle_days)
+    sessions = messages = 0
+    while limit is None or sessions < limit:
+        size = batch if limit is None else min(batch, limit - sessions)
+        with session_factory() as db:
+            ids = idle_sessions(db, cutoff, size)
+            if not ids:
+                break
+            for session_id in ids:
+                messages += archive_session(db, session_id)
+            db.commit()
+        sessions += len(ids)
+        logger.info("archived %d sessions (%d messages) so far", sessions, messages)
+    return sessions, messages
+
+async def rehydrate_session(session_factory, session_id: str) -> int:
+    # Restore an archived session's messages. Taking the archive row with
+    # DELETE ... RETURNING means concurrent callers restore it only once.
+    async with session_factory() as db:
+        payload = (await db.execute(
+            delete(SessionArchive)
+            .where(SessionArchive.session_id == session_id)
+            .returning(SessionArchive.payload)
+        )).scalar_one_or_none()
+        if payload is not None:
+            messages = unpack(session_id, payload)
+            db.add_all(messages)
+        await db.execute(update(ChatSession).where(ChatSession.id == session_id).values(archived_at=None))
+        await db.commit()
+    if payload is None:
+        return 0
+    rehydrations.inc()
+    return len(messages)
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Archive idle chat sessions.")
+    parser.add_argument("--idle-days", type=int, default=ARCHIVE_IDLE_DAYS)
+    parser.add_argument("--batch", type=int, default=200, help="sessions per transaction")
+    parser.add_argument("--limit", type=int, help="stop after this many sessions")
+    parser.add_argument("--drop-empty-partitions", action="store_true",
+                        help="drop monthly partitions older than the idle cutoff that are now empty")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
+
+    from .db import SessionLocal, engine
+    from .partitions import drop_empty_partitions, ensure_partitions
+
+    with engine.begin() as conn:
+        ensure_partitions(conn)
+    sessions, messages = run_archive(SessionLocal, args.idle_days, args.batch, args.limit)
+    print(f"archived {sessions} sessions, {messages} messages")
+    if args.drop_empty_partitions:
+        with engine.begin() as conn:
+            dropped = drop_empty_partitions(conn, datetime.utcnow() - timedelta(days=args.idle_days))
+        print(f"dropped partitions: {', '.join(dropped) or 'none'}")
+
+if __name__ == "__main__":
+    main()
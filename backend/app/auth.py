@@ -1,9 +1,27 @@
+import asyncio
+import multiprocessing
 import os
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from typing import Optional
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# min == max == rounds: any cost change makes existing hashes "need update",
+# so they are transparently rehashed on the next successful login.
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+# Password hashing runs in its own process pool so a login burst cannot
+# starve the event loop or the threadpool serving chat traffic.
+HASH_WORKERS = int(os.getenv("HASH_WORKERS", "2"))
+HASH_QUEUE_DEPTH = int(os.getenv("HASH_QUEUE_DEPTH", "32"))
 
 JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
 JWT_ALG = "HS256"
@@ -15,18 +33,62 @@ def hash_password(password: str) -> str:
 def verify_password(password: str, password_hash: str) -> bool:
     return pwd_context.verify(password, password_hash)
 
+def verify_and_update_password(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    # Returns (ok, new_hash); new_hash is set when the stored hash uses outdated parameters.
+    return pwd_context.verify_and_update(password, password_hash)
+
+class HashingBusyError(Exception):
+    """Raised when the hashing pool already has HASH_QUEUE_DEPTH jobs waiting."""
+
+class PasswordHasher:
+    def __init__(self, workers: int, queue_depth: int):
+        self.workers = workers
+        self.capacity = workers + queue_depth
+        self.in_flight = 0
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            # spawn: never fork a process that is running an event loop and threads
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def run(self, fn, *args):
+        if self.in_flight >= self.capacity:
+            raise HashingBusyError()
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+password_hasher = PasswordHasher(HASH_WORKERS, HASH_QUEUE_DEPTH)
+
+async def hash_password_async(password: str) -> str:
+    return await password_hasher.run(hash_password, password)
+
+async def verify_password_async(password: str, password_hash: str) -> tuple[bool, Optional[str]]:
+    return await password_hasher.run(verify_and_update_password, password, password_hash)
+
 def create_access_token(user_id: str) -> str:
     exp = datetime.utcnow() + timedelta(minutes=JWT_EXPIRE_MIN)
     payload = {"sub": user_id, "exp": exp}
     return jwt.encode(payload, JWT_SECRET, algorithm=JWT_ALG)
 
+def decode_token_claims(token: str) -> dict:
+    payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
+    if not payload.get("sub"):
+        raise JWTError("missing sub")
+    return payload
+
 def decode_token(token: str) -> str:
-    try:
-        payload = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALG])
-        user_id = payload.get("sub")
-        if not user_id:
-            raise JWTError("missing sub")
-        return user_id
-    except JWTError:
-        raise
+    return decode_token_claims(token)["sub"]
 
@@ -0,0 +1,60 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Optional
+
+class TTLCache:
+    """
+    Bounded LRU with per-entry expiry.
+
+    Expired entries are dropped lazily on read; when full, the least recently
+    used entry is evicted. Safe to share between the event loop and threadpool.
+    `on_evict(key, value)` runs (outside the lock) for entries dropped by
+    expiry or eviction, not for explicit pop/clear.
+    """
+
+    def __init__(self, maxsize: int, ttl: Optional[float] = None, on_evict: Optional[Callable[[Hashable, Any], None]] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            expires_at, value = item
+            if expires_at > time.monotonic():
+                self._data.move_to_end(key)
+                return value
+            del self._data[key]
+        if self.on_evict:
+            self.on_evict(key, value)
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None):
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else float("inf")
+        evicted = []
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                evicted.append(self._data.popitem(last=False))
+        if self.on_evict:
+            for old_key, (_, old_value) in evicted:
+                self.on_evict(old_key, old_value)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            item = self._data.pop(key, None)
+            return default if item is None else item[1]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import uuid
+from collections import deque
+from typing import Optional
+
+import redis
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# redis: shared by all workers; local: per-worker LRU (single-worker / dev setups)
+CONTEXT_CACHE_BACKEND = os.getenv("CONTEXT_CACHE_BACKEND", "redis")
+CONTEXT_CACHE_TTL = int(os.getenv("CONTEXT_CACHE_TTL", "3600"))
+CONTEXT_CACHE_SESSIONS = int(os.getenv("CONTEXT_CACHE_SESSIONS", "10000"))
+# How long a rebuild may take between begin_fill and fill before it's abandoned.
+CONTEXT_FILL_TIMEOUT_MS = int(os.getenv("CONTEXT_FILL_TIMEOUT_MS", "30000"))
+
+# Replace the ring only if no append cleared our fill marker since begin_fill.
+_FILL_LUA = """
+if redis.call('GET', KEYS[2]) ~= ARGV[1] then
+  return 0
+end
+redis.call('DEL', KEYS[2], KEYS[1])
+redis.call('RPUSH', KEYS[1], unpack(ARGV, 3))
+redis.call('EXPIRE', KEYS[1], ARGV[2])
+return 1
+"""
+
+class RedisContextRing:
+    """
+    Per-session ring of the most recent {role, content} entries in a Redis list.
+
+    `get` returns None on a miss (or when Redis is unavailable) so the caller
+    rebuilds from Postgres: `begin_fill`, load, then `fill`. `append` only
+    extends rings that already exist, so an evicted ring is never resurrected
+    with a gap; it also clears the fill marker, so a rebuild that loaded its
+    snapshot before that turn committed is dropped instead of stored.
+    """
+
+    def __init__(self, client, size: int, ttl: int, fill_timeout_ms: int = CONTEXT_FILL_TIMEOUT_MS):
+        self.client = client
+        self.size = size
+        self.ttl = ttl
+        self.fill_timeout_ms = fill_timeout_ms
+        self._fill = client.register_script(_FILL_LUA)
+
+    def _key(self, session_id: str) -> str:
+        return f"ctx:{session_id}"
+
+    def _fill_key(self, session_id: str) -> str:
+        return f"ctx:fill:{session_id}"
+
+    async def get(self, session_id: str) -> Optional[list[dict]]:
+        try:
+            raw = await self.client.lrange(self._key(session_id), 0, -1)
+        except redis.RedisError:
+            logger.warning("context ring: redis read failed", exc_info=True)
+            return None
+        if not raw:
+            return None
+        return [json.loads(item) for item in raw]
+
+    async def begin_fill(self, session_id: str) -> Optional[str]:
+        # Call before loading from Postgres; the last rebuild to start wins.
+        token = uuid.uuid4().hex
+        try:
+            await self.client.set(self._fill_key(session_id), token, px=self.fill_timeout_ms)
+        except redis.RedisError:
+            logger.warning("context ring: redis fill marker failed", exc_info=True)
+            return None
+        return token
+
+    async def fill(self, session_id: str, entries: list[dict], token: Optional[str]):
+        if not entries or token is None:
+            return
+        try:
+            await self._fill(
+                keys=[self._key(session_id), self._fill_key(session_id)],
+                args=[token, self.ttl, *[json.dumps(e, ensure_ascii=False) for e in entries[-self.size:]]],
+            )
+        except redis.RedisError:
+            logger.warning("context ring: redis fill failed", exc_info=True)
+
+    async def append(self, session_id: str, entries: list[dict]):
+        key = self._key(session_id)
+        try:
+            async with self.client.pipeline(transaction=True) as pipe:
+                pipe.delete(self._fill_key(session_id))
+                pipe.rpushx(key, *[json.dumps(e, ensure_ascii=False) for e in entries])
+                pipe.ltrim(key, -self.size, -1)
+                pipe.expire(key, self.ttl)
+                await pipe.execute()
+        except redis.RedisError:
+            logger.warning("context ring: redis append failed, dropping ring", exc_info=True)
+            await self.invalidate(session_id)
+
+    async def invalidate(self, session_id: str):
+        try:
+            await self.client.delete(self._key(session_id))
+        except redis.RedisError:
+            logger.warning("context ring: redis delete failed", exc_info=True)
+
+class LocalContextRing:
+    # Same interface as RedisContextRing, backed by an in-process LRU of deques.
+    def __init__(self, size: int, ttl: int, max_sessions: int, fill_timeout_ms: int = CONTEXT_FILL_TIMEOUT_MS):
+        self.size = size
+        self.rings = TTLCache(maxsize=max_sessions, ttl=ttl)
+        self.fills = TTLCache(maxsize=max_sessions, ttl=fill_timeout_ms / 1000)
+
+    async def get(self, session_id: str) -> Optional[list[dict]]:
+        ring = self.rings.get(session_id)
+        return list(ring) if ring else None
+
+    async def begin_fill(self, session_id: str) -> Optional[str]:
+        token = uuid.uuid4().hex
+        self.fills.set(session_id, token)
+        return token
+
+    async def fill(self, session_id: str, entries: list[dict], token: Optional[str]):
+        if self.fills.get(session_id) != token:
+            return
+        self.fills.pop(session_id)
+        if entries:
+            self.rings.set(session_id, deque(entries, maxlen=self.size))
+
+    async def append(self, session_id: str, entries: list[dict]):
+        self.fills.pop(session_id)
+        ring = self.rings.get(session_id)
+        if ring is not None:
+            ring.extend(entries)
+            self.rings.set(session_id, ring)
+
+    async def invalidate(self, session_id: str):
+        self.rings.pop(session_id)
+
+def build_context_ring(size: int):
+    if CONTEXT_CACHE_BACKEND == "local":
+        return LocalContextRing(size, CONTEXT_CACHE_TTL, CONTEXT_CACHE_SESSIONS)
+    from .redis_client import ar
+    return RedisContextRing(ar, size, CONTEXT_CACHE_TTL)
@@ -0,0 +1,250 @@
+"""
+Streaming NDJSON export of sessions and messages.
+
+Rows are read through a server-side cursor (`yield_per`) and written as they
+arrive, so memory stays constant regardless of history size. Output is one
+JSON object per line: a {"type": "session"} line followed by that session's
+{"type": "message"} lines. Archived sessions follow the live ones, their
+messages unpacked from chat_session_archives. Optionally gzip-compressed on
+the fly.
+
+CLI (from backend/):
+    python -m app.export --user-id <id> [--since 2026-01-01] [--until ...] [--gzip] [-o out.ndjson.gz]
+    python -m app.export --all --gzip -o all.ndjson.gz
+"""
+import argparse
+import json
+import sys
+import zlib
+from datetime import datetime
+from typing import AsyncIterator, Iterable, Iterator, Optional
+
+from sqlalchemy import Select, and_, or_, select
+
+from .archive import unpack
+from .models import ChatMessage, ChatSession, SessionArchive
+
+EXPORT_BATCH_ROWS = 1000
+# Archive rows carry a whole session's compressed messages.
+ARCHIVE_BATCH_ROWS = 50
+
+def _window(column, since: Optional[datetime], until: Optional[datetime]) -> list:
+    return ([column >= since] if since is not None else []) + ([column < until] if until is not None else [])
+
+def export_statement(
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Select:
+    # Unarchived sessions that have messages in [since, until), in session order.
+    stmt = (
+        select(
+            ChatSession.id.label("session_id"),
+            ChatSession.user_id,
+            ChatSession.created_at.label("session_created_at"),
+            ChatMessage.id.label("message_id"),
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.token_count,
+            ChatMessage.created_at,
+        )
+        .join(ChatMessage, ChatMessage.session_id == ChatSession.id)
+        .where(ChatSession.archived_at.is_(None), *_window(ChatMessage.created_at, since, until))
+        .order_by(ChatSession.created_at, ChatSession.id, ChatMessage.created_at, ChatMessage.id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(ChatSession.user_id == user_id)
+    return stmt.execution_options(yield_per=EXPORT_BATCH_ROWS)
+
+def archive_statement(
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+) -> Select:
+    # Archived sessions with their packed messages, plus any live rows written
+    # while they were being archived (one row per live message, or one row
+    # with NULL message columns). Archives ending before `since` are skipped
+    # unless they have such live rows.
+    live = and_(ChatMessage.session_id == ChatSession.id, *_window(ChatMessage.created_at, since, until))
+    stmt = (
+        select(
+            ChatSession.id.label("session_id"),
+            ChatSession.user_id,
+            ChatSession.created_at.label("session_created_at"),
+            SessionArchive.payload,
+            ChatMessage.id.label("message_id"),
+            ChatMessage.role,
+            ChatMessage.content,
+            ChatMessage.token_count,
+            ChatMessage.created_at,
+        )
+        .join(SessionArchive, SessionArchive.session_id == ChatSession.id)
+        .outerjoin(ChatMessage, live)
+        .order_by(ChatSession.created_at, ChatSession.id)
+    )
+    if user_id is not None:
+        stmt = stmt.where(ChatSession.user_id == user_id)
+    if since is not None:
+        stmt = stmt.where(or_(SessionArchive.last_message_at >= since, ChatMessage.id.is_not(None)))
+    return stmt.execution_options(yield_per=ARCHIVE_BATCH_ROWS)
+
+class NDJSONWriter:
+    # Turns joined rows into NDJSON lines, emitting a session line on each new session.
+    def __init__(self, since: Optional[datetime] = None, until: Optional[datetime] = None):
+        self.since = since
+        self.until = until
+        self.current_session: Optional[str] = None
+        self._archived: Optional[tuple] = None  # (archive row, live messages) of the session being read
+
+    def lines(self, rows: Iterable) -> str:
+        out = []
+        for row in rows:
+            if row.session_id != self.current_session:
+                self.current_session = row.session_id
+                out.append(_session_line(row))
+            out.append(_message_line(row.session_id, row.message_id, row.role, row.content, row.token_count, row.created_at))
+        return "".join(out)
+
+    def archived_lines(self, rows: Iterable) -> str:
+        # Rows from archive_statement; a session is written once all its rows are seen.
+        out = []
+        for row in rows:
+            if self._archived is None or row.session_id != self._archived[0].session_id:
+                out.append(self.finish())
+                self._archived = (row, [])
+            if row.message_id is not None:
+                self._archived[1].append(ChatMessage(
+                    id=row.message_id,
+                    session_id=row.session_id,
+                    role=row.role,
+                    content=row.content,
+                    token_count=row.token_count,
+                    created_at=row.created_at,
+                ))
+        return "".join(out)
+
+    def finish(self) -> str:
+        if self._archived is None:
+            return ""
+        row, live = self._archived
+        self._archived = None
+        messages = [
+            m for m in unpack(row.session_id, row.payload)
+            if (self.since is None or m.created_at >= self.since) and (self.until is None or m.created_at < self.until)
+        ] + live
+        if not messages:
+            return ""
+        messages.sort(key=lambda m: (m.created_at, m.id))
+        return _session_line(row) + "".join(
+            _message_line(row.session_id, m.id, m.role, m.content, m.token_count, m.created_at) for m in messages
+        )
+
+def _session_line(row) -> str:
+    return _dump({
+        "type": "session",
+        "id": row.session_id,
+        "user_id": row.user_id,
+        "created_at": row.session_created_at.isoformat(),
+    })
+
+def _message_line(session_id: str, message_id: str, role: str, content: str, token_count: int, created_at: datetime) -> str:
+    return _dump({
+        "type": "message",
+        "id": message_id,
+        "session_id": session_id,
+        "role": role,
+        "content": content,
+        "token_count": token_count,
+        "created_at": created_at.isoformat(),
+    })
+
+def _dump(obj: dict) -> str:
+    return json.dumps(obj, ensure_ascii=False) + "\n"
+
+class GzipStream:
+    # Incremental gzip (wbits=31 writes the gzip header/trailer).
+    def __init__(self):
+        self._z = zlib.compressobj(6, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._z.compress(data)
+
+    def flush(self) -> bytes:
+        return self._z.flush()
+
+def _passes(writer: NDJSONWriter, user_id: Optional[str], since: Optional[datetime], until: Optional[datetime]):
+    # Live sessions first, then archived ones (unpacked on the fly).
+    return (
+        (export_statement(user_id, since, until), writer.lines),
+        (archive_statement(user_id, since, until), writer.archived_lines),
+    )
+
+async def stream_export(
+    session_factory,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+) -> AsyncIterator[bytes]:
+    # Async variant for the HTTP endpoint; owns its DB session since it outlives the handler.
+    writer = NDJSONWriter(since, until)
+    z = GzipStream() if gzip else None
+    async with session_factory() as db:
+        for stmt, lines in _passes(writer, user_id, since, until):
+            result = await db.stream(stmt)
+            async for batch in result.partitions():
+                data = lines(batch).encode()
+                data = z.compress(data) if z else data
+                if data:
+                    yield data
+    data = writer.finish().encode()
+    data = z.compress(data) + z.flush() if z else data
+    if data:
+        yield data
+
+def iter_export(
+    session_factory,
+    user_id: Optional[str] = None,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+) -> Iterator[bytes]:
+    # Sync variant for the CLI.
+    writer = NDJSONWriter(since, until)
+    z = GzipStream() if gzip else None
+    with session_factory() as db:
+        for stmt, lines in _passes(writer, user_id, since, until):
+            result = db.execute(stmt)
+            for batch in result.partitions():
+                data = lines(batch).encode()
+                data = z.compress(data) if z else data
+                if data:
+                    yield data
+    data = writer.finish().encode()
+    data = z.compress(data) + z.flush() if z else data
+    if data:
+        yield data
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Export chat sessions and messages as NDJSON.")
+    who = parser.add_mutually_exclusive_group(required=True)
+    who.add_argument("--user-id", help="export one user's sessions")
+    who.add_argument("--all", action="store_true", help="export every user's sessions")
+    parser.add_argument("--since", type=datetime.fromisoformat, help="messages created at or after (UTC)")
+    parser.add_argument("--until", type=datetime.fromisoformat, help="messages created before (UTC)")
+    parser.add_argument("--gzip", action="store_true", help="gzip the output")
+    parser.add_argument("-o", "--output", help="output file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from .db import SessionLocal
+
+    out = open(args.output, "wb") if args.output else sys.stdout.buffer
+    try:
+        for chunk in iter_export(SessionLocal, args.user_id, args.since, args.until, args.gzip):
+            out.write(chunk)
+    finally:
+        if args.output:
+            out.close()
+
+if __name__ == "__main__":
+    main()
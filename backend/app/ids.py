@@ -0,0 +1,39 @@
+import os
+import threading
+import time
+import uuid
+
+_lock = threading.Lock()
+_last_ms = 0
+_seq = 0
+
+def uuid7() -> uuid.UUID:
+    # RFC 9562 UUIDv7: 48-bit unix ms timestamp, then random bits. The 12-bit
+    # rand_a field counts up within a millisecond, so ids from one process
+    # sort in creation order and new rows land at the right edge of the index.
+    global _last_ms, _seq
+    with _lock:
+        ms = time.time_ns() // 1_000_000
+        if ms > _last_ms:
+            _last_ms, _seq = ms, int.from_bytes(os.urandom(2), "big") & 0x7FF
+        else:
+            # Same (or a stepped-back) clock: keep counting; borrow the next ms on overflow.
+            _seq += 1
+            if _seq > 0xFFF:
+                _last_ms, _seq = _last_ms + 1, 0
+        ms, seq = _last_ms, _seq
+    rand_b = int.from_bytes(os.urandom(8), "big") & ((1 << 62) - 1)
+    value = (ms << 80) | (0x7 << 76) | (seq << 64) | (0b10 << 62) | rand_b
+    return uuid.UUID(int=value)
+
+def new_id() -> str:
+    # IDs are generated client-side so inserts never need a refresh round trip.
+    return str(uuid7())
+
+def is_uuid(value: str) -> bool:
+    # Keys are native UUIDs on Postgres; anything else can only be a miss, not a query error.
+    try:
+        uuid.UUID(value)
+    except (TypeError, ValueError, AttributeError):
+        return False
+    return True
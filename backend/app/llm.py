@@ -1,5 +1,21 @@
-from dataclasses import dataclass
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+import random
+import time
+from dataclasses import asdict, dataclass, replace
+from typing import AsyncIterator, Iterator, Optional, Protocol
 
+import httpx
+import redis
+
+from .cache import TTLCache
+from .metrics import record_stage, registry, stage
+
+logger = logging.getLogger(__name__)
 
 
 @dataclass
@@ -10,27 +26,668 @@ class LLMResult:
     prompt_tokens: int
     completion_tokens: int
     total_tokens: int
+    # True when served from the response cache instead of the provider.
+    cached: bool = False
+
+@dataclass
+class LLMChunk:
+    delta: str
+    # Only set on the final chunk of a stream.
+    result: Optional[LLMResult] = None
+
+class LLMError(Exception):
+    """The provider could not produce a reply (after retries)."""
+
+class LLMRequestError(LLMError):
+    """Upstream refused this request (non-retryable 4xx); not a sign of an outage."""
+
+class CircuitOpenError(LLMError):
+    """Failing fast: the provider has been failing and the breaker is open."""
+
+    def __init__(self, retry_after: float):
+        super().__init__("circuit open")
+        self.retry_after = retry_after
+
+class LLMProvider(Protocol):
+    name: str
+    model: str
+
+    def chat(self, messages: list[dict]) -> LLMResult: ...
+
+    def stream(self, messages: list[dict]) -> Iterator[LLMChunk]: ...
+
+    async def achat(self, messages: list[dict]) -> LLMResult: ...
+
+    def astream(self, messages: list[dict]) -> AsyncIterator[LLMChunk]: ...
+
+class TokenEstimator(Protocol):
+    def count(self, text: str) -> int: ...
+
+class CharRatioEstimator:
+    # 超简 token 估算：按字符数粗略除 4（只是为了打通链路）
+    def __init__(self, chars_per_token: int = 4):
+        self.chars_per_token = chars_per_token
+
+    def count(self, text: str) -> int:
+        return max(1, len(text) // self.chars_per_token)
+
+default_estimator: TokenEstimator = CharRatioEstimator()
+
+def message_tokens(message: dict, estimator: TokenEstimator = default_estimator) -> int:
+    # Messages carry their stored count as "tokens"; only fall back to counting text.
+    tokens = message.get("tokens")
+    return tokens if tokens else estimator.count(message.get("content", ""))
+
+def fit_context(messages: list[dict], budget: int, estimator: TokenEstimator = default_estimator) -> list[dict]:
+    """
+    Newest-first running sum: keep the most recent messages whose stored token
+    counts fit in `budget`. The newest message is always kept.
+    """
+    picked: list[dict] = []
+    total = 0
+    for message in reversed(messages):
+        tokens = message_tokens(message, estimator)
+        if picked and total + tokens > budget:
+            break
+        picked.append(message)
+        total += tokens
+    picked.reverse()
+    return picked
+
+def estimate_result(
+    provider: str,
+    model: str,
+    messages: list[dict],
+    text: str,
+    estimator: TokenEstimator = default_estimator,
+) -> LLMResult:
+    prompt_tokens = max(1, sum(message_tokens(m, estimator) for m in messages))
+    completion_tokens = estimator.count(text)
+
+    return LLMResult(
+        text=text,
+        provider=provider,
+        model=model,
+        prompt_tokens=prompt_tokens,
+        completion_tokens=completion_tokens,
+        total_tokens=prompt_tokens + completion_tokens,
+    )
 
 class FakeProvider:
-    def __init__(self, model: str = "fake-1"):
+    """
+    Offline provider that echoes the last user message.
+
+    For load tests it can simulate a real backend: a log-normal time to first
+    token (median `latency_ms`, spread `latency_sigma`), a generation rate of
+    `tokens_per_sec`, and a `failure_rate` fraction of calls raising LLMError.
+    """
+
+    name = "fake"
+
+    def __init__(
+        self,
+        model: str = "fake-1",
+        chunk_size: int = 4,
+        chunk_delay: float = 0.0,
+        estimator: TokenEstimator = default_estimator,
+        latency_ms: float = 0.0,
+        latency_sigma: float = 0.5,
+        tokens_per_sec: float = 0.0,
+        failure_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ):
         self.model = model
+        self.estimator = estimator
+        # 流式输出时每个 chunk 的字符数 / 间隔秒数
+        self.chunk_size = max(1, chunk_size)
+        self.chunk_delay = chunk_delay
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.tokens_per_sec = tokens_per_sec
+        self.failure_rate = failure_rate
+        self.rng = random.Random(seed)
+
+    def _reply(self, messages: list[dict]) -> str:
+        user_text = messages[-1].get("content", "")
+        return f"（fake）我收到了：{user_text}"
+
+    def _maybe_fail(self):
+        if self.failure_rate and self.rng.random() < self.failure_rate:
+            raise LLMError("fake provider failure (simulated)")
+
+    def _first_token_delay(self) -> float:
+        if not self.latency_ms:
+            return 0.0
+        return self.rng.lognormvariate(math.log(self.latency_ms / 1000), self.latency_sigma)
+
+    def _generation_delay(self, text: str) -> float:
+        if not self.tokens_per_sec:
+            return 0.0
+        return self.estimator.count(text) / self.tokens_per_sec
+
+    def _chunks(self, reply: str) -> Iterator[tuple[float, str]]:
+        # (delay before chunk, chunk); the first chunk also waits for time-to-first-token.
+        first = self._first_token_delay()
+        for i in range(0, len(reply), self.chunk_size):
+            chunk = reply[i:i + self.chunk_size]
+            yield first + self.chunk_delay + self._generation_delay(chunk), chunk
+            first = 0.0
 
     def chat(self, messages: list[dict]) -> LLMResult:
-        # 超简 token 估算：按字符数粗略除 4（只是为了打通链路）
-        prompt_chars = sum(len(m.get("content", "")) for m in messages)
-        prompt_tokens = max(1, prompt_chars // 4)
+        self._maybe_fail()
+        reply = self._reply(messages)
+        delay = self._first_token_delay() + self._generation_delay(reply)
+        if delay:
+            time.sleep(delay)
+        return estimate_result(self.name, self.model, messages, reply, self.estimator)
 
-        user_text = messages[-1].get("content", "")
-        reply = f"（fake）我收到了：{user_text}"
+    def stream(self, messages: list[dict]) -> Iterator[LLMChunk]:
+        self._maybe_fail()
+        reply = self._reply(messages)
+        for delay, chunk in self._chunks(reply):
+            if delay:
+                time.sleep(delay)
+            yield LLMChunk(delta=chunk)
+
+        yield LLMChunk(delta="", result=estimate_result(self.name, self.model, messages, reply, self.estimator))
+
+    async def achat(self, messages: list[dict]) -> LLMResult:
+        self._maybe_fail()
+        reply = self._reply(messages)
+        delay = self._first_token_delay() + self._generation_delay(reply)
+        if delay:
+            await asyncio.sleep(delay)
+        return estimate_result(self.name, self.model, messages, reply, self.estimator)
+
+    async def astream(self, messages: list[dict]) -> AsyncIterator[LLMChunk]:
+        self._maybe_fail()
+        reply = self._reply(messages)
+        for delay, chunk in self._chunks(reply):
+            if delay:
+                await asyncio.sleep(delay)
+            yield LLMChunk(delta=chunk)
+
+        yield LLMChunk(delta="", result=estimate_result(self.name, self.model, messages, reply, self.estimator))
+
+class CircuitBreaker:
+    """
+    closed -> open after `failure_threshold` consecutive failed calls;
+    open -> half-open after `reset_timeout` seconds, letting one trial call
+    through; its outcome closes or re-opens the breaker.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self.trial_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def before_call(self) -> bool:
+        # Returns whether this call is the half-open trial.
+        state = self.state
+        if state == "open" or (state == "half_open" and self.trial_in_flight):
+            remaining = self.reset_timeout - (time.monotonic() - self.opened_at)
+            raise CircuitOpenError(retry_after=max(1.0, remaining))
+        if state == "half_open":
+            self.trial_in_flight = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial_in_flight = False
+
+    def record_failure(self):
+        self.failures += 1
+        self.trial_in_flight = False
+        if self.opened_at is not None or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+
+    def record_rejected(self, trial: bool):
+        # Upstream answered but refused this one request (e.g. context too
+        # long): that says nothing about its health. Free the trial slot so
+        # the next call can probe.
+        if trial:
+            self.trial_in_flight = False
+
+    def record_abandoned(self, trial: bool):
+        # A cancelled call says nothing about upstream, but an unfinished
+        # trial must not keep the breaker half-open (and rejecting) forever.
+        if trial:
+            self.record_failure()
+
+class RetryableError(Exception):
+    pass
 
-        completion_tokens = max(1, len(reply) // 4)
-        total_tokens = prompt_tokens + completion_tokens
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
 
+class OpenAICompatibleProvider:
+    """
+    Any /chat/completions endpoint speaking the OpenAI wire format (OpenAI,
+    vLLM, Ollama, a local stub...).
+
+    One pooled keep-alive httpx client per provider (async for handlers,
+    sync for scripts), connect/read timeouts, retries with full-jitter
+    backoff, optional hedging (a second request if the first is slower than
+    `hedge_after`), and a circuit breaker that fails fast while upstream is down.
+    """
+
+    name = "openai"
+
+    def __init__(
+        self,
+        base_url: str,
+        api_key: str,
+        model: str,
+        connect_timeout: float = 3.0,
+        read_timeout: float = 60.0,
+        max_retries: int = 2,
+        backoff_base: float = 0.25,
+        backoff_max: float = 4.0,
+        hedge_after: Optional[float] = None,
+        max_connections: int = 100,
+        breaker: Optional[CircuitBreaker] = None,
+        estimator: TokenEstimator = default_estimator,
+    ):
+        self.model = model
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after
+        self.breaker = breaker or CircuitBreaker()
+        self.estimator = estimator
+        self._client_kwargs = dict(
+            base_url=base_url.rstrip("/"),
+            headers={"Authorization": f"Bearer {api_key}"} if api_key else {},
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections),
+        )
+        self._client = httpx.AsyncClient(**self._client_kwargs)
+        self._sync_client: Optional[httpx.Client] = None
+
+    def _payload(self, messages: list[dict], stream: bool) -> dict:
+        payload = {
+            "model": self.model,
+            # Internal keys (e.g. stored token counts) never go upstream.
+            "messages": [{"role": m["role"], "content": m["content"]} for m in messages],
+            "stream": stream,
+        }
+        if stream:
+            payload["stream_options"] = {"include_usage": True}
+        return payload
+
+    def _result(self, messages: list[dict], text: str, usage: Optional[dict]) -> LLMResult:
+        if not usage:
+            return estimate_result(self.name, self.model, messages, text, self.estimator)
         return LLMResult(
-            text=reply,
-            provider="fake",
+            text=text,
+            provider=self.name,
             model=self.model,
-            prompt_tokens=prompt_tokens,
-            completion_tokens=completion_tokens,
-            total_tokens=total_tokens,
-        )
\ No newline at end of file
+            prompt_tokens=usage.get("prompt_tokens", 0),
+            completion_tokens=usage.get("completion_tokens", 0),
+            total_tokens=usage.get("total_tokens", 0),
+        )
+
+    def _check(self, resp: httpx.Response):
+        if resp.status_code in RETRYABLE_STATUS:
+            raise RetryableError(f"upstream status {resp.status_code}")
+        if resp.status_code >= 400:
+            raise LLMRequestError(f"upstream status {resp.status_code}")
+
+    @staticmethod
+    def _completion(resp: httpx.Response) -> dict:
+        # A 200 with an unparseable or unexpected body is an upstream failure too.
+        try:
+            data = resp.json()
+            if not isinstance(data["choices"][0]["message"], dict):
+                raise TypeError("message is not an object")
+        except (ValueError, KeyError, IndexError, TypeError) as exc:
+            raise LLMError("malformed upstream response") from exc
+        return data
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter keeps retrying workers from synchronizing.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    # -- async ---------------------------------------------------------------
+
+    async def _post_once(self, payload: dict) -> dict:
+        try:
+            resp = await self._client.post("/chat/completions", json=payload)
+        except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as exc:
+            raise RetryableError(str(exc)) from exc
+        self._check(resp)
+        return self._completion(resp)
+
+    async def _hedged(self, payload: dict) -> dict:
+        if not self.hedge_after:
+            return await self._post_once(payload)
+
+        first = asyncio.create_task(self._post_once(payload))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_after)
+        if done:
+            return first.result()
+
+        # Tail latency: race a second request and take whichever succeeds first.
+        pending = {first, asyncio.create_task(self._post_once(payload))}
+        error: Optional[BaseException] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _call(self, send):
+        trial = self.breaker.before_call()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    result = await send()
+                except RetryableError:
+                    if attempt == self.max_retries:
+                        break
+                    await asyncio.sleep(self._backoff(attempt))
+                    continue
+                self.breaker.record_success()
+                return result
+        except asyncio.CancelledError:
+            self.breaker.record_abandoned(trial)
+            raise
+        except LLMRequestError:
+            # One bad prompt must not open the circuit for every user.
+            self.breaker.record_rejected(trial)
+            raise
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_failure()
+        raise LLMError("provider unavailable after retries")
+
+    async def achat(self, messages: list[dict]) -> LLMResult:
+        data = await self._call(lambda: self._hedged(self._payload(messages, stream=False)))
+        return self._result(messages, data["choices"][0]["message"].get("content") or "", data.get("usage"))
+
+    async def _open_stream(self, payload: dict):
+        # Retries (and the breaker) only cover getting the response headers;
+        # once tokens are flowing a failure is surfaced to the caller.
+        async def send():
+            try:
+                request = self._client.build_request("POST", "/chat/completions", json=payload)
+                resp = await self._client.send(request, stream=True)
+            except (httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError) as exc:
+                raise RetryableError(str(exc)) from exc
+            if resp.status_code >= 400:
+                await resp.aclose()
+            self._check(resp)
+            return resp
+        return await self._call(send)
+
+    async def astream(self, messages: list[dict]) -> AsyncIterator[LLMChunk]:
+        resp = await self._open_stream(self._payload(messages, stream=True))
+        parts: list[str] = []
+        usage = None
+        try:
+            async for line in resp.aiter_lines():
+                delta, chunk_usage, done = self._parse_sse_line(line)
+                if done:
+                    break
+                usage = chunk_usage or usage
+                if delta:
+                    parts.append(delta)
+                    yield LLMChunk(delta=delta)
+        except (httpx.HTTPError, ValueError) as exc:
+            raise LLMError("stream interrupted") from exc
+        finally:
+            await resp.aclose()
+        yield LLMChunk(delta="", result=self._result(messages, "".join(parts), usage))
+
+    @staticmethod
+    def _parse_sse_line(line: str) -> tuple[str, Optional[dict], bool]:
+        if not line.startswith("data:"):
+            return "", None, False
+        data = line[5:].strip()
+        if data == "[DONE]":
+            return "", None, True
+        event = json.loads(data)
+        choices = event.get("choices") or []
+        delta = ""
+        if choices:
+            delta = (choices[0].get("delta") or {}).get("content") or ""
+        return delta, event.get("usage"), False
+
+    async def aclose(self):
+        await self._client.aclose()
+        if self._sync_client is not None:
+            self._sync_client.close()
+
+    # -- sync (scripts / threadpool callers); no hedging -----------------------
+
+    def _sync(self) -> httpx.Client:
+        if self._sync_client is None:
+            self._sync_client = httpx.Client(**self._client_kwargs)
+        return self._sync_client
+
+    def chat(self, messages: list[dict]) -> LLMResult:
+        payload = self._payload(messages, stream=False)
+        trial = self.breaker.before_call()
+        try:
+            for attempt in range(self.max_retries + 1):
+                try:
+                    resp = self._sync().post("/chat/completions", json=payload)
+                    self._check(resp)
+                except (RetryableError, httpx.TimeoutException, httpx.NetworkError, httpx.RemoteProtocolError):
+                    if attempt < self.max_retries:
+                        time.sleep(self._backoff(attempt))
+                    continue
+                data = self._completion(resp)
+                self.breaker.record_success()
+                return self._result(messages, data["choices"][0]["message"].get("content") or "", data.get("usage"))
+        except LLMRequestError:
+            self.breaker.record_rejected(trial)
+            raise
+        except BaseException:
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_failure()
+        raise LLMError("provider unavailable after retries")
+
+    def stream(self, messages: list[dict]) -> Iterator[LLMChunk]:
+        # Sync streaming is rarely needed off the request path: reuse chat().
+        result = self.chat(messages)
+        yield LLMChunk(delta=result.text)
+        yield LLMChunk(delta="", result=result)
+
+def build_provider(estimator: TokenEstimator = default_estimator) -> LLMProvider:
+    # LLM_PROVIDER=fake (default) | openai
+    kind = os.getenv("LLM_PROVIDER", "fake")
+    if kind == "openai":
+        hedge_ms = int(os.getenv("LLM_HEDGE_AFTER_MS", "0"))
+        return OpenAICompatibleProvider(
+            base_url=os.getenv("OPENAI_BASE_URL", "https://api.openai.com/v1"),
+            api_key=os.getenv("OPENAI_API_KEY", ""),
+            model=os.getenv("OPENAI_MODEL", "gpt-4o-mini"),
+            connect_timeout=float(os.getenv("LLM_CONNECT_TIMEOUT", "3")),
+            read_timeout=float(os.getenv("LLM_READ_TIMEOUT", "60")),
+            max_retries=int(os.getenv("LLM_MAX_RETRIES", "2")),
+            hedge_after=hedge_ms / 1000 if hedge_ms else None,
+            max_connections=int(os.getenv("LLM_MAX_CONNECTIONS", "100")),
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.getenv("LLM_BREAKER_FAILURES", "5")),
+                reset_timeout=float(os.getenv("LLM_BREAKER_RESET_S", "30")),
+            ),
+            estimator=estimator,
+        )
+    if kind != "fake":
+        raise ValueError(f"unknown LLM_PROVIDER: {kind}")
+    return FakeProvider(
+        model="fake-1",
+        estimator=estimator,
+        chunk_size=int(os.getenv("FAKE_STREAM_CHUNK_SIZE", "4")),
+        chunk_delay=float(os.getenv("FAKE_STREAM_CHUNK_DELAY_MS", "0")) / 1000,
+        latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+        latency_sigma=float(os.getenv("FAKE_LLM_LATENCY_SIGMA", "0.5")),
+        tokens_per_sec=float(os.getenv("FAKE_LLM_TOKENS_PER_SEC", "0")),
+        failure_rate=float(os.getenv("FAKE_LLM_FAILURE_RATE", "0")),
+        seed=int(os.environ["FAKE_LLM_SEED"]) if os.getenv("FAKE_LLM_SEED") else None,
+    )
+
+def normalized_context_key(model: str, messages: list[dict]) -> str:
+    # Case/whitespace-insensitive: "How do I reset my password? " == "how do i  reset my password?"
+    normalized = [[m.get("role", ""), " ".join(m.get("content", "").split()).lower()] for m in messages]
+    raw = json.dumps([model, normalized], ensure_ascii=False, separators=(",", ":"))
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+llm_tokens = registry.counter(
+    "llm_tokens_total", "Prompt/completion tokens, including replies served from the cache.", ("model", "kind", "cached")
+)
+llm_first_token = registry.histogram(
+    "llm_time_to_first_token_seconds", "Time until the first streamed delta.", ("model",)
+)
+
+def record_usage(result: LLMResult) -> LLMResult:
+    cached = "true" if result.cached else "false"
+    llm_tokens.inc(result.prompt_tokens, model=result.model, kind="prompt", cached=cached)
+    llm_tokens.inc(result.completion_tokens, model=result.model, kind="completion", cached=cached)
+    return result
+
+class CachedProvider:
+    """
+    Response cache in front of a provider, keyed on the normalized (trimmed)
+    context + model.
+
+    Tier 1 is a per-worker TTL LRU (size-bounded); tier 2 (optional) is Redis
+    with the same TTL, where size is bounded by the server's maxmemory policy.
+    `bypass=True` skips the lookup but still stores the fresh reply;
+    `store=False` also skips the store (one-off prompts such as summaries,
+    which would only push real chat entries out). Hits come back with
+    `cached=True`.
+    """
+
+    def __init__(self, inner: LLMProvider, maxsize: int, ttl: int, redis_client=None, enabled: bool = True):
+        self.inner = inner
+        self.name = inner.name
+        self.model = inner.model
+        self.ttl = ttl
+        self.enabled = enabled
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl)
+        self.redis = redis_client
+        self.stats = {"hit_local": 0, "hit_redis": 0, "miss": 0}
+
+    async def _lookup(self, key: str) -> Optional[LLMResult]:
+        result = self.local.get(key)
+        if result is not None:
+            self.stats["hit_local"] += 1
+            return result
+        if self.redis is not None:
+            try:
+                raw = await self.redis.get(f"llmcache:{key}")
+            except redis.RedisError:
+                logger.warning("response cache: redis get failed", exc_info=True)
+                raw = None
+            if raw is not None:
+                result = LLMResult(**json.loads(raw))
+                self.local.set(key, result)
+                self.stats["hit_redis"] += 1
+                return result
+        self.stats["miss"] += 1
+        return None
+
+    async def _store(self, key: str, result: LLMResult):
+        result = replace(result, cached=False)
+        self.local.set(key, result)
+        if self.redis is not None:
+            try:
+                await self.redis.set(f"llmcache:{key}", json.dumps(asdict(result), ensure_ascii=False), ex=self.ttl)
+            except redis.RedisError:
+                logger.warning("response cache: redis set failed", exc_info=True)
+
+    def chat(self, messages: list[dict], bypass: bool = False) -> LLMResult:
+        # Sync path: local tier only.
+        if not self.enabled:
+            return record_usage(self._timed_chat(messages))
+        key = normalized_context_key(self.model, messages)
+        result = None if bypass else self.local.get(key)
+        if result is not None:
+            return record_usage(replace(result, cached=True))
+        result = self._timed_chat(messages)
+        self.local.set(key, result)
+        return record_usage(result)
+
+    def _timed_chat(self, messages: list[dict]) -> LLMResult:
+        with stage("llm"):
+            return self.inner.chat(messages)
+
+    def stream(self, messages: list[dict], bypass: bool = False) -> Iterator[LLMChunk]:
+        return self.inner.stream(messages)
+
+    async def achat(self, messages: list[dict], bypass: bool = False, store: bool = True) -> LLMResult:
+        return record_usage(await self._achat(messages, bypass, store))
+
+    async def _achat(self, messages: list[dict], bypass: bool, store: bool) -> LLMResult:
+        if not self.enabled:
+            with stage("llm"):
+                return await self.inner.achat(messages)
+        key = normalized_context_key(self.model, messages)
+        if not bypass:
+            with stage("response_cache"):
+                result = await self._lookup(key)
+            if result is not None:
+                return replace(result, cached=True)
+        with stage("llm"):
+            result = await self.inner.achat(messages)
+        if store:
+            await self._store(key, result)
+        return result
+
+    async def astream(self, messages: list[dict], bypass: bool = False) -> AsyncIterator[LLMChunk]:
+        # Time to first token and total generation time; the stream outlives Server-Timing.
+        started = time.perf_counter()
+        first = True
+        async for chunk in self._astream(messages, bypass):
+            if first and chunk.delta:
+                llm_first_token.observe(time.perf_counter() - started, model=self.model)
+                first = False
+            if chunk.result is not None:
+                record_stage("llm", time.perf_counter() - started)
+                record_usage(chunk.result)
+            yield chunk
+
+    async def _astream(self, messages: list[dict], bypass: bool) -> AsyncIterator[LLMChunk]:
+        if not self.enabled:
+            async for chunk in self.inner.astream(messages):
+                yield chunk
+            return
+
+        key = normalized_context_key(self.model, messages)
+        if not bypass:
+            result = await self._lookup(key)
+            if result is not None:
+                # Replay a hit as a single delta.
+                yield LLMChunk(delta=result.text)
+                yield LLMChunk(delta="", result=replace(result, cached=True))
+                return
+
+        async for chunk in self.inner.astream(messages):
+            if chunk.result is not None:
+                await self._store(key, chunk.result)
+            yield chunk
+
+    async def aclose(self):
+        if hasattr(self.inner, "aclose"):
+            await self.inner.aclose()
@@ -1,26 +1,168 @@
-from fastapi import Depends, FastAPI, HTTPException, Request, Security
+import asyncio
+import hashlib
+import json
+import logging
+import os
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta
+
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, Security
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.background import BackgroundTask
+import anyio
 from typing import Optional
 
-from .auth import hash_password, verify_password, create_access_token, decode_token
-from .db import engine, SessionLocal
-from .llm import FakeProvider
-from .models import Base, ChatSession, ChatMessage, LLMUsage, User
-from .rate_limit import fixed_window_limit
+from .archive import rehydrate_session
+from .auth import (
+    HashingBusyError,
+    create_access_token,
+    decode_token_claims,
+    hash_password_async,
+    password_hasher,
+    verify_password_async,
+)
+from .context_cache import build_context_ring
+from .db import AsyncSessionLocal, async_engine, engine, prewarm as prewarm_db
+from .export import stream_export
+from .ids import is_uuid, new_id
+from .metrics import MetricsMiddleware, registry, stage
+from .llm import (
+    CachedProvider,
+    CircuitOpenError,
+    LLMError,
+    LLMResult,
+    build_provider,
+    default_estimator,
+    estimate_result,
+    fit_context,
+)
+from .models import Base, ChatSession, ChatMessage, LLMUsage, UsageRollup, User
+from .pagination import encode_cursor, keyset_overlap, keyset_page, to_page
+from .partitions import ensure_partitions
+from .principal_cache import Principal, principal_cache
+from .scheduler import SchedulerBusyError, Ticket, scheduler
+from .read_routing import read_router
+from .search import build_search
+from .redis_client import ar, prewarm as prewarm_redis
+from .singleflight import IDEMPOTENCY_TTL, IdempotencyConflictError, singleflight
+from .summaries import SUMMARY_MAX_SHARE, SessionSummarizer, summary_entry, unsummarized
+from .rate_limit import RateLimitRule, multi_key_limit_async
+from .usage import ALL_SESSIONS, ROLLUP_COUNTERS, apply_rollups, bucket_start
+from .usage_buffer import UsageWriteBuffer
+
+# Optional write-behind for LLMUsage: batch rows instead of inserting per turn.
+usage_buffer = (
+    UsageWriteBuffer(
+        AsyncSessionLocal,
+        max_rows=int(os.getenv("USAGE_FLUSH_ROWS", "100")),
+        max_delay_ms=int(os.getenv("USAGE_FLUSH_MS", "500")),
+    )
+    if os.getenv("USAGE_WRITE_BEHIND", "0") == "1"
+    else None
+)
 
-app = FastAPI(title="AI Support Backend")
-provider = FakeProvider(model="fake-1")
-Base.metadata.create_all(bind=engine)
+logger = logging.getLogger(__name__)
+
+# DB_CREATE_ALL=0 leaves the schema to `alembic upgrade head` (no reflection per worker start).
+DB_CREATE_ALL = os.getenv("DB_CREATE_ALL", "1") == "1"
+DB_PREWARM_CONNECTIONS = int(os.getenv("DB_PREWARM_CONNECTIONS", "2"))
+REDIS_PREWARM_CONNECTIONS = int(os.getenv("REDIS_PREWARM_CONNECTIONS", "2"))
+READY_TIMEOUT_MS = int(os.getenv("READY_TIMEOUT_MS", "1000"))
+
+async def prepare_schema():
+    async with async_engine.begin() as conn:
+        if DB_CREATE_ALL:
+            await conn.run_sync(Base.metadata.create_all)
+        # Monthly partitions for the coming months (no-op unless migrated to partitioned tables).
+        await conn.run_sync(ensure_partitions)
+    app.state.schema_ready = True
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.ready = False
+    app.state.schema_ready = False
+    try:
+        await prepare_schema()
+    except Exception:
+        # Not fatal: /ready reports it (and retries it) until the database answers.
+        logger.warning("schema setup failed", exc_info=True)
+    # Open connections up front so the first requests skip connection setup.
+    for name, warm, n in (("database", prewarm_db, DB_PREWARM_CONNECTIONS), ("redis", prewarm_redis, REDIS_PREWARM_CONNECTIONS)):
+        if n <= 0:
+            continue
+        try:
+            await warm(n)
+        except Exception:
+            # Not fatal: /ready keeps reporting the dependency until it answers.
+            logger.warning("prewarm %s connections failed", name, exc_info=True)
+    if usage_buffer:
+        usage_buffer.start()
+    read_router.start()
+    app.state.ready = True
+    yield
+    # Stop taking traffic before tearing anything down.
+    app.state.ready = False
+    if usage_buffer:
+        # Flush pending usage rows before the worker exits.
+        await usage_buffer.close()
+    await summarizer.close()
+    password_hasher.shutdown()
+    # Close the provider's pooled HTTP connections.
+    await provider.aclose()
+    await read_router.close()
+    await ar.aclose()
+    await async_engine.dispose()
+    engine.dispose()
+
+app = FastAPI(title="AI Support Backend", lifespan=lifespan)
+token_estimator = default_estimator
+# Response cache for repeated questions (RESPONSE_CACHE=1); a pass-through otherwise.
+provider = CachedProvider(
+    build_provider(token_estimator),
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "3600")),
+    redis_client=ar if os.getenv("RESPONSE_CACHE_REDIS", "0") == "1" else None,
+    enabled=os.getenv("RESPONSE_CACHE", "0") == "1",
+)
+# tsvector/GIN search on Postgres; in-memory inverted index on SQLite.
+search_index = build_search(async_engine.dialect.name)
 bearer = HTTPBearer(auto_error=False)
 ALLOWED_ORIGINS = {"http://localhost:5173", "http://127.0.0.1:5173"}
-IP_RATE_LIMIT = {"limit": 30, "window_seconds": 60}
-SESSION_RATE_LIMIT = {"limit": 15, "window_seconds": 60}
-RECENT_MESSAGE_LIMIT = 20
+IP_RATE_LIMIT = {"limit": int(os.getenv("IP_RATE_LIMIT", "30")), "window_seconds": 60}
+SESSION_RATE_LIMIT = {"limit": int(os.getenv("SESSION_RATE_LIMIT", "15")), "window_seconds": 60}
+USER_RATE_LIMIT = {"limit": int(os.getenv("USER_RATE_LIMIT", "30")), "window_seconds": 60}
+# Upper bound on messages considered for context; the token budget decides how many are sent.
+RECENT_MESSAGE_LIMIT = int(os.getenv("CONTEXT_MAX_MESSAGES", "50"))
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+# `since=` also re-reads this far behind the cursor (see keyset_overlap); must
+# exceed the stamp-to-commit time of a turn.
+SINCE_OVERLAP = timedelta(milliseconds=int(os.getenv("SINCE_OVERLAP_MS", "5000")))
+# Newest keys hashed into list ETags, so a late commit just behind the newest row still changes it.
+ETAG_PROBE_ROWS = 8
+MAX_SEARCH_PAGE_SIZE = 50
+# Deep offsets re-rank every match; past this, refine the query instead.
+MAX_SEARCH_OFFSET = 1000
+USAGE_HOURLY_DEFAULT_RANGE = timedelta(hours=48)
+USAGE_DAILY_DEFAULT_RANGE = timedelta(days=30)
+# Recent {role, content} per session, so prompt assembly skips the messages table.
+context_ring = build_context_ring(RECENT_MESSAGE_LIMIT)
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+registry.callback(
+    "response_cache_lookups_total", "Response cache lookups by outcome.", "counter", ("outcome",),
+    lambda: {(k,): v for k, v in provider.stats.items()},
+)
+registry.callback(
+    "singleflight_calls_total", "Chat submissions by single-flight outcome.", "counter", ("outcome",),
+    lambda: {(k,): v for k, v in singleflight.stats.items()},
+)
 
 class SignUpIn(BaseModel):
     email: EmailStr
@@ -39,6 +181,8 @@ class SessionOut(BaseModel):
 
 class MessageCreateIn(BaseModel):
     message: str
+    # Skip the response cache for this message (same as Cache-Control: no-cache).
+    no_cache: bool = False
 
 class ChatReplyOut(BaseModel):
     session_id: str
@@ -52,42 +196,97 @@ app.add_middleware(
     # Allow all methods/headers for local dev.
     allow_methods=["*"],
     allow_headers=["*"],
+    # Pagination cursors for the session list travel in headers.
+    expose_headers=["X-Before-Cursor", "X-After-Cursor", "X-Has-More", "ETag", "Server-Timing"],
 )
+# Outermost: times whole requests and adds the Server-Timing header.
+app.add_middleware(MetricsMiddleware)
 
-def get_db():
-    # Provide a scoped session per request and always close it.
-    db = SessionLocal()
-    try:
+async def get_db():
+    # Provide a scoped async session per request and always close it.
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
+
+async def load_user(user_id: str) -> Optional[User]:
+    # Auth lookups read from a replica; a user too new to have replicated falls back to the primary.
+    async with read_router.session() as db:
+        user = await db.get(User, user_id)
+    if user is None and read_router.replicas:
+        async with AsyncSessionLocal() as db:
+            user = await db.get(User, user_id)
+    return user
 
 def resolve_client_ip(request: Request) -> str:
     # Prefer X-Forwarded-For when present (first hop), else fall back to socket IP.
     xff = request.headers.get("x-forwarded-for")
     return xff.split(",")[0].strip() if xff else request.client.host
 
-def get_current_user(
+async def get_current_user(
     cred: HTTPAuthorizationCredentials = Security(bearer),
-    db: Session = Depends(get_db),
-) -> User:
-    # Decode bearer token and load the user record.
+) -> Principal:
+    # Resolve the bearer token to a principal; only cache misses hit jwt.decode and the DB.
     if cred is None:
         raise HTTPException(status_code=401, detail="Missing token")
+
+    with stage("auth"):
+        principal = await principal_cache.get(cred.credentials)
+    if principal is not None:
+        return principal
+
     try:
-        user_id = decode_token(cred.credentials)
+        claims = decode_token_claims(cred.credentials)
     except Exception:
         raise HTTPException(status_code=401, detail="Invalid token")
 
-    user = db.get(User, user_id)
+    user = await load_user(claims["sub"])
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+
+    principal = Principal(id=user.id, email=user.email)
+    await principal_cache.set(cred.credentials, principal, claims["exp"])
+    return principal
+
+async def get_read_db(user: Principal = Depends(get_current_user)):
+    # Read-only endpoints: a replica session, or the primary right after this user wrote.
+    async with read_router.session(user.id) as db:
+        yield db
 
 @app.get("/health")
-def health():
+async def health():
     return {"ok": True}
 
+async def _probe(check) -> bool:
+    try:
+        await asyncio.wait_for(check, READY_TIMEOUT_MS / 1000)
+        return True
+    except Exception:
+        return False
+
+async def _ping_db():
+    async with async_engine.connect() as conn:
+        await conn.execute(text("SELECT 1"))
+
+@app.get("/ready")
+async def ready():
+    # Readiness, unlike /health (liveness): startup finished and Postgres + Redis answer.
+    if not getattr(app.state, "schema_ready", False):
+        await _probe(prepare_schema())
+    checks = {
+        "startup": getattr(app.state, "ready", False),
+        "schema": getattr(app.state, "schema_ready", False),
+        "database": await _probe(_ping_db()),
+        "redis": await _probe(ar.ping()),
+    }
+    ok = all(checks.values())
+    return JSONResponse(status_code=200 if ok else 503, content={"ready": ok, "checks": checks})
+
+@app.get("/metrics")
+async def metrics(authorization: Optional[str] = Header(None)):
+    # Prometheus scrape target; set METRICS_TOKEN to require a bearer token.
+    if METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="Invalid metrics token")
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 def rate_limit_response(limit_result):
     # Normalize rate limit responses with standard headers.
     return JSONResponse(
@@ -100,26 +299,227 @@ def rate_limit_response(limit_result):
         },
     )
 
-def apply_rate_limit(key: str, limit_config: dict):
-    # Apply a fixed-window limit and return a response if blocked.
-    result = fixed_window_limit(
-        key,
-        limit=limit_config["limit"],
-        window_seconds=limit_config["window_seconds"],
-    )
+async def apply_rate_limit(limits: list[tuple[str, dict]]):
+    # Check all (key, config) pairs in one atomic Redis call; return a response if blocked.
+    with stage("rate_limit"):
+        result = await multi_key_limit_async(
+            [RateLimitRule(key, cfg["limit"], cfg["window_seconds"]) for key, cfg in limits]
+        )
     if not result.allowed:
         return rate_limit_response(result)
     return None
 
-@app.get("/api/chat/sessions")
-def get_sessions(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
-    # List sessions owned by the current user, newest first.
+def chat_rate_limits(client_ip: str, session_id: str, user: Principal) -> list[tuple[str, dict]]:
+    return [
+        (f"ip:{client_ip}", IP_RATE_LIMIT),
+        (f"session:{session_id}", SESSION_RATE_LIMIT),
+        (f"user:{user.id}", USER_RATE_LIMIT),
+    ]
+
+async def load_recent_context(db: AsyncSession, session_id: str, limit: int = RECENT_MESSAGE_LIMIT) -> list[dict]:
+    # Fetch the last N messages of a session in chronological order.
     stmt = (
-        select(ChatSession)
-        .where(ChatSession.user_id == user.id)
-        .order_by(ChatSession.created_at.desc())
+        select(ChatMessage)
+        .where(ChatMessage.session_id == session_id)
+        .order_by(ChatMessage.created_at.desc(), ChatMessage.id.desc())
+        .limit(limit)
+    )
+    rows = list((await db.execute(stmt)).scalars().all())
+    rows.reverse()
+    return [message_entry(m) for m in rows]
+
+def message_entry(m: ChatMessage) -> dict:
+    return {"id": m.id, "role": m.role, "content": m.content, "tokens": m.token_count}
+
+def new_message(session_id: str, role: str, content: str, token_count: Optional[int] = None) -> ChatMessage:
+    return ChatMessage(
+        id=new_id(),
+        session_id=session_id,
+        role=role,
+        content=content,
+        token_count=token_count if token_count is not None else token_estimator.count(content),
+        created_at=datetime.utcnow(),
     )
-    sessions = db.execute(stmt).scalars().all()
+
+async def build_prompt(db: AsyncSession, s: ChatSession, user_msg: ChatMessage) -> tuple[list[dict], list[dict]]:
+    """
+    Prompt = rolling summary (if any) + the newest unsummarized messages that
+    fit the remaining token budget. Also returns the unsummarized entries so
+    the caller can decide whether the summary is due for a refresh.
+    """
+    with stage("context"):
+        history = await recent_context(db, s.id)
+    pending = unsummarized(history, s.summary_message_id) + [message_entry(user_msg)]
+    if not s.summary:
+        return fit_context(pending, CONTEXT_TOKEN_BUDGET, token_estimator), pending
+    summary, summary_tokens = summarizer.bounded(s.summary, s.summary_tokens)
+    budget = CONTEXT_TOKEN_BUDGET - summary_tokens
+    return [summary_entry(summary, summary_tokens)] + fit_context(pending, budget, token_estimator), pending
+
+def schedule_summary(s: ChatSession, user_id: str, pending: list[dict], assistant_msg: Optional[ChatMessage]):
+    # Refresh the rolling summary in the background once enough turns piled up.
+    if assistant_msg is not None:
+        pending = pending + [message_entry(assistant_msg)]
+    summarizer.maybe_schedule(s.id, user_id, s.summary, s.summary_message_id, pending)
+
+async def recent_context(db: AsyncSession, session_id: str) -> list[dict]:
+    # One cache read on the hot path; rebuild the ring from Postgres on a miss.
+    entries = await context_ring.get(session_id)
+    if entries is None:
+        # Marked before the load, so a turn committed meanwhile voids this snapshot.
+        token = await context_ring.begin_fill(session_id)
+        entries = await load_recent_context(db, session_id)
+        await context_ring.fill(session_id, entries, token)
+    return entries
+
+def usage_row(session_id: str, message_id: str, result: LLMResult) -> dict:
+    return {
+        "id": new_id(),
+        "session_id": session_id,
+        "message_id": message_id,
+        "provider": result.provider,
+        "model": result.model,
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "total_tokens": result.total_tokens,
+        "cache_hit": result.cached,
+        "created_at": datetime.utcnow(),
+    }
+
+async def persist_turn(db: AsyncSession, user_id: str, messages: list[ChatMessage], usage: Optional[dict]):
+    # Write a whole chat turn (and its usage rollups) in one transaction; IDs are already assigned.
+    if usage and usage_buffer is None:
+        db.add(LLMUsage(**usage))
+        await apply_rollups(db, [(user_id, usage)])
+    # Stamped as late as possible (right before the commit's flush), not when the
+    # turn started, to keep the stamp-to-commit gap small. A concurrent turn can
+    # still stamp earlier and commit later; `since=` re-reads SINCE_OVERLAP behind
+    # the cursor for that.
+    now = datetime.utcnow()
+    for i, m in enumerate(messages):
+        m.created_at = now + timedelta(microseconds=i)
+    db.add_all(messages)
+    with stage("db_commit"):
+        await db.commit()
+    await read_router.mark_write(user_id)
+    if usage and usage_buffer is not None:
+        await usage_buffer.add(user_id, usage)
+    await context_ring.append(messages[0].session_id, [message_entry(m) for m in messages])
+    search_index.add(user_id, messages)
+
+async def bill_usage(db: AsyncSession, user_id: str, session_id: str, message_id: str, result: LLMResult):
+    # LLM calls outside a chat turn (summaries) are recorded like any other; caller commits.
+    usage = usage_row(session_id, message_id, result)
+    if usage_buffer is None:
+        db.add(LLMUsage(**usage))
+        await apply_rollups(db, [(user_id, usage)])
+    else:
+        await usage_buffer.add(user_id, usage)
+
+# Rolling per-session summaries so long chats send summary + recent tail.
+summarizer = SessionSummarizer(
+    provider,
+    AsyncSessionLocal,
+    max_tokens=int(CONTEXT_TOKEN_BUDGET * SUMMARY_MAX_SHARE),
+    on_usage=bill_usage,
+    estimator=token_estimator,
+)
+
+async def restore_if_archived(s: ChatSession):
+    # Cold session: bring its messages back before they are read or appended to.
+    if s.archived_at is None:
+        return
+    await rehydrate_session(AsyncSessionLocal, s.id)
+    async with AsyncSessionLocal() as db:
+        await search_index.restore(db, s.user_id, s.id)
+    await context_ring.invalidate(s.id)
+    await read_router.mark_write(s.user_id)
+
+def cache_bypassed(request: Request, payload: MessageCreateIn) -> bool:
+    return payload.no_cache or "no-cache" in request.headers.get("cache-control", "")
+
+def usage_payload(result: LLMResult) -> dict:
+    return {
+        "provider": result.provider,
+        "model": result.model,
+        "prompt_tokens": result.prompt_tokens,
+        "completion_tokens": result.completion_tokens,
+        "total_tokens": result.total_tokens,
+        "cache_hit": result.cached,
+    }
+
+def page_window(db_stmt, created_col, id_col, limit: int, before: Optional[str], after: Optional[str], since: Optional[str] = None):
+    # Translate cursor query params into a keyset query (400 on bad input).
+    # `since` pages forward like `after`, but an empty delta keeps the client's cursor.
+    if sum(1 for c in (before, after, since) if c) > 1:
+        raise HTTPException(status_code=400, detail="Use only one of before, after or since")
+    try:
+        return keyset_page(db_stmt, created_col, id_col, limit, before=before, after=after or since)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+def since_overlap(stmt, created_col, id_col, since: str):
+    # Rows just behind a `since` cursor that may have committed after the client read it.
+    try:
+        return keyset_overlap(stmt, created_col, id_col, since, SINCE_OVERLAP, MAX_PAGE_SIZE)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+async def latest_marker(db: AsyncSession, stmt, created_col, id_col) -> Optional[str]:
+    # (created_at, id) of the newest rows: one probe of the keyset index.
+    rows = (await db.execute(
+        stmt.with_only_columns(created_col, id_col).order_by(created_col.desc(), id_col.desc()).limit(ETAG_PROBE_ROWS)
+    )).all()
+    return ",".join(encode_cursor(*row) for row in rows) or None
+
+def list_etag(*parts) -> str:
+    # Weak validator over the newest-row marker and the request's paging params.
+    digest = hashlib.sha256("|".join(str(p) for p in parts).encode()).hexdigest()[:32]
+    return f'W/"{digest}"'
+
+def not_modified(if_none_match: Optional[str], etag: str) -> Optional[Response]:
+    # 304 before any rows are loaded or serialized (weak comparison).
+    if not if_none_match:
+        return None
+    tags = {t.strip().removeprefix("W/") for t in if_none_match.split(",")}
+    if "*" in tags or etag.removeprefix("W/") in tags:
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": "private, no-cache"})
+    return None
+
+@app.get("/api/chat/sessions")
+async def get_sessions(
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    user: Principal = Depends(get_current_user),
+):
+    # List sessions owned by the current user, newest first, one page at a time.
+    # Sessions are only ever added, so the newest ones version the whole list.
+    owned = select(ChatSession.id, ChatSession.created_at).where(ChatSession.user_id == user.id)
+    marker = await latest_marker(db, owned, ChatSession.created_at, ChatSession.id)
+    etag = list_etag("sessions", user.id, marker, limit, before, after, since)
+    if cached := not_modified(if_none_match, etag):
+        return cached
+
+    stmt, newest_first = page_window(owned, ChatSession.created_at, ChatSession.id, limit, before, after, since)
+    page = to_page((await db.execute(stmt)).all(), limit, newest_first)
+    late = []
+    if since:
+        late = (await db.execute(since_overlap(owned, ChatSession.created_at, ChatSession.id, since))).all()
+
+    # The body stays a plain list; cursors go in headers.
+    if page.rows:
+        response.headers["X-Before-Cursor"] = page.before_cursor()
+        response.headers["X-After-Cursor"] = page.after_cursor()
+    elif since:
+        response.headers["X-After-Cursor"] = since
+    response.headers["X-Has-More"] = "true" if page.has_more else "false"
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
 
     return [
         {
@@ -127,23 +527,62 @@ def get_sessions(db: Session = Depends(get_db), user: User = Depends(get_current
             "title": getattr(s, "title", None) or s.created_at.strftime("%Y-%m-%d %H:%M"),
             "created_at": s.created_at,
         }
-        for s in sessions
+        # With `since`, rows just behind the cursor come first (oldest last); dedupe by id.
+        for s in reversed(late + page.rows)
     ]
 
 @app.get("/api/sessions/{session_id}/messages")
-def get_messages(session_id: str, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+async def get_messages(
+    session_id: str,
+    response: Response,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+    since: Optional[str] = None,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_read_db),
+    user: Principal = Depends(get_current_user),
+):
     # Ensure session exists and belongs to the current user.
-    s = db.get(ChatSession, session_id)
+    s = await db.get(ChatSession, session_id) if is_uuid(session_id) else None
     if s is None or s.user_id != user.id:
         raise HTTPException(status_code=404, detail="Session not found")
 
-    stmt = (
-        select(ChatMessage)
-        .where(ChatMessage.session_id == session_id)
-        .order_by(ChatMessage.created_at.asc())
-    )
+    if s.archived_at is not None:
+        # Restored rows are only on the primary so far.
+        await restore_if_archived(s)
+        async with AsyncSessionLocal() as primary:
+            return await messages_page(primary, response, session_id, limit, before, after, since, if_none_match)
+    return await messages_page(db, response, session_id, limit, before, after, since, if_none_match)
+
+async def messages_page(
+    db: AsyncSession,
+    response: Response,
+    session_id: str,
+    limit: int,
+    before: Optional[str],
+    after: Optional[str],
+    since: Optional[str],
+    if_none_match: Optional[str],
+):
+    # Without a cursor this is the latest page; `before` walks back in history
+    # and `since=<after_cursor>` fetches what was added after it (plus the
+    # SINCE_OVERLAP window behind it). Messages are append-only, so the newest
+    # ones version the history.
+    history = select(ChatMessage).where(ChatMessage.session_id == session_id)
+    marker = await latest_marker(db, history, ChatMessage.created_at, ChatMessage.id)
+    etag = list_etag("messages", session_id, marker, limit, before, after, since)
+    if cached := not_modified(if_none_match, etag):
+        return cached
+
+    stmt, newest_first = page_window(history, ChatMessage.created_at, ChatMessage.id, limit, before, after, since)
+    page = to_page((await db.execute(stmt)).scalars().all(), limit, newest_first)
+    late = []
+    if since:
+        late = (await db.execute(since_overlap(history, ChatMessage.created_at, ChatMessage.id, since))).scalars().all()
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = "private, no-cache"
 
-    rows = db.execute(stmt).scalars().all()
     return {
         "session_id": session_id,
         "messages": [
@@ -153,112 +592,224 @@ def get_messages(session_id: str, db: Session = Depends(get_db), user: User = De
                 "content": m.content,
                 "created_at": m.created_at.isoformat(),
             }
-            for m in rows
+            # With `since`, rows just behind the cursor are repeated first; dedupe by id.
+            for m in late + page.rows
         ],
+        "has_more": page.has_more,
+        "before_cursor": page.before_cursor(),
+        "after_cursor": page.after_cursor() or since,
     }
 
 @app.post("/api/chat/sessions", response_model=SessionOut)
-def create_session(
+async def create_session(
     payload: SessionCreateIn,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
     # Create a new session for the current user.
-    s = ChatSession(user_id=user.id)
+    s = ChatSession(id=new_id(), user_id=user.id, created_at=datetime.utcnow())
     if hasattr(s, "title") and payload.title:
         s.title = payload.title
 
     db.add(s)
-    db.commit()
-    db.refresh(s)
+    await db.commit()
+    await read_router.mark_write(user.id)
 
     return {"id": s.id, "title": getattr(s, "title", None)}
 
 @app.post("/api/chat/sessions/{session_id}/messages", response_model=ChatReplyOut)
-def chat_in_session(
+async def chat_in_session(
     session_id: str,
     payload: MessageCreateIn,
     request: Request,
-    db: Session = Depends(get_db),
-    user: User = Depends(get_current_user),
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
 ):
     # Resolve client IP (respect X-Forwarded-For for proxies).
     client_ip = resolve_client_ip(request)
 
-    # Apply per-IP and per-session rate limits.
-    resp = apply_rate_limit(f"ip:{client_ip}", IP_RATE_LIMIT)
-    if resp:
-        return resp
-    resp = apply_rate_limit(f"session:{session_id}", SESSION_RATE_LIMIT)
+    # Apply per-IP, per-session and per-user rate limits in one round trip.
+    resp = await apply_rate_limit(chat_rate_limits(client_ip, session_id, user))
     if resp:
         return resp
 
     # Ensure session exists and belongs to the current user.
-    s = db.get(ChatSession, session_id)
+    s = await db.get(ChatSession, session_id) if is_uuid(session_id) else None
     if not s or s.user_id != user.id:
         raise HTTPException(status_code=404, detail="Session not found")
+    await restore_if_archived(s)
 
-    # Persist user message before calling the LLM.
-    user_msg = ChatMessage(session_id=s.id, role="user", content=payload.message)
-    db.add(user_msg)
-    db.commit()
-    db.refresh(user_msg)
+    bypass = cache_bypassed(request, payload)
 
-    # Load recent context (last N messages).
-    stmt = (
-        select(ChatMessage)
-        .where(ChatMessage.session_id == s.id)
-        .order_by(ChatMessage.created_at.desc())
-        .limit(RECENT_MESSAGE_LIMIT)
-    )
-    rows = db.execute(stmt).scalars().all()
-    rows.reverse()
+    async def run_turn() -> dict:
+        # Own DB session: a coalesced turn may outlive the request that started it.
+        async with AsyncSessionLocal() as turn_db:
+            user_msg = new_message(s.id, "user", payload.message)
 
-    llm_messages = [{"role": m.role, "content": m.content} for m in rows]
-
-    # Call provider to generate assistant reply.
-    result = provider.chat(llm_messages)
-
-    # Persist assistant message.
-    assistant_msg = ChatMessage(session_id=s.id, role="assistant", content=result.text)
-    db.add(assistant_msg)
-    db.commit()
-    db.refresh(assistant_msg)
-
-    # Persist usage for metrics/billing.
-    usage = LLMUsage(
-        session_id=s.id,
-        message_id=assistant_msg.id,
-        provider=result.provider,
-        model=result.model,
-        prompt_tokens=result.prompt_tokens,
-        completion_tokens=result.completion_tokens,
-        total_tokens=result.total_tokens,
-    )
-    db.add(usage)
-    db.commit()
+            # Rolling summary + recent context that fits the token budget, plus the new message.
+            llm_messages, pending = await build_prompt(turn_db, s, user_msg)
 
-    return {
-        "session_id": s.id,
-        "reply": result.text,
-        "usage": {
-            "provider": result.provider,
-            "model": result.model,
-            "prompt_tokens": result.prompt_tokens,
-            "completion_tokens": result.completion_tokens,
-            "total_tokens": result.total_tokens,
-        },
-    }
+            # Call provider to generate assistant reply, within a fair-queued dispatch slot.
+            async with scheduler.slot(user.id):
+                result = await provider.achat(llm_messages, bypass=bypass)
+
+            # Persist user message, assistant message and usage in one transaction.
+            assistant_msg = new_message(s.id, "assistant", result.text, result.completion_tokens)
+            await persist_turn(turn_db, user.id, [user_msg, assistant_msg], usage_row(s.id, assistant_msg.id, result))
+        schedule_summary(s, user.id, pending, assistant_msg)
+
+        return {
+            "session_id": s.id,
+            "reply": result.text,
+            "usage": usage_payload(result),
+        }
+
+    # Duplicate submissions (double clicks, client retries) share one provider call.
+    key, ttl, fingerprint = turn_dedup_key(request, user, s.id, payload)
+    return await singleflight.do(key, run_turn, ttl, fingerprint)
+
+def turn_dedup_key(request: Request, user: Principal, session_id: str, payload: MessageCreateIn) -> tuple[str, int, Optional[str]]:
+    # Only an explicit Idempotency-Key replays a finished reply (for the same body: its
+    # hash is stored with the key and checked on reuse). The message hash merges
+    # concurrent double-submits only; sending the same text again is a new turn.
+    idem = request.headers.get("idempotency-key")
+    if idem:
+        body = hashlib.sha256(payload.model_dump_json().encode()).hexdigest()
+        return f"idem:{user.id}:{session_id}:{idem}", IDEMPOTENCY_TTL, body
+    digest = hashlib.sha256(payload.message.encode()).hexdigest()
+    return f"msg:{user.id}:{session_id}:{digest}", 0, None
+
+class StreamedTurn:
+    # Accumulates a streamed reply and persists it exactly once, whether the
+    # stream finished, failed or the client went away mid-way.
+    def __init__(
+        self,
+        session: ChatSession,
+        user_id: str,
+        user_msg: ChatMessage,
+        llm_messages: list[dict],
+        pending: list[dict],
+        ticket: Ticket,
+    ):
+        self.session = session
+        self.session_id = session.id
+        self.user_id = user_id
+        self.user_msg = user_msg
+        self.llm_messages = llm_messages
+        self.pending = pending
+        self.ticket = ticket
+        self.parts: list[str] = []
+        self.result: Optional[LLMResult] = None
+        self.persisted = False
+
+    async def finish(self):
+        self.ticket.release()
+        if self.persisted:
+            return
+        self.persisted = True
+
+        text = "".join(self.parts)
+        result = self.result
+        if result is None and text:
+            # Stream was cut short: bill what was actually generated.
+            result = estimate_result(provider.name, provider.model, self.llm_messages, text, token_estimator)
+
+        messages = [self.user_msg]
+        usage = None
+        assistant_msg = None
+        if result is not None:
+            assistant_msg = new_message(self.session_id, "assistant", text, result.completion_tokens)
+            messages.append(assistant_msg)
+            usage = usage_row(self.session_id, assistant_msg.id, result)
+
+        # Shielded so a client disconnect (task cancellation) cannot abort the write.
+        with anyio.CancelScope(shield=True):
+            async with AsyncSessionLocal() as db:
+                await persist_turn(db, self.user_id, messages, usage)
+        schedule_summary(self.session, self.user_id, self.pending, assistant_msg)
+
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/chat/sessions/{session_id}/messages/stream")
+async def chat_in_session_stream(
+    session_id: str,
+    payload: MessageCreateIn,
+    request: Request,
+    db: AsyncSession = Depends(get_db),
+    user: Principal = Depends(get_current_user),
+):
+    # Same checks as chat_in_session, but the reply is flushed as SSE events.
+    client_ip = resolve_client_ip(request)
+
+    resp = await apply_rate_limit(chat_rate_limits(client_ip, session_id, user))
+    if resp:
+        return resp
+
+    s = await db.get(ChatSession, session_id) if is_uuid(session_id) else None
+    if not s or s.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+    await restore_if_archived(s)
+
+    user_msg = new_message(s.id, "user", payload.message)
+    llm_messages, pending = await build_prompt(db, s, user_msg)
+
+    # Queue for a dispatch slot before committing to a 200; it is held until the stream closes.
+    ticket = await scheduler.acquire(user.id)
+
+    # The user message is written together with the reply when the stream closes.
+    turn = StreamedTurn(s, user.id, user_msg, llm_messages, pending, ticket)
+    bypass = cache_bypassed(request, payload)
+
+    async def event_stream():
+        try:
+            async for chunk in provider.astream(turn.llm_messages, bypass=bypass):
+                if chunk.delta:
+                    turn.parts.append(chunk.delta)
+                    yield sse_event("delta", {"delta": chunk.delta})
+                if chunk.result is not None:
+                    turn.result = chunk.result
+            yield sse_event("done", {"session_id": turn.session_id, "usage": usage_payload(turn.result)})
+        except Exception:
+            yield sse_event("error", {"code": "LLM_ERROR", "message": "Generation failed."})
+        finally:
+            await turn.finish()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # Runs after a client disconnect too, in case the generator was not closed.
+        background=BackgroundTask(turn.finish),
+    )
 
 @app.get("/api/sessions/{session_id}/usage")
-def get_usage(session_id: str, db: Session = Depends(get_db)):
-    # Return usage records for a session.
+async def get_usage(
+    session_id: str,
+    db: AsyncSession = Depends(get_read_db),
+    user: Principal = Depends(get_current_user),
+):
+    # Return usage records for a session owned by the current user.
+    s = await db.get(ChatSession, session_id) if is_uuid(session_id) else None
+    if s is None or s.user_id != user.id:
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    # Only indexed columns, so Postgres can answer from the covering index.
     stmt = (
-        select(LLMUsage)
+        select(
+            LLMUsage.message_id,
+            LLMUsage.provider,
+            LLMUsage.model,
+            LLMUsage.prompt_tokens,
+            LLMUsage.completion_tokens,
+            LLMUsage.total_tokens,
+            LLMUsage.cache_hit,
+            LLMUsage.created_at,
+        )
         .where(LLMUsage.session_id == session_id)
         .order_by(LLMUsage.created_at.asc())
     )
-    rows = db.execute(stmt).scalars().all()
+    rows = (await db.execute(stmt)).all()
     return {
         "session_id": session_id,
         "usage": [
@@ -269,12 +820,146 @@ def get_usage(session_id: str, db: Session = Depends(get_db)):
                 "prompt_tokens": u.prompt_tokens,
                 "completion_tokens": u.completion_tokens,
                 "total_tokens": u.total_tokens,
+                "cache_hit": u.cache_hit,
                 "created_at": u.created_at.isoformat(),
             }
             for u in rows
         ],
     }
 
+@app.get("/api/usage/summary")
+async def get_usage_summary(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    session_id: Optional[str] = None,
+    model: Optional[str] = None,
+    db: AsyncSession = Depends(get_read_db),
+    user: Principal = Depends(get_current_user),
+):
+    # Totals and a time series for the current user (or one of their sessions), read from rollups.
+    if session_id is not None:
+        s = await db.get(ChatSession, session_id) if is_uuid(session_id) else None
+        if s is None or s.user_id != user.id:
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    end = end or datetime.utcnow()
+    start = start or end - (USAGE_HOURLY_DEFAULT_RANGE if granularity == "hour" else USAGE_DAILY_DEFAULT_RANGE)
+
+    counters = [func.sum(getattr(UsageRollup, c)).label(c) for c in ROLLUP_COUNTERS]
+    stmt = (
+        select(UsageRollup.bucket_start, *counters)
+        .where(
+            UsageRollup.granularity == granularity,
+            UsageRollup.user_id == user.id,
+            UsageRollup.session_id == (session_id or ALL_SESSIONS),
+            UsageRollup.bucket_start >= bucket_start(start, granularity),
+            UsageRollup.bucket_start <= end,
+        )
+        .group_by(UsageRollup.bucket_start)
+        .order_by(UsageRollup.bucket_start.asc())
+    )
+    if model:
+        stmt = stmt.where(UsageRollup.model == model)
+
+    rows = (await db.execute(stmt)).all()
+    series = [
+        {"bucket_start": r.bucket_start.isoformat(), **{c: int(getattr(r, c) or 0) for c in ROLLUP_COUNTERS}}
+        for r in rows
+    ]
+    totals = {c: sum(point[c] for point in series) for c in ROLLUP_COUNTERS}
+    return {
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "session_id": session_id,
+        "model": model,
+        "totals": totals,
+        "series": series,
+    }
+
+@app.get("/api/export")
+async def export_conversations(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    gzip: bool = False,
+    user: Principal = Depends(get_current_user),
+):
+    # Stream the current user's sessions and messages as NDJSON (constant memory).
+    filename = "conversations.ndjson.gz" if gzip else "conversations.ndjson"
+    return StreamingResponse(
+        stream_export(AsyncSessionLocal, user.id, since, until, gzip),
+        media_type="application/gzip" if gzip else "application/x-ndjson",
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@app.get("/api/search")
+async def search_messages(
+    q: str = Query(..., min_length=1, max_length=256),
+    limit: int = Query(20, ge=1, le=MAX_SEARCH_PAGE_SIZE),
+    offset: int = Query(0, ge=0, le=MAX_SEARCH_OFFSET),
+    db: AsyncSession = Depends(get_read_db),
+    user: Principal = Depends(get_current_user),
+):
+    # Ranked full-text search over the current user's messages, with highlighted snippets.
+    hits, has_more = await search_index.search(db, user.id, q, limit, offset)
+    return {
+        "query": q,
+        "results": [
+            {
+                "message_id": h.message_id,
+                "session_id": h.session_id,
+                "role": h.role,
+                "created_at": h.created_at.isoformat(),
+                "rank": h.rank,
+                "snippet": h.snippet,
+            }
+            for h in hits
+        ],
+        "has_more": has_more,
+        "next_offset": offset + len(hits) if has_more else None,
+    }
+
+@app.exception_handler(HashingBusyError)
+async def hashing_busy_handler(request: Request, exc: HashingBusyError):
+    # Auth load is shed instead of queueing behind (and starving) chat traffic.
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"code": "AUTH_BUSY", "message": "Too many sign-in attempts, retry shortly."}},
+        headers={"Retry-After": "1"},
+    )
+
+@app.exception_handler(SchedulerBusyError)
+async def scheduler_busy_handler(request: Request, exc: SchedulerBusyError):
+    # Backpressure: fail fast with a retry hint rather than hang behind the provider.
+    return JSONResponse(
+        status_code=503,
+        content={"error": {"code": "LLM_BUSY", "message": "The assistant is busy, retry shortly."}},
+        headers={"Retry-After": str(int(exc.retry_after))},
+    )
+
+@app.exception_handler(IdempotencyConflictError)
+async def idempotency_conflict_handler(request: Request, exc: IdempotencyConflictError):
+    # Replaying the earlier reply for a different body would silently answer the wrong message.
+    return JSONResponse(
+        status_code=422,
+        content={"error": {"code": "IDEMPOTENCY_KEY_REUSED", "message": "This Idempotency-Key was already used with a different request body."}},
+    )
+
+@app.exception_handler(LLMError)
+async def llm_error_handler(request: Request, exc: LLMError):
+    # Upstream LLM failures are not our 500s; an open breaker tells clients when to retry.
+    if isinstance(exc, CircuitOpenError):
+        return JSONResponse(
+            status_code=503,
+            content={"error": {"code": "LLM_UNAVAILABLE", "message": "The assistant is temporarily unavailable."}},
+            headers={"Retry-After": str(int(exc.retry_after))},
+        )
+    return JSONResponse(
+        status_code=502,
+        content={"error": {"code": "LLM_ERROR", "message": "The assistant failed to reply."}},
+    )
+
 @app.exception_handler(Exception)
 async def unhandled_exception_handler(request: Request, exc: Exception):
     # Ensure CORS headers are set even on unhandled errors.
@@ -291,26 +976,34 @@ async def unhandled_exception_handler(request: Request, exc: Exception):
     return resp
 
 @app.post("/api/auth/signup")
-def signup(payload: SignUpIn, db: Session = Depends(get_db)):
+async def signup(payload: SignUpIn, db: AsyncSession = Depends(get_db)):
     # Register a new user if the email is not taken.
-    exists = db.execute(select(User).where(User.email == payload.email)).scalar_one_or_none()
+    exists = (await db.execute(select(User).where(User.email == payload.email))).scalar_one_or_none()
     if exists:
         raise HTTPException(status_code=409, detail="Email already registered")
 
-    u = User(email=payload.email, password_hash=hash_password(payload.password))
+    # bcrypt is CPU-bound; it runs in the bounded hashing pool.
+    password_hash = await hash_password_async(payload.password)
+    u = User(id=new_id(), email=payload.email, password_hash=password_hash, created_at=datetime.utcnow())
     db.add(u)
-    db.commit()
-    db.refresh(u)
+    await db.commit()
 
     token = create_access_token(u.id)
     return {"access_token": token, "user": {"id": u.id, "email": u.email}}
 
 @app.post("/api/auth/login")
-def login(payload: LoginIn, db: Session = Depends(get_db)):
+async def login(payload: LoginIn, db: AsyncSession = Depends(get_db)):
     # Verify credentials and return an access token.
-    u = db.execute(select(User).where(User.email == payload.email)).scalar_one_or_none()
-    if not u or not verify_password(payload.password, u.password_hash):
+    u = (await db.execute(select(User).where(User.email == payload.email))).scalar_one_or_none()
+    if not u:
+        raise HTTPException(status_code=401, detail="Invalid email or password")
+    ok, new_hash = await verify_password_async(payload.password, u.password_hash)
+    if not ok:
         raise HTTPException(status_code=401, detail="Invalid email or password")
+    if new_hash:
+        # Cost parameters changed since this hash was made: upgrade it in place.
+        u.password_hash = new_hash
+        await db.commit()
 
     token = create_access_token(u.id)
     return {"access_token": token, "user": {"id": u.id, "email": u.email}}
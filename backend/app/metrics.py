@@ -0,0 +1,208 @@
+"""
+In-process metrics in the Prometheus text exposition format.
+
+Counters and histograms are kept per worker (scrape each worker, or run a
+single worker per container). `stage(name)` times a hot-path step into the
+`stage_duration_seconds` histogram and also records it for the request's
+`Server-Timing` header.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterable, Optional
+
+# Seconds; covers sub-millisecond Redis calls up to slow LLM replies.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = tuple[str, ...]
+
+def _format_labels(names: tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self._values: dict[LabelValues, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = list(self._values.items())
+        for values, v in items:
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(v)}"
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [bucket counts..., +Inf count, sum]
+        self._values: dict[LabelValues, list[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            row = self._values.get(key)
+            if row is None:
+                row = self._values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            for i, upper in enumerate(self.buckets):
+                if value <= upper:
+                    row[i] += 1
+            row[len(self.buckets)] += 1
+            row[-1] += value
+
+    def samples(self) -> Iterable[str]:
+        with self._lock:
+            items = [(k, list(v)) for k, v in self._values.items()]
+        for values, row in items:
+            for i, upper in enumerate(self.buckets + (float("inf"),)):
+                le = f'le="{_format_value(upper)}"'
+                yield f"{self.name}_bucket{_format_labels(self.labelnames, values, le)} {row[i]}"
+            yield f"{self.name}_sum{_format_labels(self.labelnames, values)} {_format_value(row[-1])}"
+            yield f"{self.name}_count{_format_labels(self.labelnames, values)} {row[len(self.buckets)]}"
+
+class CallbackMetric:
+    """
+    Read at scrape time from existing state (pool status, stats dicts).
+    `fn` returns {label values tuple: value}.
+    """
+
+    def __init__(self, name: str, help: str, kind: str, labelnames: tuple[str, ...], fn: Callable[[], dict]):
+        self.name = name
+        self.help = help
+        self.kind = kind
+        self.labelnames = labelnames
+        self.fn = fn
+
+    def samples(self) -> Iterable[str]:
+        for values, v in self.fn().items():
+            yield f"{self.name}{_format_labels(self.labelnames, values)} {_format_value(v)}"
+
+class Registry:
+    def __init__(self):
+        self._metrics: dict[str, object] = {}
+
+    def _add(self, metric):
+        # Re-registering returns the existing metric (modules may be re-imported in tests).
+        return self._metrics.setdefault(metric.name, metric)
+
+    def counter(self, name: str, help: str, labelnames: tuple[str, ...] = ()) -> Counter:
+        return self._add(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: tuple[str, ...] = (), buckets: tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._add(Histogram(name, help, labelnames, buckets))
+
+    def callback(self, name: str, help: str, kind: str, labelnames: tuple[str, ...], fn: Callable[[], dict]) -> CallbackMetric:
+        # Callbacks are replaced so the latest owner wins.
+        metric = CallbackMetric(name, help, kind, labelnames, fn)
+        self._metrics[name] = metric
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            try:
+                lines.extend(metric.samples())
+            except Exception:
+                # A broken callback must not take the whole scrape down.
+                continue
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+stage_duration = registry.histogram(
+    "stage_duration_seconds", "Time spent in a hot-path stage.", ("stage",)
+)
+http_request_duration = registry.histogram(
+    "http_request_duration_seconds", "HTTP request latency (until the response starts).", ("method", "route", "status")
+)
+
+# Per-request {stage: total seconds} for the Server-Timing header.
+_timings: ContextVar[Optional[dict[str, float]]] = ContextVar("server_timings", default=None)
+
+def record_stage(name: str, seconds: float):
+    stage_duration.observe(seconds, stage=name)
+    timings = _timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + seconds
+
+@contextmanager
+def stage(name: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_stage(name, time.perf_counter() - start)
+
+def server_timing_header(timings: dict[str, float], total: float) -> str:
+    parts = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in timings.items()]
+    parts.append(f"total;dur={total * 1000:.1f}")
+    return ", ".join(parts)
+
+class MetricsMiddleware:
+    """
+    ASGI middleware: times each request, labels it by route template, and adds
+    a Server-Timing header with the stages recorded before the response started.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timings: dict[str, float] = {}
+        token = _timings.set(timings)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                elapsed = time.perf_counter() - start
+                headers = list(message.get("headers", []))
+                headers.append((b"server-timing", server_timing_header(timings, elapsed).encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            http_request_duration.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+            _timings.reset(token)
@@ -1,17 +1,21 @@
-import uuid
 from datetime import datetime
-from sqlalchemy import String, Text, DateTime, ForeignKey, Integer
+from sqlalchemy import BigInteger, Boolean, LargeBinary, String, Text, DateTime, ForeignKey, Index, Integer, Uuid, false
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 
 from .db import Base
+from .ids import new_id
+
+# Native 16-byte uuid on Postgres; SQLite keeps the 36-char text it always had.
+# Values are str either way.
+UUIDKey = Uuid(as_uuid=False).with_variant(String(36), "sqlite")
 
 class User(Base):
     __tablename__ = "users"
 
     id: Mapped[str] = mapped_column(
-        String(36),
+        UUIDKey,
         primary_key=True,
-        default=lambda: str(uuid.uuid4())
+        default=new_id
     )
 
     email: Mapped[str] = mapped_column(String(255), unique=True, index=True)
@@ -22,19 +26,31 @@ class User(Base):
 
 class ChatSession(Base):
     __tablename__ = "chat_sessions"
+    __table_args__ = (
+        # Keyset pagination of a user's sessions (also serves user_id lookups);
+        # covers the session list, which reads only id and created_at.
+        Index("ix_chat_sessions_user_id_created_at", "user_id", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(
-        String(36),
+        UUIDKey,
         primary_key=True,
-        default=lambda: str(uuid.uuid4())
+        default=new_id
     )
-    user_id: Mapped[str | None] = mapped_column(String(36), ForeignKey("users.id"), index=True, nullable=True)
+    user_id: Mapped[str | None] = mapped_column(UUIDKey, ForeignKey("users.id"), nullable=True)
 
     
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
         default=datetime.utcnow
     )
+    # Set while the session's messages live in chat_session_archives.
+    archived_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
+    # Rolling summary of the conversation up to and including summary_message_id.
+    summary: Mapped[str | None] = mapped_column(Text, nullable=True)
+    summary_message_id: Mapped[str | None] = mapped_column(UUIDKey, nullable=True)
+    summary_tokens: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    summary_updated_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     user: Mapped["User"] = relationship(back_populates="sessions")
     
@@ -45,24 +61,31 @@ class ChatSession(Base):
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
+    __table_args__ = (
+        # Keyset pagination of history (also serves session_id lookups).
+        Index("ix_chat_messages_session_id_created_at", "session_id", "created_at", "id"),
+    )
 
     id: Mapped[str] = mapped_column(
-        String(36),
+        UUIDKey,
         primary_key=True,
-        default=lambda: str(uuid.uuid4())
+        default=new_id
     )
 
     session_id: Mapped[str] = mapped_column(
-        String(36),
-        ForeignKey("chat_sessions.id"),
-        index=True
+        UUIDKey,
+        ForeignKey("chat_sessions.id")
     )
 
     role: Mapped[str] = mapped_column(String(16))
     content: Mapped[str] = mapped_column(Text)
+    # Computed once at insert so context building never re-tokenizes history.
+    token_count: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
 
+    # Part of the key: on Postgres the table is range-partitioned by month on it.
     created_at: Mapped[datetime] = mapped_column(
         DateTime,
+        primary_key=True,
         default=datetime.utcnow
     )
 
@@ -72,22 +95,31 @@ class ChatMessage(Base):
 
 class LLMUsage(Base):
     __tablename__ = "llm_usage"
+    __table_args__ = (
+        # Per-session usage listing, served from the index alone on Postgres.
+        Index(
+            "ix_llm_usage_session_id_created_at",
+            "session_id",
+            "created_at",
+            postgresql_include=["message_id", "provider", "model", "prompt_tokens", "completion_tokens", "total_tokens", "cache_hit"],
+        ),
+    )
 
     id: Mapped[str] = mapped_column(
-        String(36),
+        UUIDKey,
         primary_key=True,
-        default=lambda: str(uuid.uuid4())
+        default=new_id
     )
 
     session_id: Mapped[str] = mapped_column(
-        String(36),
-        ForeignKey("chat_sessions.id"),
-        index=True
+        UUIDKey,
+        ForeignKey("chat_sessions.id")
     )
 
+    # No foreign key: chat_messages is partitioned (its key includes created_at)
+    # and archived messages leave the table while their usage stays.
     message_id: Mapped[str] = mapped_column(
-        String(36),
-        ForeignKey("chat_messages.id"),
+        UUIDKey,
         index=True
     )
 
@@ -96,5 +128,44 @@ class LLMUsage(Base):
     prompt_tokens: Mapped[int] = mapped_column(Integer, default=0)
     completion_tokens: Mapped[int] = mapped_column(Integer, default=0)
     total_tokens: Mapped[int] = mapped_column(Integer, default=0)
-
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
\ No newline at end of file
+    # Served from the response cache; tokens are what the provider would have billed.
+    cache_hit: Mapped[bool] = mapped_column(Boolean, default=False, server_default=false())
+
+    # Partition key on Postgres, hence part of the primary key.
+    created_at: Mapped[datetime] = mapped_column(DateTime, primary_key=True, default=datetime.utcnow)
+
+class SessionArchive(Base):
+    """
+    Messages of an idle session, moved out of chat_messages as one
+    zlib-compressed JSON array. Restored on the next read or write.
+    """
+    __tablename__ = "chat_session_archives"
+
+    session_id: Mapped[str] = mapped_column(UUIDKey, ForeignKey("chat_sessions.id"), primary_key=True)
+    message_count: Mapped[int] = mapped_column(Integer)
+    last_message_at: Mapped[datetime] = mapped_column(DateTime)
+    payload: Mapped[bytes] = mapped_column(LargeBinary)
+    archived_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.utcnow)
+
+class UsageRollup(Base):
+    """
+    Pre-aggregated LLMUsage per (granularity, bucket, user, session, model),
+    maintained incrementally on every usage write.
+
+    session_id "*" holds the user's total across all sessions, so per-user
+    billing views read O(buckets) rows.
+    """
+    __tablename__ = "usage_rollups"
+
+    granularity: Mapped[str] = mapped_column(String(8), primary_key=True)  # hour/day
+    # Text, not uuid: session_id also holds the "*" total.
+    user_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    session_id: Mapped[str] = mapped_column(String(36), primary_key=True)
+    bucket_start: Mapped[datetime] = mapped_column(DateTime, primary_key=True)
+    model: Mapped[str] = mapped_column(String(64), primary_key=True)
+
+    requests: Mapped[int] = mapped_column(BigInteger, default=0)
+    prompt_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    completion_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    total_tokens: Mapped[int] = mapped_column(BigInteger, default=0)
+    cache_hits: Mapped[int] = mapped_column(BigInteger, default=0)
@@ -0,0 +1,86 @@
+import base64
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Optional
+
+from sqlalchemy import Select, tuple_
+
+def encode_cursor(created_at: datetime, row_id: str) -> str:
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[datetime, str]:
+    # Raises ValueError for anything that is not a cursor we produced.
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        created_at, row_id = base64.urlsafe_b64decode(padded).decode().split("|", 1)
+        uuid.UUID(row_id)  # keys are native uuids on Postgres
+        return datetime.fromisoformat(created_at), row_id
+    except Exception as exc:
+        raise ValueError("invalid cursor") from exc
+
+@dataclass
+class Page:
+    rows: list[Any]  # oldest first
+    has_more: bool   # more rows exist in the direction that was paged
+
+    def before_cursor(self, created_attr: str = "created_at") -> Optional[str]:
+        if not self.rows:
+            return None
+        first = self.rows[0]
+        return encode_cursor(getattr(first, created_attr), first.id)
+
+    def after_cursor(self, created_attr: str = "created_at") -> Optional[str]:
+        if not self.rows:
+            return None
+        last = self.rows[-1]
+        return encode_cursor(getattr(last, created_attr), last.id)
+
+def keyset_page(
+    stmt: Select,
+    created_col,
+    id_col,
+    limit: int,
+    before: Optional[str] = None,
+    after: Optional[str] = None,
+) -> tuple[Select, bool]:
+    """
+    Apply a (created_at, id) keyset window to `stmt`.
+
+    `after` pages towards newer rows, otherwise (with or without `before`)
+    towards older rows starting from the newest. Fetches limit + 1 rows so the
+    caller can tell whether another page exists. Returns the statement and
+    whether its rows come back newest first.
+    """
+    key = tuple_(created_col, id_col)
+    if after:
+        stmt = stmt.where(key > tuple_(*decode_cursor(after)))
+        return stmt.order_by(created_col.asc(), id_col.asc()).limit(limit + 1), False
+
+    if before:
+        stmt = stmt.where(key < tuple_(*decode_cursor(before)))
+    return stmt.order_by(created_col.desc(), id_col.desc()).limit(limit + 1), True
+
+def keyset_overlap(stmt: Select, created_col, id_col, cursor: str, window: timedelta, limit: int) -> Select:
+    """
+    Rows up to `window` behind `cursor` (exclusive), oldest first.
+
+    A row stamped before a concurrent one but committed after it lands just
+    behind a cursor a client already holds; re-reading this window delivers
+    it late instead of never. Callers dedupe by id.
+    """
+    created_at, row_id = decode_cursor(cursor)
+    return (
+        stmt.where(tuple_(created_col, id_col) < tuple_(created_at, row_id), created_col >= created_at - window)
+        .order_by(created_col.asc(), id_col.asc())
+        .limit(limit)
+    )
+
+def to_page(rows: list[Any], limit: int, newest_first: bool) -> Page:
+    rows = list(rows)
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if newest_first:
+        rows.reverse()
+    return Page(rows=rows, has_more=has_more)
@@ -0,0 +1,84 @@
+"""
+Monthly range partitions for chat_messages and llm_usage (Postgres).
+
+The migration converts both tables to `PARTITION BY RANGE (created_at)` with
+one partition per month plus a DEFAULT partition. Partitions must exist
+before rows for that month arrive, so `ensure_partitions` creates the
+current and next few months; it runs at startup and from the archive job.
+On SQLite or unpartitioned tables (create_all) it does nothing.
+"""
+import logging
+import os
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import text
+from sqlalchemy.engine import Connection
+
+logger = logging.getLogger(__name__)
+
+PARTITIONED_TABLES = ("chat_messages", "llm_usage")
+PARTITION_MONTHS_AHEAD = int(os.getenv("PARTITION_MONTHS_AHEAD", "2"))
+
+def month_start(ts: datetime) -> datetime:
+    return ts.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def add_months(month: datetime, n: int) -> datetime:
+    index = month.year * 12 + month.month - 1 + n
+    return month.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(table: str, month: datetime) -> str:
+    return f"{table}_y{month:%Y}m{month:%m}"
+
+def is_partitioned(conn: Connection, table: str) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(
+        text(
+            "SELECT 1 FROM pg_partitioned_table p JOIN pg_class c ON c.oid = p.partrelid "
+            "WHERE c.relname = :table AND pg_table_is_visible(c.oid)"
+        ),
+        {"table": table},
+    ).first() is not None
+
+def ensure_partitions(conn: Connection, now: Optional[datetime] = None, months_ahead: int = PARTITION_MONTHS_AHEAD):
+    # Create this month's and the next `months_ahead` partitions (idempotent).
+    month = month_start(now or datetime.utcnow())
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            continue
+        for i in range(months_ahead + 1):
+            start = add_months(month, i)
+            name = partition_name(table, start)
+            try:
+                with conn.begin_nested():
+                    conn.execute(text(
+                        f"CREATE TABLE IF NOT EXISTS {name} PARTITION OF {table} "
+                        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{add_months(start, 1):%Y-%m-%d}')"
+                    ))
+            except Exception:
+                # Usually rows for that month already sit in the DEFAULT partition.
+                logger.warning("could not create partition %s", name, exc_info=True)
+
+def drop_empty_partitions(conn: Connection, before: datetime) -> list[str]:
+    # Drop monthly partitions that end before `before` and hold no rows (e.g. fully archived).
+    dropped = []
+    for table in PARTITIONED_TABLES:
+        if not is_partitioned(conn, table):
+            continue
+        children = conn.execute(
+            text(
+                "SELECT c.relname FROM pg_inherits i "
+                "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+                "WHERE p.relname = :table AND c.relname LIKE :pattern"
+            ),
+            {"table": table, "pattern": f"{table}_y%"},
+        ).scalars().all()
+        for name in sorted(children):
+            month = datetime.strptime(name[len(table) + 2:], "%Ym%m")
+            if add_months(month, 1) > before:
+                continue
+            if conn.execute(text(f"SELECT 1 FROM {name} LIMIT 1")).first() is None:
+                conn.execute(text(f"DROP TABLE {name}"))
+                dropped.append(name)
+    return dropped
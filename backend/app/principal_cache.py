@@ -0,0 +1,124 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+import redis
+
+from .cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", "60"))
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_REDIS = os.getenv("PRINCIPAL_CACHE_REDIS", "0") == "1"
+
+@dataclass(frozen=True)
+class Principal:
+    # The identity handlers need; resolved from the token without touching Postgres.
+    id: str
+    email: str
+
+def token_key(token: str) -> str:
+    # Never keep raw bearer tokens as cache keys.
+    return hashlib.sha256(token.encode()).hexdigest()
+
+class PrincipalCache:
+    """
+    Token -> Principal cache.
+
+    Tier 1 is a per-worker TTL LRU; tier 2 (optional) is Redis, shared by all
+    workers. Entries never outlive the token's own `exp`. Local invalidation
+    only reaches this worker; other workers drop the entry within the TTL.
+    """
+
+    def __init__(self, maxsize: int, ttl: int, redis_client=None):
+        self.ttl = ttl
+        self.local = TTLCache(maxsize=maxsize, ttl=ttl, on_evict=self._forget)
+        self.redis = redis_client
+        # user_id -> token hashes of locally cached entries, so a user can be
+        # invalidated as a whole; pruned as the LRU evicts, so it stays bounded.
+        self._by_user: dict[str, set[str]] = {}
+
+    async def get(self, token: str) -> Optional[Principal]:
+        key = token_key(token)
+        principal = self.local.get(key)
+        if principal is not None or self.redis is None:
+            return principal
+
+        try:
+            raw = await self.redis.get(f"principal:{key}")
+        except redis.RedisError:
+            logger.warning("principal cache: redis get failed", exc_info=True)
+            return None
+        if raw is None:
+            return None
+        data = json.loads(raw)
+        exp = data.pop("exp", None)
+        principal = Principal(**data)
+        # Never cache locally past the token's own expiry.
+        ttl = min(self.ttl, int(exp - time.time())) if exp is not None else self.ttl
+        if ttl <= 0:
+            return None
+        self._remember(key, principal, ttl)
+        return principal
+
+    async def set(self, token: str, principal: Principal, exp: int):
+        ttl = min(self.ttl, int(exp - time.time()))
+        if ttl <= 0:
+            return
+        key = token_key(token)
+        self._remember(key, principal, ttl)
+        if self.redis is None:
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipe:
+                pipe.set(f"principal:{key}", json.dumps({**asdict(principal), "exp": exp}), ex=ttl)
+                pipe.sadd(f"principal:user:{principal.id}", key)
+                pipe.expire(f"principal:user:{principal.id}", self.ttl)
+                await pipe.execute()
+        except redis.RedisError:
+            logger.warning("principal cache: redis set failed", exc_info=True)
+
+    async def invalidate_token(self, token: str):
+        key = token_key(token)
+        principal = self.local.pop(key)
+        if principal is not None:
+            self._forget(key, principal)
+        if self.redis is not None:
+            await self.redis.delete(f"principal:{key}")
+
+    async def invalidate_user(self, user_id: str):
+        # Call after anything that changes who a user is (password, email, deletion).
+        for key in self._by_user.pop(user_id, set()):
+            self.local.pop(key)
+        if self.redis is None:
+            return
+
+        index_key = f"principal:user:{user_id}"
+        keys = await self.redis.smembers(index_key)
+        await self.redis.delete(index_key, *[f"principal:{k}" for k in keys])
+
+    def _remember(self, key: str, principal: Principal, ttl: int):
+        self._by_user.setdefault(principal.id, set()).add(key)
+        self.local.set(key, principal, ttl=ttl)
+
+    def _forget(self, key: str, principal: Principal):
+        keys = self._by_user.get(principal.id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[principal.id]
+
+def build_principal_cache() -> PrincipalCache:
+    redis_client = None
+    if PRINCIPAL_CACHE_REDIS:
+        from .redis_client import ar
+        redis_client = ar
+    return PrincipalCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL, redis_client)
+
+principal_cache = build_principal_cache()
@@ -1,10 +1,25 @@
+import asyncio
+import math
 import os
 import time
 import redis
 from dataclasses import dataclass
+from typing import Optional
 
-REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
-r = redis.Redis.from_url(REDIS_URL, decode_responses=True)
+from .cache import TTLCache
+from .metrics import registry, stage
+from .redis_client import ar, r
+
+
+# fixed_window / sliding_window / gcra
+RATE_LIMIT_ALGORITHM = os.getenv("RATE_LIMIT_ALGORITHM", "gcra")
+
+# 本地层：最近被拒绝的 key 直接在进程内拒绝，直到 reset；Redis 慢/挂时用本地计数兜底
+LOCAL_DENY_CACHE_SIZE = int(os.getenv("RATE_LIMIT_LOCAL_DENY_SIZE", "10000"))
+LOCAL_COUNTER_SIZE = int(os.getenv("RATE_LIMIT_LOCAL_COUNTER_SIZE", "100000"))
+REDIS_LATENCY_BUDGET_MS = int(os.getenv("RATE_LIMIT_REDIS_BUDGET_MS", "50"))
+# Redis 出错后多久内直接走本地兜底，不再每个请求都去撞
+REDIS_RETRY_AFTER_MS = int(os.getenv("RATE_LIMIT_REDIS_RETRY_MS", "1000"))
 
 @dataclass
 class RateLimitResult:
@@ -13,6 +28,12 @@ class RateLimitResult:
     remaining: int
     reset_seconds: int  # 还要多久窗口重置
 
+@dataclass
+class RateLimitRule:
+    key: str
+    limit: int
+    window_seconds: int
+
 def fixed_window_limit(key: str, limit: int, window_seconds: int) -> RateLimitResult:
     """
     固定窗口限流：
@@ -30,6 +51,9 @@ def fixed_window_limit(key: str, limit: int, window_seconds: int) -> RateLimitRe
         r.expire(redis_key, window_seconds)
 
     ttl = r.ttl(redis_key)
+    return _window_result(count, ttl, limit, window_seconds)
+
+def _window_result(count: int, ttl: int, limit: int, window_seconds: int) -> RateLimitResult:
     # ttl 可能为 -1 / -2，做个兜底
     reset_seconds = ttl if ttl and ttl > 0 else window_seconds
 
@@ -42,3 +66,265 @@ def fixed_window_limit(key: str, limit: int, window_seconds: int) -> RateLimitRe
         remaining=remaining,
         reset_seconds=reset_seconds
     )
+
+# ---------------------------------------------------------------------------
+# 多 key 原子限流：一次 EVALSHA 检查所有 key（ip + session + user）。
+# 任意一个 key 超限则整体拒绝，且不消耗其它 key 的额度。
+#
+# 所有脚本约定：KEYS = 每条规则一个 key，ARGV = limit1, window1, limit2, window2, ...
+# 返回 {allowed, limit, remaining, reset_seconds, rule_index}，取最严格的那条规则。
+# 时间取 Redis TIME，多个 worker 之间没有时钟偏差。
+# ---------------------------------------------------------------------------
+
+_LUA_NOW_MS = """
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+_LUA_PICK = """
+local function pick(results)
+  local best = nil
+  for i = 1, #results do
+    local res = results[i]
+    if best == nil then
+      best = res
+    elseif res[1] == 0 and (best[1] == 1 or res[4] > best[4]) then
+      best = res
+    elseif res[1] == best[1] and res[1] == 1 and res[3] < best[3] then
+      best = res
+    end
+  end
+  return best
+end
+"""
+
+# 固定窗口：窗口从第一次命中开始，过期自动清空。
+FIXED_WINDOW_LUA = _LUA_NOW_MS + _LUA_PICK + """
+local results, allowed = {}, true
+for i = 1, #KEYS do
+  local limit = tonumber(ARGV[2 * i - 1])
+  local window_ms = tonumber(ARGV[2 * i]) * 1000
+  local count = tonumber(redis.call('GET', KEYS[i]) or '0')
+  local ttl = redis.call('PTTL', KEYS[i])
+  if ttl < 0 then ttl = window_ms end
+  local ok = count + 1 <= limit
+  if not ok then allowed = false end
+  results[i] = {ok and 1 or 0, limit, math.max(0, limit - count - 1), math.ceil(ttl / 1000), i}
+end
+if allowed then
+  for i = 1, #KEYS do
+    if redis.call('INCR', KEYS[i]) == 1 then
+      redis.call('PEXPIRE', KEYS[i], tonumber(ARGV[2 * i]) * 1000)
+    end
+  end
+end
+return pick(results)
+"""
+
+# 滑动窗口（sliding log）：ZSET 记录窗口内每次请求的时间戳，没有窗口边界的 2x 突发。
+SLIDING_WINDOW_LUA = _LUA_NOW_MS + _LUA_PICK + """
+local results, allowed = {}, true
+for i = 1, #KEYS do
+  local limit = tonumber(ARGV[2 * i - 1])
+  local window_ms = tonumber(ARGV[2 * i]) * 1000
+  redis.call('ZREMRANGEBYSCORE', KEYS[i], '-inf', now - window_ms)
+  local count = redis.call('ZCARD', KEYS[i])
+  local reset_ms = window_ms
+  local oldest = redis.call('ZRANGE', KEYS[i], 0, 0, 'WITHSCORES')
+  if oldest[2] then reset_ms = tonumber(oldest[2]) + window_ms - now end
+  local ok = count + 1 <= limit
+  if not ok then allowed = false end
+  results[i] = {ok and 1 or 0, limit, math.max(0, limit - count - 1), math.max(1, math.ceil(reset_ms / 1000)), i}
+end
+if allowed then
+  for i = 1, #KEYS do
+    local window_ms = tonumber(ARGV[2 * i]) * 1000
+    redis.call('ZADD', KEYS[i], now, now .. '-' .. redis.call('ZCARD', KEYS[i]))
+    redis.call('PEXPIRE', KEYS[i], window_ms)
+  end
+end
+return pick(results)
+"""
+
+# GCRA（等价于令牌桶）：每个 key 只存一个 TAT（theoretical arrival time），O(1) 内存。
+GCRA_LUA = _LUA_NOW_MS + _LUA_PICK + """
+local results, allowed, tats = {}, true, {}
+for i = 1, #KEYS do
+  local limit = tonumber(ARGV[2 * i - 1])
+  local window_ms = tonumber(ARGV[2 * i]) * 1000
+  local interval = window_ms / limit
+  local tat = tonumber(redis.call('GET', KEYS[i]) or '0')
+  if tat < now then tat = now end
+  local new_tat = tat + interval
+  local ok = new_tat - now <= window_ms
+  if ok then
+    tats[i] = new_tat
+    results[i] = {1, limit, math.floor((window_ms - (new_tat - now)) / interval), math.ceil((new_tat - now) / 1000), i}
+  else
+    allowed = false
+    results[i] = {0, limit, 0, math.max(1, math.ceil((new_tat - now - window_ms) / 1000)), i}
+  end
+end
+if allowed then
+  for i = 1, #KEYS do
+    redis.call('SET', KEYS[i], tats[i], 'PX', math.ceil(tats[i] - now))
+  end
+end
+return pick(results)
+"""
+
+_LUA_SCRIPTS = {
+    "fixed_window": FIXED_WINDOW_LUA,
+    "sliding_window": SLIDING_WINDOW_LUA,
+    "gcra": GCRA_LUA,
+}
+
+# register_script: 调用时走 EVALSHA，脚本不在缓存里（NOSCRIPT）才回退 SCRIPT LOAD
+_scripts = {name: r.register_script(src) for name, src in _LUA_SCRIPTS.items()}
+_async_scripts = {name: ar.register_script(src) for name, src in _LUA_SCRIPTS.items()}
+
+def _script_args(rules: list[RateLimitRule], algorithm: str) -> tuple[list[str], list[int]]:
+    if algorithm not in _LUA_SCRIPTS:
+        raise ValueError(f"unknown rate limit algorithm: {algorithm}")
+    keys = [f"rl:{algorithm}:{rule.key}" for rule in rules]
+    args: list[int] = []
+    for rule in rules:
+        args += [rule.limit, rule.window_seconds]
+    return keys, args
+
+def _script_result(raw) -> tuple[RateLimitResult, int]:
+    allowed, limit, remaining, reset_seconds, index = (int(v) for v in raw)
+    result = RateLimitResult(
+        allowed=allowed == 1,
+        limit=limit,
+        remaining=remaining,
+        reset_seconds=reset_seconds,
+    )
+    return result, index - 1
+
+class LocalRateLimiter:
+    """
+    进程内的限流层（每个 worker 一份）：
+    - denied：最近被 Redis 拒绝的 key（有界 LRU），reset 之前本地直接拒绝，不走网络
+    - counters：Redis 超出延迟预算或不可用时的近似固定窗口计数（按 worker 计，偏宽松）
+    - stats：每一层各决定了多少次
+    """
+
+    def __init__(self, deny_size: int, counter_size: int):
+        self.denied = TTLCache(maxsize=deny_size)
+        self.counters = TTLCache(maxsize=counter_size)
+        self.redis_down_until = 0.0
+        self.stats = {"local_deny": 0, "redis": 0, "fallback": 0}
+
+    def check_denied(self, rules: list[RateLimitRule]) -> Optional[RateLimitResult]:
+        now = time.time()
+        for rule in rules:
+            reset_at = self.denied.get(rule.key)
+            if reset_at is not None:
+                self.stats["local_deny"] += 1
+                return RateLimitResult(
+                    allowed=False,
+                    limit=rule.limit,
+                    remaining=0,
+                    reset_seconds=max(1, math.ceil(reset_at - now)),
+                )
+        return None
+
+    def remember(self, rule: RateLimitRule, result: RateLimitResult):
+        if not result.allowed:
+            self.denied.set(rule.key, time.time() + result.reset_seconds, ttl=result.reset_seconds)
+
+    def redis_available(self) -> bool:
+        return time.monotonic() >= self.redis_down_until
+
+    def mark_redis_down(self):
+        self.redis_down_until = time.monotonic() + REDIS_RETRY_AFTER_MS / 1000
+
+    def fallback(self, rules: list[RateLimitRule]) -> RateLimitResult:
+        # 近似固定窗口：先全部检查，都通过才计数（和 Lua 脚本语义一致）
+        self.stats["fallback"] += 1
+        now = time.time()
+        checks = []
+        for rule in rules:
+            window_id = int(now // rule.window_seconds)
+            key = (rule.key, window_id)
+            count = self.counters.get(key, 0)
+            reset_seconds = max(1, math.ceil((window_id + 1) * rule.window_seconds - now))
+            checks.append((rule, key, count, reset_seconds))
+
+        denied = [c for c in checks if c[2] + 1 > c[0].limit]
+        if denied:
+            rule, _, _, reset_seconds = max(denied, key=lambda c: c[3])
+            return RateLimitResult(allowed=False, limit=rule.limit, remaining=0, reset_seconds=reset_seconds)
+
+        for rule, key, count, reset_seconds in checks:
+            self.counters.set(key, count + 1, ttl=reset_seconds)
+        rule, _, count, reset_seconds = min(checks, key=lambda c: c[0].limit - c[2])
+        return RateLimitResult(
+            allowed=True,
+            limit=rule.limit,
+            remaining=max(0, rule.limit - count - 1),
+            reset_seconds=reset_seconds,
+        )
+
+local_limiter = LocalRateLimiter(LOCAL_DENY_CACHE_SIZE, LOCAL_COUNTER_SIZE)
+
+def tier_stats() -> dict:
+    return dict(local_limiter.stats)
+
+rate_limit_decisions = registry.counter(
+    "rate_limit_decisions_total", "Rate-limit decisions by deciding tier.", ("tier", "result")
+)
+
+def _decided(tier: str, result: RateLimitResult) -> RateLimitResult:
+    rate_limit_decisions.inc(tier=tier, result="allowed" if result.allowed else "denied")
+    return result
+
+def multi_key_limit(rules: list[RateLimitRule], algorithm: str = RATE_LIMIT_ALGORITHM) -> RateLimitResult:
+    """
+    在一次 Redis 往返里原子地检查多条规则，返回最严格的结果
+    """
+    keys, args = _script_args(rules, algorithm)
+    local = local_limiter.check_denied(rules)
+    if local:
+        return _decided("local_deny", local)
+    if not local_limiter.redis_available():
+        return _decided("fallback", local_limiter.fallback(rules))
+
+    try:
+        with stage("rate_limit_redis"):
+            raw = _scripts[algorithm](keys=keys, args=args)
+        result, index = _script_result(raw)
+    except redis.RedisError:
+        local_limiter.mark_redis_down()
+        return _decided("fallback", local_limiter.fallback(rules))
+
+    local_limiter.stats["redis"] += 1
+    local_limiter.remember(rules[index], result)
+    return _decided("redis", result)
+
+async def multi_key_limit_async(rules: list[RateLimitRule], algorithm: str = RATE_LIMIT_ALGORITHM) -> RateLimitResult:
+    """
+    multi_key_limit 的 async 版本；Redis 超过延迟预算也按不可用处理
+    """
+    keys, args = _script_args(rules, algorithm)
+    local = local_limiter.check_denied(rules)
+    if local:
+        return _decided("local_deny", local)
+    if not local_limiter.redis_available():
+        return _decided("fallback", local_limiter.fallback(rules))
+
+    try:
+        with stage("rate_limit_redis"):
+            raw = await asyncio.wait_for(
+                _async_scripts[algorithm](keys=keys, args=args),
+                timeout=REDIS_LATENCY_BUDGET_MS / 1000,
+            )
+    except (redis.RedisError, asyncio.TimeoutError):
+        local_limiter.mark_redis_down()
+        return _decided("fallback", local_limiter.fallback(rules))
+
+    result, index = _script_result(raw)
+    local_limiter.stats["redis"] += 1
+    local_limiter.remember(rules[index], result)
+    return _decided("redis", result)
@@ -0,0 +1,230 @@
+import asyncio
+import itertools
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import redis
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, create_async_engine
+
+from .cache import TTLCache
+from .db import AsyncSessionLocal, async_engine, instrument, pool_options, to_async_url
+from .metrics import registry
+from .redis_client import ar
+
+logger = logging.getLogger(__name__)
+
+# Comma-separated replica URLs (same form as DATABASE_URL); empty = everything on the primary.
+DATABASE_REPLICA_URLS = [u.strip() for u in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if u.strip()]
+# After a user's write, their reads stay on the primary this long (read-your-writes).
+READ_YOUR_WRITES_S = int(os.getenv("READ_YOUR_WRITES_S", "5"))
+# Replicas further behind than this (or failing) are skipped until they recover.
+REPLICA_MAX_LAG_MS = int(os.getenv("REPLICA_MAX_LAG_MS", "2000"))
+REPLICA_CHECK_INTERVAL_MS = int(os.getenv("REPLICA_CHECK_INTERVAL_MS", "2000"))
+REPLICA_RETRY_MS = int(os.getenv("REPLICA_RETRY_MS", "5000"))
+
+# 0 when the replica has replayed everything it received; NULL on a primary.
+_LAG_SQL = text(
+    "SELECT CASE WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0 "
+    "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END"
+)
+
+reads_routed = registry.counter("db_reads_total", "Read-only request sessions by target.", ("target",))
+
+class Replica:
+    def __init__(self, url: str):
+        async_url = to_async_url(url)
+        self.name = url.rsplit("@", 1)[-1]
+        self.engine: AsyncEngine = create_async_engine(async_url, pool_pre_ping=True, **pool_options(async_url))
+        instrument(self.engine.sync_engine)
+        self.lag: Optional[float] = 0.0
+        self.down_until = 0.0
+
+    def usable(self, max_lag: float) -> bool:
+        return self.down_until <= time.monotonic() and self.lag is not None and self.lag <= max_lag
+
+class FailoverSession(AsyncSession):
+    """
+    Replica session whose failed reads are re-run once on the primary.
+
+    Covers execute/scalar(s)/get; a DBAPIError from the replica marks it
+    down, rolls back and rebinds the session to the primary before the retry.
+    """
+
+    def __init__(self, router: "ReadRouter", replica: Replica, **kw):
+        super().__init__(bind=replica.engine, **kw)
+        self.router = router
+        self.replica: Optional[Replica] = replica
+
+    async def execute(self, *args, **kw):
+        return await self._read(super().execute, *args, **kw)
+
+    async def scalar(self, *args, **kw):
+        return await self._read(super().scalar, *args, **kw)
+
+    async def get(self, *args, **kw):
+        return await self._read(super().get, *args, **kw)
+
+    async def _read(self, call, *args, **kw):
+        try:
+            return await call(*args, **kw)
+        except DBAPIError:
+            if self.replica is None:
+                raise
+            await self._fail_over()
+        return await call(*args, **kw)
+
+    async def _fail_over(self):
+        replica, self.replica = self.replica, None
+        self.router._mark_down(replica)
+        try:
+            await self.rollback()
+        except DBAPIError:
+            pass  # the connection is already gone
+        self.bind = async_engine
+        self.sync_session.bind = async_engine.sync_engine
+        reads_routed.inc(target="primary_fallback")
+
+class ReadRouter:
+    """
+    Routes read-only request sessions to replicas.
+
+    A user who wrote recently (marker `rw:{user_id}` in Redis, plus a local
+    copy) reads from the primary so their new rows are visible. Replicas
+    that fail or fall behind `max_lag` are skipped; with none usable, reads
+    go to the primary. A read that fails on a replica mid-request is retried
+    on the primary (see FailoverSession). Without configured replicas this is a pass-through.
+    """
+
+    def __init__(
+        self,
+        replica_urls: list[str],
+        redis_client=None,
+        sticky_seconds: int = READ_YOUR_WRITES_S,
+        max_lag_ms: int = REPLICA_MAX_LAG_MS,
+        check_interval_ms: int = REPLICA_CHECK_INTERVAL_MS,
+        retry_ms: int = REPLICA_RETRY_MS,
+    ):
+        self.replicas = [Replica(u) for u in replica_urls]
+        self.redis = redis_client
+        self.sticky_seconds = sticky_seconds
+        self.max_lag = max_lag_ms / 1000
+        self.check_interval = check_interval_ms / 1000
+        self.retry = retry_ms / 1000
+        self._recent_writers = TTLCache(maxsize=100_000, ttl=sticky_seconds)
+        self._next = itertools.count()
+        self._monitor: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self.replicas and self._monitor is None:
+            self._monitor = asyncio.create_task(self._watch_lag())
+
+    async def close(self):
+        if self._monitor is not None:
+            self._monitor.cancel()
+            try:
+                await self._monitor
+            except asyncio.CancelledError:
+                pass
+            self._monitor = None
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    async def mark_write(self, user_id: str):
+        if not self.replicas:
+            return
+        self._recent_writers.set(user_id, True)
+        if self.redis is not None:
+            try:
+                await self.redis.set(f"rw:{user_id}", "1", ex=self.sticky_seconds)
+            except redis.RedisError:
+                logger.warning("read routing: could not set write marker", exc_info=True)
+
+    async def _sticky(self, user_id: str) -> bool:
+        if self._recent_writers.get(user_id):
+            return True
+        if self.redis is None:
+            return False
+        try:
+            return bool(await self.redis.exists(f"rw:{user_id}"))
+        except redis.RedisError:
+            # Unknown: the primary is always consistent.
+            return True
+
+    def _pick(self) -> Optional[Replica]:
+        usable = [r for r in self.replicas if r.usable(self.max_lag)]
+        if not usable:
+            return None
+        return usable[next(self._next) % len(usable)]
+
+    def _mark_down(self, replica: Replica):
+        replica.down_until = time.monotonic() + self.retry
+        logger.warning("read routing: replica %s failed, using primary for %.0fs", replica.name, self.retry)
+
+    @asynccontextmanager
+    async def session(self, user_id: Optional[str] = None):
+        # A session for read-only work: a healthy replica unless the user just wrote.
+        replica = None
+        if self.replicas and not (user_id and await self._sticky(user_id)):
+            replica = self._pick()
+
+        if replica is not None:
+            db = FailoverSession(self, replica, autoflush=False, expire_on_commit=False)
+            try:
+                # Check out (and pre-ping) a connection now so a dead replica falls back here.
+                await db.connection()
+            except (DBAPIError, OSError):
+                await db.close()
+                self._mark_down(replica)
+                replica = None
+
+        if replica is None:
+            reads_routed.inc(target="primary")
+            async with AsyncSessionLocal() as db:
+                yield db
+            return
+
+        reads_routed.inc(target="replica")
+        try:
+            yield db
+        except DBAPIError:
+            # Only reached for reads FailoverSession can't re-run (e.g. lazy loads).
+            if db.replica is not None:
+                self._mark_down(replica)
+            raise
+        finally:
+            await db.close()
+
+    async def _watch_lag(self):
+        while True:
+            for replica in self.replicas:
+                replica.lag = await self._measure_lag(replica)
+            await asyncio.sleep(self.check_interval)
+
+    async def _measure_lag(self, replica: Replica) -> Optional[float]:
+        if replica.engine.dialect.name != "postgresql":
+            return 0.0
+        try:
+            async with replica.engine.connect() as conn:
+                lag = (await conn.execute(_LAG_SQL)).scalar()
+        except Exception:
+            logger.warning("read routing: lag check failed for %s", replica.name, exc_info=True)
+            return None
+        return float(lag or 0.0)
+
+    def status(self) -> dict:
+        return {
+            r.name: {"lag_s": r.lag, "usable": r.usable(self.max_lag)}
+            for r in self.replicas
+        }
+
+read_router = ReadRouter(DATABASE_REPLICA_URLS, ar)
+
+registry.callback(
+    "db_replica_lag_seconds", "Last measured replication lag per replica (-1 = unknown).", "gauge", ("replica",),
+    lambda: {(r.name,): (r.lag if r.lag is not None else -1) for r in read_router.replicas},
+)
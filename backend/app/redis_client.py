@@ -0,0 +1,37 @@
+import os
+import redis
+import redis.asyncio
+
+REDIS_URL = os.getenv("REDIS_URL", "redis://127.0.0.1:6379/0")
+# Per-worker pool cap and timeouts (seconds); unset keeps the redis-py defaults.
+REDIS_MAX_CONNECTIONS = int(os.getenv("REDIS_MAX_CONNECTIONS", "0")) or None
+REDIS_SOCKET_TIMEOUT = float(os.getenv("REDIS_SOCKET_TIMEOUT", "0")) or None
+REDIS_CONNECT_TIMEOUT = float(os.getenv("REDIS_CONNECT_TIMEOUT", "0")) or None
+
+def _client_kwargs() -> dict:
+    kwargs = {"decode_responses": True}
+    if REDIS_MAX_CONNECTIONS:
+        kwargs["max_connections"] = REDIS_MAX_CONNECTIONS
+    if REDIS_SOCKET_TIMEOUT:
+        kwargs["socket_timeout"] = REDIS_SOCKET_TIMEOUT
+    if REDIS_CONNECT_TIMEOUT:
+        kwargs["socket_connect_timeout"] = REDIS_CONNECT_TIMEOUT
+    return kwargs
+
+r = redis.Redis.from_url(REDIS_URL, **_client_kwargs())
+# async client: handlers wait on Redis in the event loop instead of a thread
+ar = redis.asyncio.Redis.from_url(REDIS_URL, **_client_kwargs())
+
+async def prewarm(n: int):
+    # Open n pooled connections now so early requests skip the TCP/handshake cost.
+    pool = ar.connection_pool
+    conns = []
+    try:
+        for _ in range(n):
+            conn = await pool.get_connection()
+            await conn.send_command("PING")
+            await conn.read_response()
+            conns.append(conn)
+    finally:
+        for conn in conns:
+            await pool.release(conn)
@@ -0,0 +1,163 @@
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+
+from .metrics import registry
+
+# Upstream concurrency per worker; beyond it calls wait in per-user queues.
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "32"))
+LLM_MAX_QUEUE = int(os.getenv("LLM_MAX_QUEUE", "256"))
+LLM_MAX_QUEUE_PER_USER = int(os.getenv("LLM_MAX_QUEUE_PER_USER", "8"))
+# A queued call gives up (503 + Retry-After) instead of hanging past this.
+LLM_QUEUE_TIMEOUT_MS = int(os.getenv("LLM_QUEUE_TIMEOUT_MS", "10000"))
+
+queue_wait = registry.histogram(
+    "llm_queue_wait_seconds", "Time a provider call waited for a dispatch slot.", ("outcome",)
+)
+
+class SchedulerBusyError(Exception):
+    """No dispatch slot: the queue is full or the wait exceeded its deadline."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+class Ticket:
+    # A held dispatch slot; releasing twice is a no-op.
+    def __init__(self, scheduler: "FairScheduler"):
+        self.scheduler = scheduler
+        self.acquired_at = time.monotonic()
+        self.released = False
+
+    def release(self):
+        if self.released:
+            return
+        self.released = True
+        self.scheduler._release(time.monotonic() - self.acquired_at)
+
+class FairScheduler:
+    """
+    Global cap on in-flight provider calls with per-user fair queuing.
+
+    Up to `max_concurrency` calls run at once. Further callers wait in a queue
+    per user; a freed slot goes to the next user in round-robin order, so one
+    user's burst cannot starve everyone else. Waiting is bounded by
+    `max_queue` (total), `max_queue_per_user` and `queue_timeout`; beyond any
+    of them the caller gets SchedulerBusyError with a Retry-After estimate.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = LLM_MAX_CONCURRENCY,
+        max_queue: int = LLM_MAX_QUEUE,
+        max_queue_per_user: int = LLM_MAX_QUEUE_PER_USER,
+        queue_timeout: float = LLM_QUEUE_TIMEOUT_MS / 1000,
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max_queue
+        self.max_queue_per_user = max_queue_per_user
+        self.queue_timeout = queue_timeout
+        self.active = 0
+        self.queued = 0
+        # user_id -> waiters; dict order is the round-robin order.
+        self._queues: OrderedDict[str, deque[asyncio.Future]] = OrderedDict()
+        # EWMA of slot hold time, for Retry-After.
+        self._service_time = 1.0
+        self.stats = {"admitted": 0, "enqueued": 0, "rejected": 0, "timed_out": 0}
+
+    def retry_after(self) -> int:
+        # Roughly how long until the current backlog drains.
+        return max(1, math.ceil(self._service_time * (self.queued + 1) / self.max_concurrency))
+
+    async def acquire(self, user_id: str) -> Ticket:
+        if self.active < self.max_concurrency and not self.queued:
+            self.active += 1
+            self.stats["admitted"] += 1
+            queue_wait.observe(0.0, outcome="admitted")
+            return Ticket(self)
+
+        user_queue = self._queues.get(user_id)
+        if self.queued >= self.max_queue or (user_queue and len(user_queue) >= self.max_queue_per_user):
+            self.stats["rejected"] += 1
+            raise SchedulerBusyError("queue full", self.retry_after())
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(user_id, deque()).append(waiter)
+        self.queued += 1
+        self.stats["enqueued"] += 1
+        started = time.monotonic()
+        try:
+            await asyncio.wait_for(waiter, self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard(user_id, waiter)
+            self.stats["timed_out"] += 1
+            queue_wait.observe(time.monotonic() - started, outcome="timed_out")
+            raise SchedulerBusyError("queue timeout", self.retry_after())
+        except BaseException:
+            # Caller went away: give back a slot that was handed over meanwhile.
+            if waiter.done() and not waiter.cancelled():
+                self._release(0.0)
+            else:
+                self._discard(user_id, waiter)
+            raise
+
+        self.stats["admitted"] += 1
+        queue_wait.observe(time.monotonic() - started, outcome="admitted")
+        return Ticket(self)
+
+    @asynccontextmanager
+    async def slot(self, user_id: str):
+        ticket = await self.acquire(user_id)
+        try:
+            yield ticket
+        finally:
+            ticket.release()
+
+    def _discard(self, user_id: str, waiter: asyncio.Future):
+        user_queue = self._queues.get(user_id)
+        if user_queue is not None and waiter in user_queue:
+            user_queue.remove(waiter)
+            self.queued -= 1
+            if not user_queue:
+                del self._queues[user_id]
+
+    def _release(self, held: float):
+        if held:
+            self._service_time = 0.8 * self._service_time + 0.2 * held
+        # Hand the slot straight to the next user in round-robin order.
+        while self._queues:
+            user_id, user_queue = next(iter(self._queues.items()))
+            waiter = user_queue.popleft()
+            self.queued -= 1
+            if user_queue:
+                self._queues.move_to_end(user_id)
+            else:
+                del self._queues[user_id]
+            if not waiter.done():
+                waiter.set_result(None)
+                return
+        self.active -= 1
+
+    def status(self) -> dict:
+        return {
+            "active": self.active,
+            "max_concurrency": self.max_concurrency,
+            "queued": self.queued,
+            "users_waiting": len(self._queues),
+            **self.stats,
+        }
+
+scheduler = FairScheduler()
+
+registry.callback(
+    "llm_dispatch", "Provider dispatch slots and queue depth.", "gauge", ("state",),
+    lambda: {(k,): scheduler.status()[k] for k in ("active", "max_concurrency", "queued", "users_waiting")},
+)
+registry.callback(
+    "llm_dispatch_total", "Provider dispatch outcomes.", "counter", ("outcome",),
+    lambda: {(k,): v for k, v in scheduler.stats.items()},
+)
@@ -0,0 +1,199 @@
+"""
+Full-text search over a user's messages.
+
+Postgres: `chat_messages.search_vector` is a generated tsvector column with a
+GIN index (see the migration); queries use websearch syntax, rank with
+ts_rank_cd and build snippets with ts_headline for the returned page only.
+The 'simple' configuration is used so mixed-language (e.g. Chinese/English)
+content is matched without language-specific stemming.
+
+SQLite (tests/dev): a per-process in-memory inverted index, built from the
+table on first use and kept current as turns are persisted.
+
+Both leave out archived sessions (their messages are moved out of
+chat_messages by app.archive) until the session is reopened.
+"""
+import asyncio
+import html
+import math
+import os
+import re
+import threading
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import ChatMessage, ChatSession
+
+# auto: postgres on Postgres, memory otherwise
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_CONFIG = "simple"
+# ts_headline marks hits with private-use sentinels; the snippet is HTML-escaped
+# and only then are the sentinels swapped for <mark> tags (see safe_snippet).
+START_SEL, STOP_SEL = "\ue000", "\ue001"
+SNIPPET_OPTIONS = f"MaxFragments=2, MaxWords=20, MinWords=5, FragmentDelimiter= … , StartSel={START_SEL}, StopSel={STOP_SEL}"
+
+def safe_snippet(marked: str) -> str:
+    # Message text is user-controlled: escape all of it, then add the highlight tags.
+    return html.escape(marked).replace(START_SEL, "<mark>").replace(STOP_SEL, "</mark>")
+
+@dataclass
+class SearchHit:
+    message_id: str
+    session_id: str
+    role: str
+    created_at: datetime
+    rank: float
+    snippet: str
+
+class PostgresSearch:
+    def __init__(self):
+        # Falls back to an unindexed to_tsvector(content) if the migration has not run.
+        self._has_column: Optional[bool] = None
+
+    async def _vector(self, db: AsyncSession):
+        if self._has_column is None:
+            self._has_column = (await db.execute(text(
+                "SELECT 1 FROM information_schema.columns "
+                "WHERE table_name = 'chat_messages' AND column_name = 'search_vector'"
+            ))).first() is not None
+        if self._has_column:
+            return literal_column("chat_messages.search_vector")
+        return func.to_tsvector(SEARCH_CONFIG, ChatMessage.content)
+
+    async def search(self, db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> tuple[list[SearchHit], bool]:
+        tsquery = func.websearch_to_tsquery(SEARCH_CONFIG, query)
+        vector = await self._vector(db)
+        rank = func.ts_rank_cd(vector, tsquery).label("rank")
+        # Rank and page first; ts_headline only runs on the page.
+        ranked = (
+            select(ChatMessage.id, ChatMessage.session_id, ChatMessage.role, ChatMessage.created_at, ChatMessage.content, rank)
+            .join(ChatSession, ChatSession.id == ChatMessage.session_id)
+            .where(ChatSession.user_id == user_id, vector.op("@@")(tsquery))
+            .order_by(rank.desc(), ChatMessage.created_at.desc(), ChatMessage.id)
+            .limit(limit + 1)
+            .offset(offset)
+            .subquery()
+        )
+        stmt = select(
+            ranked.c.id,
+            ranked.c.session_id,
+            ranked.c.role,
+            ranked.c.created_at,
+            ranked.c.rank,
+            # Sentinels already in the text are stripped so they can't forge highlight tags.
+            func.ts_headline(
+                SEARCH_CONFIG, func.translate(ranked.c.content, START_SEL + STOP_SEL, ""), tsquery, SNIPPET_OPTIONS,
+            ).label("snippet"),
+        ).order_by(ranked.c.rank.desc(), ranked.c.created_at.desc(), ranked.c.id)
+        rows = (await db.execute(stmt)).all()
+        hits = [SearchHit(r.id, r.session_id, r.role, r.created_at, float(r.rank), safe_snippet(r.snippet)) for r in rows[:limit]]
+        return hits, len(rows) > limit
+
+    def add(self, user_id: str, messages: list[ChatMessage]):
+        # The generated column indexes new rows by itself.
+        pass
+
+    async def restore(self, db: AsyncSession, user_id: str, session_id: str):
+        # Restored rows are indexed by the generated column too.
+        pass
+
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+
+def tokenize(text_: str) -> list[str]:
+    return [t.lower() for t in _TOKEN.findall(text_)]
+
+class MemorySearch:
+    """
+    Inverted index term -> {message_id: term frequency}, scored with TF-IDF.
+    All query terms must match (like websearch_to_tsquery without operators).
+    Archiving runs out of process, so archived sessions are filtered at query
+    time rather than dropped from the index.
+    """
+
+    def __init__(self, snippet_words: int = 12):
+        self.snippet_words = snippet_words
+        self.postings: dict[str, dict[str, int]] = defaultdict(dict)
+        self.docs: dict[str, tuple[str, str, str, datetime, str]] = {}  # id -> (user, session, role, created_at, content)
+        self.loaded = False
+        self._load_lock = asyncio.Lock()
+        self._lock = threading.Lock()
+
+    def _index(self, user_id: str, m: ChatMessage):
+        with self._lock:
+            if m.id in self.docs:
+                return
+            self.docs[m.id] = (user_id, m.session_id, m.role, m.created_at, m.content)
+            for term in tokenize(m.content):
+                self.postings[term][m.id] = self.postings[term].get(m.id, 0) + 1
+
+    async def _ensure_loaded(self, db: AsyncSession):
+        async with self._load_lock:
+            if self.loaded:
+                return
+            rows = (await db.execute(
+                select(ChatSession.user_id, ChatMessage).join(ChatSession, ChatSession.id == ChatMessage.session_id)
+            )).all()
+            for user_id, m in rows:
+                self._index(user_id, m)
+            self.loaded = True
+
+    def add(self, user_id: str, messages: list[ChatMessage]):
+        if self.loaded:
+            for m in messages:
+                self._index(user_id, m)
+
+    async def restore(self, db: AsyncSession, user_id: str, session_id: str):
+        # A reopened session: index its messages if they were archived when we loaded.
+        if self.loaded:
+            rows = (await db.execute(select(ChatMessage).where(ChatMessage.session_id == session_id))).scalars().all()
+            for m in rows:
+                self._index(user_id, m)
+
+    def _snippet(self, content: str, terms: set[str]) -> str:
+        words = content.split()
+        first = next((i for i, w in enumerate(words) if set(tokenize(w)) & terms), 0)
+        start = max(0, first - self.snippet_words // 3)
+        window = words[start:start + self.snippet_words]
+        marked = [f"<mark>{html.escape(w)}</mark>" if set(tokenize(w)) & terms else html.escape(w) for w in window]
+        return ("… " if start else "") + " ".join(marked) + (" …" if start + self.snippet_words < len(words) else "")
+
+    async def search(self, db: AsyncSession, user_id: str, query: str, limit: int, offset: int) -> tuple[list[SearchHit], bool]:
+        await self._ensure_loaded(db)
+        terms = set(tokenize(query))
+        if not terms:
+            return [], False
+        with self._lock:
+            postings = [self.postings.get(t, {}) for t in terms]
+            candidates = set.intersection(*(set(p) for p in postings))
+            total = len(self.docs) or 1
+            scored = []
+            for message_id in candidates:
+                doc = self.docs[message_id]
+                if doc[0] != user_id:
+                    continue
+                score = sum(p[message_id] * math.log(1 + total / len(p)) for p in postings)
+                scored.append((score, doc, message_id))
+        if scored:
+            # Same as Postgres, where archived messages are no longer in chat_messages.
+            archived = set((await db.execute(
+                select(ChatSession.id).where(ChatSession.user_id == user_id, ChatSession.archived_at.is_not(None))
+            )).scalars().all())
+            scored = [s for s in scored if s[1][1] not in archived]
+        scored.sort(key=lambda s: (-s[0], -s[1][3].timestamp(), s[2]))
+        page = scored[offset:offset + limit + 1]
+        hits = [
+            SearchHit(message_id, doc[1], doc[2], doc[3], round(score, 4), self._snippet(doc[4], terms))
+            for score, doc, message_id in page[:limit]
+        ]
+        return hits, len(page) > limit
+
+def build_search(dialect: str):
+    backend = SEARCH_BACKEND
+    if backend == "auto":
+        backend = "postgres" if dialect == "postgresql" else "memory"
+    return PostgresSearch() if backend == "postgres" else MemorySearch()
@@ -0,0 +1,138 @@
+import asyncio
+import json
+import logging
+import os
+import time
+import uuid
+from typing import Awaitable, Callable
+
+import redis
+
+logger = logging.getLogger(__name__)
+
+# How long a finished result can be replayed for an explicit Idempotency-Key.
+IDEMPOTENCY_TTL = int(os.getenv("IDEMPOTENCY_TTL", "600"))
+# The owner's lock expires if it dies; waiters give up after this long.
+SINGLEFLIGHT_LOCK_MS = int(os.getenv("SINGLEFLIGHT_LOCK_MS", "120000"))
+SINGLEFLIGHT_POLL_MS = int(os.getenv("SINGLEFLIGHT_POLL_MS", "50"))
+
+# Delete the lock only if we still own it.
+_RELEASE_LUA = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+  return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+class IdempotencyConflictError(Exception):
+    # The key was already used for a different request body.
+    pass
+
+class SingleFlight:
+    """
+    Coalesce concurrent calls for the same key into one execution.
+
+    Within a worker, callers share one asyncio task. Across workers, the first
+    caller takes a Redis lock (SET NX PX) and the others poll for that owner's
+    result. With `result_ttl` > 0 a finished result stays readable that long,
+    so a retry after completion is answered without running `fn` again; with
+    0 only calls that overlap a running one are merged. Without Redis it
+    degrades to per-worker coalescing. With a `fingerprint` (hash of the
+    request body), reusing the key for a different body raises
+    IdempotencyConflictError instead of replaying the earlier result.
+    """
+
+    def __init__(self, redis_client=None, lock_ms: int = SINGLEFLIGHT_LOCK_MS, poll_ms: int = SINGLEFLIGHT_POLL_MS):
+        self.redis = redis_client
+        self.lock_ms = lock_ms
+        self.poll = poll_ms / 1000
+        self._inflight: dict[str, tuple[asyncio.Task, str | None]] = {}
+        self._release = redis_client.register_script(_RELEASE_LUA) if redis_client is not None else None
+        self.stats = {"executed": 0, "coalesced": 0, "replayed": 0}
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[dict]], result_ttl: int, fingerprint: str | None = None) -> dict:
+        inflight = self._inflight.get(key)
+        if inflight is not None:
+            task, running = inflight
+            if running != fingerprint:
+                raise IdempotencyConflictError(key)
+            self.stats["coalesced"] += 1
+        else:
+            task = asyncio.ensure_future(self._shared(key, fn, result_ttl, fingerprint))
+            self._inflight[key] = (task, fingerprint)
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        # Shielded: one caller disconnecting must not cancel the others' reply.
+        return await asyncio.shield(task)
+
+    async def _shared(self, key: str, fn: Callable[[], Awaitable[dict]], result_ttl: int, fingerprint: str | None) -> dict:
+        if self.redis is None:
+            self.stats["executed"] += 1
+            return await fn()
+
+        result_key, lock_key = f"sf:result:{key}", f"sf:lock:{key}"
+        token = uuid.uuid4().hex
+        owner = None  # token of the run this caller is waiting on
+        deadline = time.monotonic() + self.lock_ms / 1000
+        while True:
+            try:
+                if result_ttl:
+                    stored = await self.redis.get(result_key)
+                    if stored is not None:
+                        self.stats["replayed"] += 1
+                        return self._unpack(key, stored, fingerprint)
+                if owner is not None:
+                    # Only the run that was in flight when we arrived answers us.
+                    done = await self.redis.get(f"sf:done:{key}:{owner}")
+                    if done is not None:
+                        self.stats["coalesced"] += 1
+                        return self._unpack(key, done, fingerprint)
+                acquired = await self.redis.set(lock_key, token, nx=True, px=self.lock_ms)
+                if not acquired:
+                    owner = await self.redis.get(lock_key) or owner
+            except redis.RedisError:
+                logger.warning("singleflight: redis unavailable, running locally", exc_info=True)
+                self.stats["executed"] += 1
+                return await fn()
+
+            if acquired:
+                return await self._run_owner(fn, key, lock_key, token, result_ttl, fingerprint)
+            if time.monotonic() >= deadline:
+                # The owner is stuck or gone; answer this caller ourselves.
+                self.stats["executed"] += 1
+                return await fn()
+            await asyncio.sleep(self.poll)
+
+    def _unpack(self, key: str, stored: str, fingerprint: str | None) -> dict:
+        entry = json.loads(stored)
+        if entry.get("fingerprint") != fingerprint:
+            raise IdempotencyConflictError(key)
+        return entry["result"]
+
+    async def _run_owner(self, fn, key: str, lock_key: str, token: str, result_ttl: int, fingerprint: str | None) -> dict:
+        self.stats["executed"] += 1
+        try:
+            result = await fn()
+            entry = json.dumps({"fingerprint": fingerprint, "result": result}, ensure_ascii=False, default=str)
+            try:
+                async with self.redis.pipeline(transaction=False) as pipe:
+                    # For the callers that were waiting on this run; gone soon after.
+                    pipe.set(f"sf:done:{key}:{token}", entry, px=self.lock_ms)
+                    if result_ttl:
+                        pipe.set(f"sf:result:{key}", entry, ex=result_ttl)
+                    await pipe.execute()
+            except redis.RedisError:
+                logger.warning("singleflight: failed to store result", exc_info=True)
+            return result
+        finally:
+            try:
+                await self._release(keys=[lock_key], args=[token])
+            except redis.RedisError:
+                logger.warning("singleflight: failed to release lock", exc_info=True)
+
+def build_singleflight() -> SingleFlight:
+    if os.getenv("SINGLEFLIGHT_REDIS", "1") != "1":
+        return SingleFlight()
+    from .redis_client import ar
+    return SingleFlight(ar)
+
+singleflight = build_singleflight()
@@ -0,0 +1,158 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Awaitable, Callable, Optional
+
+from sqlalchemy import update
+
+from .llm import TokenEstimator, default_estimator
+from .metrics import registry
+from .models import ChatSession
+from .scheduler import SchedulerBusyError, scheduler
+
+logger = logging.getLogger(__name__)
+
+# Fold older messages into the session summary once this many turns have
+# accumulated beyond the verbatim tail (0 disables summaries).
+SUMMARY_EVERY_TURNS = int(os.getenv("SUMMARY_EVERY_TURNS", "6"))
+# The newest messages always sent verbatim, never summarized away.
+SUMMARY_TAIL_MESSAGES = int(os.getenv("SUMMARY_TAIL_MESSAGES", "8"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "200"))
+# Hard cap on the stored summary as a share of the context budget; the rest
+# is always left for the verbatim tail.
+SUMMARY_MAX_SHARE = float(os.getenv("SUMMARY_MAX_SHARE", "0.25"))
+
+SUMMARY_INSTRUCTIONS = (
+    "You maintain a running summary of a customer support conversation. "
+    "Merge the new messages into the existing summary. Keep the customer's problem, "
+    "relevant facts (accounts, products, error messages, steps already tried) and any "
+    "open questions or commitments. Write at most {words} words of plain text."
+)
+
+summary_updates = registry.counter("session_summary_updates_total", "Rolling summary refreshes by outcome.", ("outcome",))
+
+def unsummarized(history: list[dict], through_id: Optional[str]) -> list[dict]:
+    # Entries newer than the last message folded into the summary.
+    if through_id:
+        for i, entry in enumerate(history):
+            if entry.get("id") == through_id:
+                return history[i + 1:]
+    return history
+
+def truncate_to_tokens(text: str, max_tokens: int, estimator: TokenEstimator = default_estimator) -> str:
+    # Longest prefix (cut at a space when there is one) the estimator counts within max_tokens.
+    if estimator.count(text) <= max_tokens:
+        return text
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimator.count(text[:mid] + "…") <= max_tokens:
+            lo = mid
+        else:
+            hi = mid - 1
+    cut = text[:lo]
+    if " " in cut[len(cut) // 2:]:
+        cut = cut[:cut.rindex(" ")]
+    return cut.rstrip() + "…"
+
+def summary_entry(summary: str, tokens: int) -> dict:
+    return {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}", "tokens": tokens}
+
+class SessionSummarizer:
+    """
+    Keeps ChatSession.summary rolling in the background.
+
+    After a turn, if more than `every_turns` turns sit between the summary and
+    the verbatim tail, one provider call merges them into the summary. Runs
+    off the request path with at most one refresh per session per worker;
+    the conditional UPDATE on summary_message_id drops a refresh that lost a
+    race with another worker. The stored summary is truncated to `max_tokens`
+    whatever the model returns, and the call's usage goes through `on_usage`
+    (db, user_id, session_id, message_id, result) in the same transaction.
+    """
+
+    def __init__(
+        self,
+        provider,
+        session_factory,
+        max_tokens: int,
+        on_usage: Optional[Callable[..., Awaitable[None]]] = None,
+        every_turns: int = SUMMARY_EVERY_TURNS,
+        tail_messages: int = SUMMARY_TAIL_MESSAGES,
+        max_words: int = SUMMARY_MAX_WORDS,
+        estimator: TokenEstimator = default_estimator,
+    ):
+        self.provider = provider
+        self.session_factory = session_factory
+        self.max_tokens = max_tokens
+        self.on_usage = on_usage
+        self.every_turns = every_turns
+        self.tail_messages = tail_messages
+        self.max_words = max_words
+        self.estimator = estimator
+        self._inflight: dict[str, asyncio.Task] = {}
+
+    def bounded(self, summary: str, tokens: int) -> tuple[str, int]:
+        # Summaries stored before the cap (or under a larger budget) are cut at read time.
+        if tokens <= self.max_tokens:
+            return summary, tokens
+        summary = truncate_to_tokens(summary, self.max_tokens, self.estimator)
+        return summary, self.estimator.count(summary)
+
+    def due(self, pending: list[dict]) -> bool:
+        return bool(self.every_turns) and len(pending) - self.tail_messages >= 2 * self.every_turns
+
+    def maybe_schedule(self, session_id: str, user_id: str, summary: Optional[str], through_id: Optional[str], pending: list[dict]):
+        if not self.due(pending) or session_id in self._inflight:
+            return
+        fold = pending[:-self.tail_messages] if self.tail_messages else pending
+        if any(not entry.get("id") for entry in fold):
+            # Ring entries cached before ids were stored; wait for a refill.
+            return
+        task = asyncio.create_task(self._refresh(session_id, user_id, summary, through_id, fold))
+        self._inflight[session_id] = task
+        task.add_done_callback(lambda _: self._inflight.pop(session_id, None))
+
+    def _prompt(self, summary: Optional[str], fold: list[dict]) -> list[dict]:
+        transcript = "\n".join(f"{e['role']}: {e['content']}" for e in fold)
+        return [
+            {"role": "system", "content": SUMMARY_INSTRUCTIONS.format(words=self.max_words)},
+            {"role": "user", "content": f"Existing summary:\n{summary or '(none)'}\n\nNew messages:\n{transcript}"},
+        ]
+
+    async def _refresh(self, session_id: str, user_id: str, summary: Optional[str], through_id: Optional[str], fold: list[dict]):
+        try:
+            # Competes for provider capacity like the user's own chats.
+            async with scheduler.slot(user_id):
+                # Unique per session: neither read from nor written to the response cache.
+                result = await self.provider.achat(self._prompt(summary, fold), bypass=True, store=False)
+            text = truncate_to_tokens(result.text, self.max_tokens, self.estimator)
+            current = ChatSession.summary_message_id == through_id if through_id else ChatSession.summary_message_id.is_(None)
+            async with self.session_factory() as db:
+                updated = await db.execute(
+                    update(ChatSession)
+                    .where(ChatSession.id == session_id, current)
+                    .values(
+                        summary=text,
+                        summary_message_id=fold[-1]["id"],
+                        summary_tokens=self.estimator.count(text),
+                        summary_updated_at=datetime.utcnow(),
+                    )
+                )
+                # Billed even if superseded: the tokens were spent either way.
+                if self.on_usage is not None:
+                    await self.on_usage(db, user_id, session_id, fold[-1]["id"], result)
+                await db.commit()
+            summary_updates.inc(outcome="updated" if updated.rowcount else "superseded")
+        except SchedulerBusyError:
+            # Provider is saturated; the next turn tries again.
+            summary_updates.inc(outcome="deferred")
+        except Exception:
+            summary_updates.inc(outcome="failed")
+            logger.warning("session summary refresh failed for %s", session_id, exc_info=True)
+
+    async def close(self):
+        # Let in-flight refreshes finish on shutdown.
+        if self._inflight:
+            await asyncio.gather(*self._inflight.values(), return_exceptions=True)
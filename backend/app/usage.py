@@ -0,0 +1,51 @@
+from datetime import datetime
+
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from .models import UsageRollup
+
+GRANULARITIES = ("hour", "day")
+ALL_SESSIONS = "*"
+ROLLUP_KEY = ("granularity", "user_id", "session_id", "bucket_start", "model")
+ROLLUP_COUNTERS = ("requests", "prompt_tokens", "completion_tokens", "total_tokens", "cache_hits")
+
+def bucket_start(ts: datetime, granularity: str) -> datetime:
+    if granularity == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+
+def rollup_deltas(entries: list[tuple[str, dict]]) -> list[dict]:
+    """
+    Fold (user_id, usage_row) pairs into one delta per rollup key: every
+    usage counts towards its session and the user's "*" row, at each granularity.
+    Sorted by key so concurrent upserts lock rows in the same order.
+    """
+    deltas: dict[tuple, dict] = {}
+    for user_id, usage in entries:
+        for granularity in GRANULARITIES:
+            for session_id in (usage["session_id"], ALL_SESSIONS):
+                key = (granularity, user_id, session_id, bucket_start(usage["created_at"], granularity), usage["model"])
+                row = deltas.get(key)
+                if row is None:
+                    row = deltas[key] = dict(zip(ROLLUP_KEY, key), **{c: 0 for c in ROLLUP_COUNTERS})
+                row["requests"] += 1
+                row["prompt_tokens"] += usage["prompt_tokens"]
+                row["completion_tokens"] += usage["completion_tokens"]
+                row["total_tokens"] += usage["total_tokens"]
+                row["cache_hits"] += 1 if usage.get("cache_hit") else 0
+    return [deltas[k] for k in sorted(deltas)]
+
+async def apply_rollups(db: AsyncSession, entries: list[tuple[str, dict]]):
+    # One INSERT .. ON CONFLICT DO UPDATE (counter += delta) in the caller's transaction.
+    rows = rollup_deltas(entries)
+    if not rows:
+        return
+    dialect = db.get_bind().dialect.name
+    insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+    stmt = insert(UsageRollup).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=list(ROLLUP_KEY),
+        set_={c: getattr(UsageRollup, c) + getattr(stmt.excluded, c) for c in ROLLUP_COUNTERS},
+    )
+    await db.execute(stmt)
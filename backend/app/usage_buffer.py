@@ -0,0 +1,73 @@
+import asyncio
+import logging
+
+from sqlalchemy import insert
+
+from .models import LLMUsage
+from .usage import apply_rollups
+
+logger = logging.getLogger(__name__)
+
+class UsageWriteBuffer:
+    """
+    Write-behind buffer for LLMUsage rows.
+
+    Rows are queued in memory and inserted with one bulk INSERT once
+    `max_rows` are pending or every `max_delay_ms`, whichever comes first,
+    together with their folded usage rollups. `close()` flushes whatever is
+    left (call it on shutdown).
+    """
+
+    def __init__(self, session_factory, max_rows: int = 100, max_delay_ms: int = 500):
+        self.session_factory = session_factory
+        self.max_rows = max_rows
+        self.max_delay = max_delay_ms / 1000
+        self._rows: list[tuple[str, dict]] = []  # (user_id, usage row)
+        self._lock = asyncio.Lock()
+        self._task: asyncio.Task | None = None
+        self._stop = asyncio.Event()
+
+    def start(self):
+        if self._task is None:
+            self._stop.clear()
+            self._task = asyncio.create_task(self._run())
+
+    async def add(self, user_id: str, row: dict):
+        self._rows.append((user_id, row))
+        if len(self._rows) >= self.max_rows:
+            await self.flush()
+
+    async def flush(self):
+        async with self._lock:
+            rows, self._rows = self._rows, []
+            if not rows:
+                return
+            try:
+                async with self.session_factory() as db:
+                    await db.execute(insert(LLMUsage), [row for _, row in rows])
+                    await apply_rollups(db, rows)
+                    await db.commit()
+            except Exception:
+                logger.exception("usage flush failed, %d rows re-queued", len(rows))
+                # Keep the rows for the next attempt, but never grow unbounded.
+                self._rows[:0] = rows[-self.max_rows * 10:]
+            except BaseException:
+                # Cancelled mid-write (e.g. the request that triggered it went away): nothing is lost.
+                self._rows[:0] = rows
+                raise
+
+    async def close(self):
+        # Stop the loop without cancelling it, so an in-flight flush completes.
+        if self._task is not None:
+            self._stop.set()
+            await self._task
+            self._task = None
+        await self.flush()
+
+    async def _run(self):
+        while not self._stop.is_set():
+            try:
+                await asyncio.wait_for(self._stop.wait(), self.max_delay)
+            except asyncio.TimeoutError:
+                pass
+            await self.flush()
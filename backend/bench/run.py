@@ -0,0 +1,230 @@
+"""
+Load test / benchmark for the chat API.
+
+Each virtual user runs: signup -> create session -> N chat turns -> history
+reads. Users run with bounded concurrency; latencies are recorded per endpoint
+and reported as throughput and p50/p95/p99. A saved baseline can be compared
+against to catch regressions.
+
+Run from backend/:
+    # in-process app with SQLite + fake Redis stand-ins (pip install -r bench/requirements.txt)
+    python -m bench.run --users 50 --concurrency 20 --turns 5
+    # against a running server (real Postgres/Redis)
+    python -m bench.run --url http://localhost:8000 --users 200 --concurrency 50
+    # record / compare a baseline
+    python -m bench.run --save-baseline bench/baseline.json
+    python -m bench.run --baseline bench/baseline.json --tolerance 0.25
+
+Simulated LLM behaviour is configured through the FakeProvider env vars
+(FAKE_LLM_LATENCY_MS, FAKE_LLM_LATENCY_SIGMA, FAKE_LLM_TOKENS_PER_SEC,
+FAKE_LLM_FAILURE_RATE, FAKE_LLM_SEED); the CLI flags below set them for the
+in-process mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import uuid
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import httpx
+
+PERCENTILES = (50, 95, 99)
+
+def percentile(sorted_values: list[float], p: float) -> float:
+    # Nearest-rank.
+    if not sorted_values:
+        return 0.0
+    k = max(0, min(len(sorted_values) - 1, round(p / 100 * len(sorted_values) + 0.5) - 1))
+    return sorted_values[k]
+
+def failed_stream(resp: httpx.Response) -> bool:
+    # SSE replies are 200 even when generation fails; the failure is an `error` event.
+    return resp.headers.get("content-type", "").startswith("text/event-stream") and "event: error" in resp.text
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: dict[str, int] = defaultdict(int)
+
+    async def call(self, client: httpx.AsyncClient, endpoint: str, method: str, url: str, **kw) -> Optional[httpx.Response]:
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kw)
+        except httpx.HTTPError:
+            resp = None
+        self.latencies[endpoint].append((time.perf_counter() - start) * 1000)
+        if resp is None or resp.status_code >= 400 or failed_stream(resp):
+            self.errors[endpoint] += 1
+        return resp
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        for name, values in sorted(self.latencies.items()):
+            values = sorted(values)
+            endpoints[name] = {
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "rps": round(len(values) / elapsed, 2),
+                "mean_ms": round(sum(values) / len(values), 2),
+                **{f"p{p}_ms": round(percentile(values, p), 2) for p in PERCENTILES},
+            }
+        total = sum(e["count"] for e in endpoints.values())
+        return {"elapsed_s": round(elapsed, 3), "requests": total, "rps": round(total / elapsed, 2), "endpoints": endpoints}
+
+async def virtual_user(client: httpx.AsyncClient, rec: Recorder, args):
+    email = f"bench-{uuid.uuid4().hex[:12]}@example.com"
+    resp = await rec.call(client, "POST /api/auth/signup", "POST", "/api/auth/signup",
+                          json={"email": email, "password": "bench-password"})
+    if resp is None or resp.status_code != 200:
+        return
+    headers = {"Authorization": f"Bearer {resp.json()['access_token']}"}
+
+    resp = await rec.call(client, "POST /api/chat/sessions", "POST", "/api/chat/sessions", json={}, headers=headers)
+    if resp is None or resp.status_code != 200:
+        return
+    sid = resp.json()["id"]
+
+    path = f"/api/chat/sessions/{sid}/messages" + ("/stream" if args.stream else "")
+    label = "POST /api/chat/sessions/{id}/messages" + ("/stream" if args.stream else "")
+    for i in range(args.turns):
+        await rec.call(client, label, "POST", path, headers=headers,
+                       json={"message": f"turn {i}: how do I reset my password?"})
+
+    for _ in range(args.history_reads):
+        await rec.call(client, "GET /api/sessions/{id}/messages", "GET", f"/api/sessions/{sid}/messages",
+                       params={"limit": 50}, headers=headers)
+        await rec.call(client, "GET /api/chat/sessions", "GET", "/api/chat/sessions", headers=headers)
+
+async def run_load(client: httpx.AsyncClient, args) -> dict:
+    rec = Recorder()
+    sem = asyncio.Semaphore(args.concurrency)
+
+    async def one():
+        async with sem:
+            await virtual_user(client, rec, args)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.users)))
+    return rec.report(time.perf_counter() - start)
+
+def use_stand_ins(args):
+    # SQLite file + in-memory Redis, wired in before the app is imported.
+    import fakeredis
+    import redis
+    import redis.asyncio
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix="bench-"), "bench.db")
+    os.environ["DATABASE_URL"] = f"sqlite:///{db_path}"
+    server = fakeredis.FakeServer()
+    redis.Redis.from_url = classmethod(lambda cls, url, **kw: fakeredis.FakeRedis(server=server, **kw))
+    redis.asyncio.Redis.from_url = classmethod(lambda cls, url, **kw: fakeredis.FakeAsyncRedis(server=server, **kw))
+
+def configure_env(args):
+    # Rate limits would otherwise throttle the load generator itself.
+    for name in ("IP_RATE_LIMIT", "SESSION_RATE_LIMIT", "USER_RATE_LIMIT"):
+        os.environ.setdefault(name, "1000000")
+    os.environ.setdefault("LLM_PROVIDER", "fake")
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_LATENCY_SIGMA"] = str(args.llm_latency_sigma)
+    os.environ["FAKE_LLM_TOKENS_PER_SEC"] = str(args.llm_tokens_per_sec)
+    os.environ["FAKE_LLM_FAILURE_RATE"] = str(args.llm_failure_rate)
+    os.environ.setdefault("FAKE_LLM_SEED", "1")
+
+@asynccontextmanager
+async def in_process_client(args):
+    if not args.real_backends:
+        use_stand_ins(args)
+    configure_env(args)
+    from app.db import async_engine
+    from app.main import app
+
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with app.router.lifespan_context(app):
+            async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=args.timeout) as client:
+                yield client
+    finally:
+        await async_engine.dispose()
+
+def compare(report: dict, baseline: dict, tolerance: float) -> list[str]:
+    # An endpoint regresses when its p95 or p99 grows by more than `tolerance` (fraction).
+    regressions = []
+    for name, cur in report["endpoints"].items():
+        base = baseline.get("endpoints", {}).get(name)
+        if not base:
+            continue
+        for key in ("p95_ms", "p99_ms"):
+            if base[key] and cur[key] > base[key] * (1 + tolerance):
+                regressions.append(f"{name} {key}: {base[key]} -> {cur[key]}")
+        if cur["errors"] > base["errors"]:
+            regressions.append(f"{name} errors: {base['errors']} -> {cur['errors']}")
+    return regressions
+
+def print_report(report: dict):
+    cols = ("count", "errors", "rps", "mean_ms") + tuple(f"p{p}_ms" for p in PERCENTILES)
+    width = max(len(n) for n in report["endpoints"]) if report["endpoints"] else 10
+    print(f"{'endpoint':<{width}}  " + "  ".join(f"{c:>9}" for c in cols))
+    for name, row in report["endpoints"].items():
+        print(f"{name:<{width}}  " + "  ".join(f"{row[c]:>9}" for c in cols))
+    print(f"\n{report['requests']} requests in {report['elapsed_s']}s ({report['rps']} req/s)")
+
+async def main_async(args) -> int:
+    if args.url:
+        async with httpx.AsyncClient(base_url=args.url, timeout=args.timeout) as client:
+            report = await run_load(client, args)
+    else:
+        async with in_process_client(args) as client:
+            report = await run_load(client, args)
+
+    report["config"] = {k: getattr(args, k) for k in (
+        "users", "concurrency", "turns", "history_reads", "stream",
+        "llm_latency_ms", "llm_latency_sigma", "llm_tokens_per_sec", "llm_failure_rate",
+    )}
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(report, json.load(f), args.tolerance)
+        if regressions:
+            print("\nREGRESSIONS:", *regressions, sep="\n  ", file=sys.stderr)
+            return 1
+        print(f"\nno regressions vs {args.baseline} (tolerance {args.tolerance:.0%})")
+    return 0
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the chat API.")
+    parser.add_argument("--url", help="target a running server instead of the in-process app")
+    parser.add_argument("--real-backends", action="store_true",
+                        help="in-process app, but use DATABASE_URL/REDIS_URL instead of SQLite/fake Redis")
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=10)
+    parser.add_argument("--turns", type=int, default=5, help="chat turns per user")
+    parser.add_argument("--history-reads", type=int, default=3, help="history + session list reads per user")
+    parser.add_argument("--stream", action="store_true", help="use the SSE endpoint for chat turns")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="median time to first token")
+    parser.add_argument("--llm-latency-sigma", type=float, default=0.5, help="log-normal spread of the latency")
+    parser.add_argument("--llm-tokens-per-sec", type=float, default=0.0, help="generation rate (0 = instant)")
+    parser.add_argument("--llm-failure-rate", type=float, default=0.0, help="fraction of LLM calls that fail")
+    parser.add_argument("--json", action="store_true", help="print the report as JSON")
+    parser.add_argument("--baseline", help="compare against this saved report")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed p95/p99 growth vs baseline")
+    parser.add_argument("--save-baseline", help="write this run's report to a file")
+    args = parser.parse_args(argv)
+    sys.exit(asyncio.run(main_async(args)))
+
+if __name__ == "__main__":
+    main()
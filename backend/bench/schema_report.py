@@ -0,0 +1,177 @@
+"""
+Storage and query-latency report for the key/index schema (Postgres).
+
+Measures table and index sizes (summed over partitions) and times the hot
+key-driven queries (session list, history page, usage listing, a user-wide
+join) against the sample user/session with the most data. Run it before and
+after a schema migration to see what changed:
+
+Run from backend/:
+    python -m bench.schema_report --save /tmp/before.json
+    (cd .. && alembic upgrade head)
+    python -m bench.schema_report --compare /tmp/before.json
+
+Uses DATABASE_URL unless --url is given.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine, text
+
+from .run import percentile
+
+TABLES = ("users", "chat_sessions", "chat_messages", "llm_usage")
+
+def key_type(conn) -> str:
+    # varchar(36) before the uuid migration, uuid after; binds are cast like the app's.
+    return conn.execute(text(
+        "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+        "WHERE a.attrelid = 'chat_sessions'::regclass AND a.attname = 'id'"
+    )).scalar()
+
+def sizes(conn) -> dict:
+    report = {}
+    for table in TABLES:
+        heap, indexes = conn.execute(text(
+            "SELECT sum(pg_table_size(relid)), sum(pg_indexes_size(relid)) "
+            "FROM pg_partition_tree(CAST(:t AS regclass))"
+        ), {"t": table}).one()
+        per_index = {}
+        names = conn.execute(text(
+            "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = CAST(:t AS regclass)"
+        ), {"t": table}).scalars().all()
+        for name in names:
+            per_index[name] = conn.execute(text(
+                "SELECT sum(pg_relation_size(relid)) FROM pg_partition_tree(CAST(:i AS regclass))"
+            ), {"i": name}).scalar()
+        rows = conn.execute(text(f"SELECT count(*) FROM {table}")).scalar()
+        report[table] = {"rows": rows, "table_bytes": int(heap or 0), "index_bytes": int(indexes or 0), "indexes": per_index}
+    return report
+
+def queries(kt: str) -> dict:
+    # Same shapes as the API (see app/main.py).
+    return {
+        "session_list": (
+            f"SELECT id, created_at FROM chat_sessions WHERE user_id = CAST(:user_id AS {kt}) "
+            "ORDER BY created_at DESC, id DESC LIMIT 51"
+        ),
+        "history_page": (
+            f"SELECT * FROM chat_messages WHERE session_id = CAST(:session_id AS {kt}) "
+            "ORDER BY created_at DESC, id DESC LIMIT 51"
+        ),
+        "history_marker": (
+            f"SELECT created_at, id FROM chat_messages WHERE session_id = CAST(:session_id AS {kt}) "
+            "ORDER BY created_at DESC, id DESC LIMIT 1"
+        ),
+        "usage_list": (
+            "SELECT message_id, provider, model, prompt_tokens, completion_tokens, total_tokens, cache_hit, created_at "
+            f"FROM llm_usage WHERE session_id = CAST(:session_id AS {kt}) ORDER BY created_at"
+        ),
+        "user_messages_join": (
+            "SELECT count(*) FROM chat_messages m JOIN chat_sessions s ON s.id = m.session_id "
+            f"WHERE s.user_id = CAST(:user_id AS {kt})"
+        ),
+    }
+
+def sample(conn) -> dict:
+    user_id = conn.execute(text(
+        "SELECT user_id FROM chat_sessions WHERE user_id IS NOT NULL GROUP BY user_id ORDER BY count(*) DESC LIMIT 1"
+    )).scalar()
+    session_id = conn.execute(text(
+        "SELECT session_id FROM chat_messages GROUP BY session_id ORDER BY count(*) DESC LIMIT 1"
+    )).scalar()
+    if user_id is None or session_id is None:
+        raise SystemExit("no data to sample; load some traffic first (e.g. python -m bench.run --url ...)")
+    return {"user_id": str(user_id), "session_id": str(session_id)}
+
+def scan_nodes(plan: dict) -> list[str]:
+    nodes = [plan["Node Type"]] if "Scan" in plan["Node Type"] else []
+    for child in plan.get("Plans", []):
+        nodes += scan_nodes(child)
+    return nodes
+
+def latencies(conn, params: dict, iterations: int) -> dict:
+    report = {}
+    for name, sql in queries(key_type(conn)).items():
+        stmt = text(sql)
+        conn.execute(stmt, params).all()  # warm the cache
+        samples = []
+        for _ in range(iterations):
+            start = time.perf_counter()
+            conn.execute(stmt, params).all()
+            samples.append((time.perf_counter() - start) * 1000)
+        samples.sort()
+        plan = conn.execute(text("EXPLAIN (FORMAT JSON) " + sql), params).scalar()
+        report[name] = {
+            **{f"p{p}_ms": round(percentile(samples, p), 3) for p in (50, 95)},
+            "scans": sorted(set(scan_nodes(plan[0]["Plan"]))),
+        }
+    return report
+
+def collect(url: str, iterations: int) -> dict:
+    engine = create_engine(url)
+    try:
+        with engine.connect() as conn:
+            params = sample(conn)
+            return {
+                "key_type": key_type(conn),
+                "sizes": sizes(conn),
+                "latency": latencies(conn, params, iterations),
+            }
+    finally:
+        engine.dispose()
+
+def mib(n: int) -> str:
+    return f"{n / 1048576:.2f} MiB"
+
+def change(before: float, after: float) -> str:
+    return f"{(after - before) / before * 100:+.1f}%" if before else "n/a"
+
+def print_report(report: dict, baseline: Optional[dict] = None):
+    print(f"key type: {report['key_type']}" + (f" (was {baseline['key_type']})" if baseline else ""))
+    print(f"\n{'table':<16}{'rows':>10}{'table':>14}{'indexes':>14}")
+    for table, s in report["sizes"].items():
+        line = f"{table:<16}{s['rows']:>10}{mib(s['table_bytes']):>14}{mib(s['index_bytes']):>14}"
+        if baseline and table in baseline["sizes"]:
+            b = baseline["sizes"][table]
+            line += f"   table {change(b['table_bytes'], s['table_bytes'])}, indexes {change(b['index_bytes'], s['index_bytes'])}"
+        print(line)
+        for name, size in s["indexes"].items():
+            print(f"  {name:<48}{mib(size or 0):>12}")
+    print(f"\n{'query':<22}{'p50 ms':>10}{'p95 ms':>10}  scans")
+    for name, q in report["latency"].items():
+        line = f"{name:<22}{q['p50_ms']:>10.3f}{q['p95_ms']:>10.3f}  {', '.join(q['scans'])}"
+        if baseline and name in baseline["latency"]:
+            line += f"   p50 {change(baseline['latency'][name]['p50_ms'], q['p50_ms'])}"
+        print(line)
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(description="Key/index size and latency report (Postgres).")
+    parser.add_argument("--url", default=os.getenv("DATABASE_URL"))
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--save", help="write the report as JSON")
+    parser.add_argument("--compare", help="JSON report from an earlier run to diff against")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of a table")
+    args = parser.parse_args(argv)
+    if not args.url or not args.url.startswith("postgresql"):
+        sys.exit("a Postgres DATABASE_URL (or --url) is required")
+
+    report = collect(args.url, args.iterations)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    if args.json:
+        print(json.dumps(report, indent=2))
+    else:
+        print_report(report, baseline)
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
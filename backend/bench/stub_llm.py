@@ -0,0 +1,230 @@
+"""
+Local OpenAI-compatible stub for exercising OpenAICompatibleProvider.
+
+Serves POST /chat/completions (plain and streaming). Responses follow a
+script of modes, then the default mode: ok, error (503), bad_request (400),
+malformed (200 with a non-JSON body), bad_shape (200 JSON without choices),
+slow (answers after --slow-ms).
+
+Run from backend/:
+    # point the app at it: LLM_PROVIDER=openai OPENAI_BASE_URL=http://127.0.0.1:9100
+    python -m bench.stub_llm --port 9100 [--mode ok] [--script error,error,malformed]
+    # self-check of retries and the circuit breaker against a live stub
+    python -m bench.stub_llm --check
+"""
+import argparse
+import asyncio
+import json
+import socket
+import sys
+import threading
+import time
+from collections import deque
+
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from starlette.routing import Route
+
+MODES = ("ok", "error", "bad_request", "malformed", "bad_shape", "slow")
+
+class StubState:
+    def __init__(self, mode: str = "ok", script: tuple[str, ...] = (), slow_ms: float = 2000):
+        self.mode = mode
+        self.script = deque(script)
+        self.slow_ms = slow_ms
+        self.calls = 0
+
+    def next_mode(self) -> str:
+        self.calls += 1
+        return self.script.popleft() if self.script else self.mode
+
+def completion(text: str) -> dict:
+    return {
+        "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 5, "completion_tokens": 3, "total_tokens": 8},
+    }
+
+def build_app(state: StubState) -> Starlette:
+    async def chat_completions(request: Request):
+        body = await request.json()
+        mode = state.next_mode()
+        if mode == "slow":
+            await asyncio.sleep(state.slow_ms / 1000)
+        elif mode == "error":
+            return JSONResponse({"error": "unavailable"}, status_code=503)
+        elif mode == "bad_request":
+            return JSONResponse({"error": "bad request"}, status_code=400)
+        elif mode == "malformed":
+            return PlainTextResponse("<html>gateway hiccup</html>")
+        elif mode == "bad_shape":
+            return JSONResponse({"id": "x"})
+
+        text = f"stub reply to: {body['messages'][-1]['content']}"
+        if not body.get("stream"):
+            return JSONResponse(completion(text))
+
+        async def events():
+            for word in text.split(" "):
+                yield f"data: {json.dumps({'choices': [{'delta': {'content': word + ' '}}]})}\n\n"
+            yield f"data: {json.dumps({'choices': [], 'usage': completion(text)['usage']})}\n\n"
+            yield "data: [DONE]\n\n"
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    return Starlette(routes=[Route("/chat/completions", chat_completions, methods=["POST"])])
+
+def start_server(state: StubState, port: int = 0):
+    # Real uvicorn server on a background thread; returns (server, base_url).
+    import uvicorn
+
+    if not port:
+        with socket.socket() as s:
+            s.bind(("127.0.0.1", 0))
+            port = s.getsockname()[1]
+    server = uvicorn.Server(uvicorn.Config(build_app(state), host="127.0.0.1", port=port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    deadline = time.monotonic() + 5
+    while not server.started:
+        if time.monotonic() > deadline:
+            raise RuntimeError("stub server did not start")
+        time.sleep(0.01)
+    return server, f"http://127.0.0.1:{port}"
+
+async def check(base_url: str, state: StubState):
+    from app.llm import CircuitBreaker, CircuitOpenError, LLMError, LLMRequestError, OpenAICompatibleProvider
+
+    messages = [{"role": "user", "content": "hello"}]
+    reset = 0.2
+
+    def provider() -> OpenAICompatibleProvider:
+        return OpenAICompatibleProvider(
+            base_url, "", "stub-1", read_timeout=5, max_retries=1, backoff_base=0.01,
+            breaker=CircuitBreaker(failure_threshold=1, reset_timeout=reset),
+        )
+
+    async def expect(p, error, label):
+        try:
+            await p.achat(messages)
+        except error:
+            return
+        raise AssertionError(f"{label}: expected {error.__name__}")
+
+    results = []
+
+    def ok(label):
+        results.append(label)
+        print(f"ok   {label}")
+
+    # Retryable 503s are retried, then succeed.
+    p = provider()
+    state.script.extend(["error"])
+    before = state.calls
+    assert (await p.achat(messages)).text.startswith("stub reply"), "retry"
+    assert state.calls - before == 2, "retry count"
+    ok("503 is retried")
+    await p.aclose()
+
+    # Malformed 200 bodies surface as LLMError (not ValueError/KeyError) and count as failures.
+    for mode in ("malformed", "bad_shape"):
+        p = provider()
+        state.script.extend([mode])
+        await expect(p, LLMError, mode)
+        assert p.breaker.state == "open", f"{mode}: breaker should open"
+        await expect(p, CircuitOpenError, f"{mode}: fail fast")
+        ok(f"{mode} body -> LLMError, breaker opens")
+        await p.aclose()
+
+    # Non-retryable 4xx (one user's bad prompt): not retried, never opens the breaker.
+    p = provider()
+    state.script.extend(["bad_request", "bad_request"])
+    before = state.calls
+    await expect(p, LLMRequestError, "bad_request")
+    await expect(p, LLMRequestError, "bad_request again")
+    assert state.calls - before == 2, "bad_request was retried"
+    assert p.breaker.state == "closed", "bad_request opened the breaker"
+    assert (await p.achat(messages)).text, "call after bad_request"
+    ok("400 is not retried and does not open the breaker")
+    await p.aclose()
+
+    # A 400 as the half-open trial frees the trial slot without re-opening.
+    p = provider()
+    state.script.extend(["error", "error"])
+    await expect(p, LLMError, "trip")
+    await asyncio.sleep(reset * 1.5)
+    state.script.extend(["bad_request"])
+    await expect(p, LLMRequestError, "bad_request trial")
+    assert p.breaker.state == "half_open" and not p.breaker.trial_in_flight, "bad_request trial left the breaker stuck"
+    assert (await p.achat(messages)).text and p.breaker.state == "closed", "breaker did not close"
+    ok("400 half-open trial does not re-open or wedge the breaker")
+    await p.aclose()
+
+    # Half-open trial that gets a malformed body: the breaker re-opens and then recovers.
+    p = provider()
+    state.script.extend(["error", "error"])
+    await expect(p, LLMError, "trip")
+    await asyncio.sleep(reset * 1.5)
+    state.script.extend(["malformed"])
+    await expect(p, LLMError, "malformed trial")
+    assert not p.breaker.trial_in_flight, "malformed trial left trial_in_flight set"
+    await asyncio.sleep(reset * 1.5)
+    before = state.calls
+    assert (await p.achat(messages)).text, "recovery after malformed trial"
+    assert state.calls > before and p.breaker.state == "closed", "breaker did not close"
+    ok("malformed half-open trial does not wedge the breaker")
+    await p.aclose()
+
+    # Half-open trial cancelled mid-flight (client disconnect / hedge loser).
+    p = provider()
+    state.script.extend(["error", "error"])
+    await expect(p, LLMError, "trip")
+    await asyncio.sleep(reset * 1.5)
+    state.script.extend(["slow"])
+    task = asyncio.create_task(p.achat(messages))
+    await asyncio.sleep(0.1)
+    task.cancel()
+    await asyncio.gather(task, return_exceptions=True)
+    assert not p.breaker.trial_in_flight, "cancelled trial left trial_in_flight set"
+    await asyncio.sleep(reset * 1.5)
+    assert (await p.achat(messages)).text, "recovery after cancelled trial"
+    assert p.breaker.state == "closed", "breaker did not close"
+    ok("cancelled half-open trial does not wedge the breaker")
+    await p.aclose()
+
+    # Streaming works end to end.
+    p = provider()
+    chunks = [c async for c in p.astream(messages)]
+    assert chunks[-1].result and chunks[-1].result.total_tokens == 8, "stream usage"
+    ok("streaming")
+    await p.aclose()
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="OpenAI-compatible stub server.")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--mode", choices=MODES, default="ok")
+    parser.add_argument("--script", default="", help="comma-separated modes for the first requests")
+    parser.add_argument("--slow-ms", type=float, default=2000)
+    parser.add_argument("--check", action="store_true", help="run the provider/breaker self-check and exit")
+    args = parser.parse_args(argv)
+    script = tuple(m for m in args.script.split(",") if m)
+    unknown = set(script) - set(MODES)
+    if unknown:
+        parser.error(f"unknown modes: {', '.join(sorted(unknown))}")
+    state = StubState(args.mode, script, args.slow_ms)
+
+    if not args.check:
+        import uvicorn
+        uvicorn.run(build_app(state), host="127.0.0.1", port=args.port)
+        return
+
+    server, base_url = start_server(state)
+    try:
+        asyncio.run(check(base_url, state))
+    except AssertionError as exc:
+        print(f"FAIL {exc}")
+        sys.exit(1)
+    finally:
+        server.should_exit = True
+
+if __name__ == "__main__":
+    main()
@@ -1,5 +1,5 @@
 import { useState, useEffect, useCallback, useRef } from "react";
-import { apiFetch } from "./api";
+import { apiFetch, apiFetchPage } from "./api";
 import { saveSessionId, getSessionId } from "./auth";
 
 /**
@@ -11,13 +11,26 @@ import { saveSessionId, getSessionId } from "./auth";
  *   const apiFetch = async (url, options={}) => {...}
  */
 
+function normalizeMessages(history) {
+  const items = Array.isArray(history) ? history : history?.messages || [];
+  return items.map((m) => ({
+    role: m.role ?? m.sender ?? m.type ?? "unknown",
+    content: m.content ?? m.message ?? m.text ?? "",
+  }));
+}
+
 export default function Chat({ onLogout }) {
   const [sessions, setSessions] = useState([]);
   const [sessionId, setSessionId] = useState(() => getSessionId());
   const [log, setLog] = useState([]);
+  // 后端按页返回（默认 50 条）：还有更早的数据时保存游标，否则为 null
+  const [historyCursor, setHistoryCursor] = useState(null);
+  const [sessionsCursor, setSessionsCursor] = useState(null);
 
   const [loadingSessions, setLoadingSessions] = useState(false);
   const [loadingHistory, setLoadingHistory] = useState(false);
+  const [loadingOlder, setLoadingOlder] = useState(false);
+  const [loadingMoreSessions, setLoadingMoreSessions] = useState(false);
   const [sending, setSending] = useState(false);
 
   const [input, setInput] = useState("");
@@ -27,6 +40,8 @@ export default function Chat({ onLogout }) {
   const didInitRef = useRef(false);
   const chatScrollRef = useRef(null);
   const typingTimerRef = useRef(null);
+  // 往前加载历史时记住离底部的距离，避免跳到最底下
+  const prependAnchorRef = useRef(null);
 
   // 防止旧请求覆盖新状态
   const historyReqSeq = useRef(0);
@@ -37,17 +52,24 @@ export default function Chat({ onLogout }) {
     localStorage.removeItem("access_token");
     localStorage.removeItem("session_id");
     setSessions([]);
+    setSessionsCursor(null);
     setSessionId("");
     setLog([]);
+    setHistoryCursor(null);
     setInput("");
     setErrorText("");
     onLogout?.();
   }, [onLogout]);
 
   useEffect(() => {
-    if (chatScrollRef.current) {
-      chatScrollRef.current.scrollTop = chatScrollRef.current.scrollHeight;
+    const el = chatScrollRef.current;
+    if (!el) return;
+    if (prependAnchorRef.current !== null) {
+      el.scrollTop = el.scrollHeight - prependAnchorRef.current;
+      prependAnchorRef.current = null;
+      return;
     }
+    el.scrollTop = el.scrollHeight;
   }, [log]);
 
   useEffect(() => {
@@ -63,11 +85,14 @@ export default function Chat({ onLogout }) {
     async (sid) => {
       if (!sid) {
         setLog([]);
+        setHistoryCursor(null);
         return;
       }
 
       const seq = ++historyReqSeq.current;
       setLoadingHistory(true);
+      setLoadingOlder(false);
+      setHistoryCursor(null);
       setErrorText("");
 
       try {
@@ -76,16 +101,8 @@ export default function Chat({ onLogout }) {
 
         if (seq !== historyReqSeq.current) return;
 
-        const items = Array.isArray(history)
-          ? history
-          : history?.messages || [];
-
-        const normalized = items.map((m) => ({
-          role: m.role ?? m.sender ?? m.type ?? "unknown",
-          content: m.content ?? m.message ?? m.text ?? "",
-        }));
-
-        setLog(normalized);
+        setLog(normalizeMessages(history));
+        setHistoryCursor(history?.has_more ? history.before_cursor : null);
       } catch (err) {
         if (seq !== historyReqSeq.current) return;
 
@@ -112,20 +129,54 @@ export default function Chat({ onLogout }) {
     [handleLogout]
   );
 
+  const loadOlderHistory = useCallback(async () => {
+    if (!sessionId || !historyCursor || loadingOlder) return;
+
+    // 不自增：切换会话（loadHistory 自增）后丢弃这次结果
+    const seq = historyReqSeq.current;
+    setLoadingOlder(true);
+    setErrorText("");
+
+    try {
+      const history = await apiFetch(
+        `/api/sessions/${sessionId}/messages?before=${encodeURIComponent(historyCursor)}`
+      );
+      if (seq !== historyReqSeq.current) return;
+
+      const el = chatScrollRef.current;
+      if (el) prependAnchorRef.current = el.scrollHeight - el.scrollTop;
+      setLog((prev) => [...normalizeMessages(history), ...prev]);
+      setHistoryCursor(history?.has_more ? history.before_cursor : null);
+    } catch (err) {
+      if (seq !== historyReqSeq.current) return;
+      console.error("loadOlderHistory failed:", err);
+      if (err?.status === 401) {
+        handleLogout();
+        return;
+      }
+      setErrorText(err?.message || "Failed to load earlier messages.");
+    } finally {
+      if (seq === historyReqSeq.current) setLoadingOlder(false);
+    }
+  }, [handleLogout, historyCursor, loadingOlder, sessionId]);
+
   const loadSessions = useCallback(async () => {
     const seq = ++sessionsReqSeq.current;
     setLoadingSessions(true);
+    setLoadingMoreSessions(false);
     setErrorText("");
 
     try {
-      const list = await apiFetch("/api/chat/sessions");
+      const page = await apiFetchPage("/api/chat/sessions");
       if (seq !== sessionsReqSeq.current) return;
 
-      const safeList = Array.isArray(list) ? list : [];
+      const safeList = Array.isArray(page.data) ? page.data : [];
       setSessions(safeList);
+      setSessionsCursor(page.hasMore ? page.beforeCursor : null);
 
       let nextSessionId = getSessionId();
-      if (nextSessionId && !safeList.some((s) => s.id === nextSessionId)) {
+      // 只有第一页：更早的会话可能在后面的页里，失效时 loadHistory 会按 404 清掉
+      if (nextSessionId && !page.hasMore && !safeList.some((s) => s.id === nextSessionId)) {
         nextSessionId = "";
         saveSessionId("");
       }
@@ -160,6 +211,38 @@ export default function Chat({ onLogout }) {
     }
   }, [handleLogout, loadHistory, sessionId]);
 
+  const loadMoreSessions = useCallback(async () => {
+    if (!sessionsCursor || loadingMoreSessions) return;
+
+    const seq = sessionsReqSeq.current;
+    setLoadingMoreSessions(true);
+    setErrorText("");
+
+    try {
+      const page = await apiFetchPage(
+        `/api/chat/sessions?before=${encodeURIComponent(sessionsCursor)}`
+      );
+      if (seq !== sessionsReqSeq.current) return;
+
+      const more = Array.isArray(page.data) ? page.data : [];
+      setSessions((prev) => [
+        ...prev,
+        ...more.filter((s) => !prev.some((p) => p.id === s.id)),
+      ]);
+      setSessionsCursor(page.hasMore ? page.beforeCursor : null);
+    } catch (err) {
+      if (seq !== sessionsReqSeq.current) return;
+      console.error("loadMoreSessions failed:", err);
+      if (err?.status === 401) {
+        handleLogout();
+        return;
+      }
+      setErrorText(err?.message || "Failed to load more sessions.");
+    } finally {
+      if (seq === sessionsReqSeq.current) setLoadingMoreSessions(false);
+    }
+  }, [handleLogout, loadingMoreSessions, sessionsCursor]);
+
   useEffect(() => {
     if (didInitRef.current) return;
     didInitRef.current = true;
@@ -204,6 +287,7 @@ export default function Chat({ onLogout }) {
       setSessionId(newId);
       saveSessionId(newId);
       setLog([]);
+      setHistoryCursor(null);
       setInput("");
     } catch (err) {
       console.error("create session failed:", err);
@@ -711,6 +795,16 @@ export default function Chat({ onLogout }) {
                 </button>
               ))
             )}
+            {!loadingSessions && sessionsCursor ? (
+              <button
+                type="button"
+                className="ghost-btn"
+                onClick={loadMoreSessions}
+                disabled={loadingMoreSessions}
+              >
+                {loadingMoreSessions ? "Loading..." : "Load more"}
+              </button>
+            ) : null}
           </div>
 
           <button className="ghost-btn" onClick={handleLogout}>
@@ -747,6 +841,17 @@ export default function Chat({ onLogout }) {
             <div className="chat-scroll" ref={chatScrollRef}>
               {loadingHistory ? <div>Loading history...</div> : null}
 
+              {!loadingHistory && historyCursor ? (
+                <button
+                  type="button"
+                  className="ghost-btn"
+                  onClick={loadOlderHistory}
+                  disabled={loadingOlder}
+                >
+                  {loadingOlder ? "Loading..." : "Load earlier messages"}
+                </button>
+              ) : null}
+
               {!loadingHistory && !sessionId ? (
                 <div className="empty-state">
                   No session selected. Create a new chat or pick one from the
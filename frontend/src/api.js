@@ -1,4 +1,4 @@
-export async function apiFetch(path, { method = "GET", body } = {}) {
+async function request(path, { method = "GET", body } = {}) {
   const token = localStorage.getItem("access_token");
   const headers = { "Content-Type": "application/json" };
   if (token) headers.Authorization = `Bearer ${token}`;
@@ -18,5 +18,20 @@ export async function apiFetch(path, { method = "GET", body } = {}) {
     throw err;
   }
 
+  return { data, headers: resp.headers };
+}
+
+export async function apiFetch(path, options) {
+  const { data } = await request(path, options);
   return data;
 }
+
+// 列表接口的分页游标在响应头里（X-Before-Cursor / X-Has-More）
+export async function apiFetchPage(path, options) {
+  const { data, headers } = await request(path, options);
+  return {
+    data,
+    beforeCursor: headers.get("X-Before-Cursor"),
+    hasMore: headers.get("X-Has-More") === "true",
+  };
+}